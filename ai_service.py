@@ -1,14 +1,20 @@
 import os
+import math
+import queue
+import shutil
 import subprocess
 import tempfile
-import glob
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from openai import OpenAI
 from dotenv import load_dotenv
 import json
 import logging
 from datetime import datetime, date
 
+import hls
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -29,15 +35,86 @@ TRANSCRIBE_MODEL = "gpt-4o-mini-transcribe"
 # both paths now share the value chat has been using in production.
 TRANSCRIPT_CONTEXT_CHARS = 80000
 
-# Audio is split into fixed-length chunks before transcription, so each chunk's index is
-# its start time — timestamps for free, from work already being done.
+# Audio is cut into chunks for transcription, and ffmpeg's segment list gives each chunk's
+# start time — timestamps for free, from work already being done.
 #
 # The transcription models that replaced whisper-1 dropped `timestamp_granularities`
 # entirely, and whisper-1 costs twice as much with a higher word error rate. Since these
 # are Korean/English lectures where transcript quality is the corpus, the chunk length is
-# what buys precision instead: 120s gives ±2 minutes, enough to jump to the right part of
-# a lecture, at no extra cost — billing is per minute of audio, not per request.
+# what buys precision instead: a passage's timestamp is its chunk's start, so chunk length
+# is the seek error. This is the length when none is planned (see below); planned chunks
+# stay within ADAPTIVE_CHUNK_MAX_SECONDS, plus the snap to a pause.
 TRANSCRIBE_CHUNK_SECONDS = 120
+# A trailing chunk shorter than this is dropped rather than sent.
+MIN_CHUNK_SECONDS = 0.5
+
+# Dead air — before class starts, during exercises, after the recording should have been
+# stopped — was uploaded and billed like speech. ffmpeg's silencedetect runs in the same
+# extraction pass, and a chunk with less than SILENCE_MIN_SPEECH_SECONDS outside detected
+# silence is skipped. Whole chunks only: trimming inside one would shift every timestamp
+# after the cut, and partially silent chunks cost little next to fully silent ones.
+TRANSCRIBE_SKIP_SILENCE = os.getenv("TRANSCRIBE_SKIP_SILENCE", "true").lower() in ("1", "true", "yes", "on")
+SILENCE_NOISE_DB = float(os.getenv("TRANSCRIBE_SILENCE_NOISE_DB", "-35"))
+SILENCE_DETECT_SECONDS = 1.0
+SILENCE_MIN_SPEECH_SECONDS = 1.5
+
+# Chunks transcribed at once per lecture. Each request is a round trip of several seconds
+# spent mostly waiting on the API, so a lecture's wall time was the sum of every chunk's
+# latency; in parallel it approaches the slowest few. Keep it modest: it multiplies with
+# WORKER_INTERACTIVE_CONCURRENCY against the account's rate limit.
+TRANSCRIBE_CONCURRENCY = max(1, int(os.getenv("TRANSCRIBE_CONCURRENCY", "4")))
+
+# Chunk length planned from the lecture's duration instead of always TRANSCRIBE_CHUNK_SECONDS.
+# Each request carries a fixed overhead, so a three-hour recording in 120 s pieces spent
+# much of its time on ninety round trips, while a five-minute clip made three chunks and
+# left a parallel slot idle. The planner splits the lecture into the fewest full rounds of
+# `concurrency` chunks that keep each chunk within [MIN, MAX]: a half-empty last round
+# costs a whole request's latency. Passage timestamps mark chunk starts, so the upper
+# bound is what keeps them close enough to seek by: with the snap to a pause, no passage
+# runs past three minutes. Longer lectures get more rounds rather than longer chunks.
+TRANSCRIBE_ADAPTIVE_CHUNKS = os.getenv("TRANSCRIBE_ADAPTIVE_CHUNKS", "true").lower() in ("1", "true", "yes", "on")
+ADAPTIVE_CHUNK_MIN_SECONDS = 60
+ADAPTIVE_CHUNK_MAX_SECONDS = 150
+# Chunks longer than a slice are assembled from CHUNK_SLICE_SECONDS pieces, so each cut can
+# move by up to CHUNK_SNAP_FRACTION of the chunk length to the slice boundary inside (or
+# nearest to) a detected silence, instead of landing mid-sentence.
+CHUNK_SLICE_SECONDS = 5
+CHUNK_SNAP_FRACTION = 0.2
+
+# How chunks are encoded for upload. Speech recognition resamples to 16 kHz mono anyway, so
+# anything above that is upload time and temp disk spent on audio the model never hears.
+# Profiles are encoded in the extraction pass itself. Per 120 s chunk of the sample lecture:
+# "legacy" (the old 32 kbps at source rate) 480 KB, "mp3" 360 KB, "opus" (VBR, so speech
+# pauses cost almost nothing) under 100 KB.
+AUDIO_PROFILES = {
+    "mp3": ("mp3", ["-acodec", "libmp3lame", "-ar", "16000", "-b:a", "24k"]),
+    "opus": ("ogg", ["-acodec", "libopus", "-ar", "16000", "-b:a", "16k", "-application", "voip"]),
+    "legacy": ("mp3", ["-acodec", "libmp3lame", "-b:a", "32k"]),
+}
+TRANSCRIBE_AUDIO_PROFILE = os.getenv("TRANSCRIBE_AUDIO_PROFILE", "mp3")
+if TRANSCRIBE_AUDIO_PROFILE not in AUDIO_PROFILES:
+    raise ValueError(f"TRANSCRIBE_AUDIO_PROFILE must be one of {', '.join(AUDIO_PROFILES)}")
+
+# Opt-in speed-up before chunking. Billing is per minute of audio sent, and lecture speech
+# is slow enough that a modest atempo (pitch preserved) costs little accuracy; measure with
+# scripts/eval_transcribe_tempo.py before raising it. Passage timestamps stay in lecture
+# time. 1.0 is off; ffmpeg's atempo handles up to 2.0 in a single pass.
+TRANSCRIBE_TEMPO = float(os.getenv("TRANSCRIBE_TEMPO", "1.0"))
+if not 1.0 <= TRANSCRIBE_TEMPO <= 2.0:
+    raise ValueError("TRANSCRIBE_TEMPO must be between 1.0 and 2.0")
+
+# Where chunks are transcribed. "openai" sends them to TRANSCRIBE_MODEL; "local" runs
+# faster-whisper (CTranslate2, int8 on the CPU, no GPU needed) inside the worker. Local
+# costs nothing per minute and has no API latency or daily cap, but one lecture takes
+# roughly its own length on a small droplet, so the worker routes only some jobs to it
+# (TRANSCRIBE_LOCAL_ROUTES). faster-whisper is optional: requirements-local-stt.txt.
+TRANSCRIBE_BACKENDS = ("openai", "local")
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "openai")
+if TRANSCRIBE_BACKEND not in TRANSCRIBE_BACKENDS:
+    raise ValueError(f"TRANSCRIBE_BACKEND must be one of {', '.join(TRANSCRIBE_BACKENDS)}")
+LOCAL_TRANSCRIBE_MODEL = os.getenv("LOCAL_TRANSCRIBE_MODEL", "small")
+LOCAL_TRANSCRIBE_THREADS = max(0, int(os.getenv("LOCAL_TRANSCRIBE_THREADS", "0")))  # 0: every core
+LOCAL_TRANSCRIBE_LANGUAGE = os.getenv("LOCAL_TRANSCRIBE_LANGUAGE", "") or None      # None: per chunk
 
 # Text model for every chat/summary/flashcard call.
 #
@@ -70,6 +147,95 @@ def _format_timestamp(seconds: int) -> str:
     return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
 
 
+def _parse_silences(text: str, offset: float = 0.0) -> list[tuple[float, float | None]]:
+    """
+    Silence intervals from silencedetect's metadata, as printed by `ametadata=mode=print`.
+    An interval still open (silence_start with no end yet) has end None.
+    """
+    silences: list[tuple[float, float | None]] = []
+    for line in text.splitlines():
+        if line.startswith("lavfi.silence_start="):
+            silences.append((offset + float(line.split("=", 1)[1]), None))
+        elif line.startswith("lavfi.silence_end=") and silences and silences[-1][1] is None:
+            silences[-1] = (silences[-1][0], offset + float(line.split("=", 1)[1]))
+    return silences
+
+
+def _speech_seconds(silences: list[tuple[float, float | None]], start: float, end: float) -> float:
+    """Seconds of [start, end] not covered by any silence interval."""
+    silent = 0.0
+    for s_start, s_end in silences:
+        s_end = end if s_end is None else s_end
+        silent += max(0.0, min(end, s_end) - max(start, s_start))
+    return max(0.0, (end - start) - silent)
+
+
+def plan_chunk_seconds(duration_s: float | None, concurrency: int) -> int:
+    """Chunk length for a lecture of `duration_s` transcribed `concurrency` chunks at a
+    time. TRANSCRIBE_CHUNK_SECONDS when the duration is unknown or planning is off."""
+    if not TRANSCRIBE_ADAPTIVE_CHUNKS or not duration_s:
+        return TRANSCRIBE_CHUNK_SECONDS
+    slots = max(1, concurrency)
+    rounds = math.ceil(duration_s / (slots * ADAPTIVE_CHUNK_MAX_SECONDS))
+    planned = math.ceil(duration_s / (slots * rounds) / CHUNK_SLICE_SECONDS) * CHUNK_SLICE_SECONDS
+    return int(max(ADAPTIVE_CHUNK_MIN_SECONDS, min(ADAPTIVE_CHUNK_MAX_SECONDS, planned)))
+
+
+def _distance_to_silence(t: float, silences: list[tuple[float, float | None]]) -> float:
+    distance = math.inf
+    for s_start, s_end in silences:
+        s_end = math.inf if s_end is None else s_end
+        if s_start <= t <= s_end:
+            return 0.0
+        distance = min(distance, abs(t - s_start), abs(t - s_end))
+    return distance
+
+
+def _choose_cut(chunk_start: float, slice_ends: list[float], target: float,
+                silences: list[tuple[float, float | None]], total: float | None = None,
+                final: bool = False) -> int | None:
+    """
+    How many of the pending slices (ending at `slice_ends`) make up the chunk starting at
+    `chunk_start`, or None to wait for more. `final` means no more slices are coming.
+
+    The cut goes at the slice end within CHUNK_SNAP_FRACTION of `target` that is inside,
+    or else nearest to, a silence; ties go to the end nearest `target`. When what is left
+    of the lecture fits in one chunk, it is taken whole rather than leaving a sliver.
+    """
+    if not slice_ends:
+        return None
+    snap = target * CHUNK_SNAP_FRACTION
+    aim = chunk_start + target
+    if total and total - chunk_start <= target + snap:
+        return len(slice_ends) if final else None
+    if slice_ends[-1] < aim + snap:
+        return len(slice_ends) if final else None
+    candidates = [i for i, end in enumerate(slice_ends) if aim - snap <= end <= aim + snap]
+    if not candidates:
+        candidates = [min(range(len(slice_ends)), key=lambda i: abs(slice_ends[i] - aim))]
+    best = min(candidates, key=lambda i: (_distance_to_silence(slice_ends[i], silences), abs(slice_ends[i] - aim)))
+    return best + 1
+
+
+def _join_slices(paths: list[str], out_path: str):
+    """Concatenate encoded slices into one chunk file without re-encoding."""
+    if len(paths) == 1:
+        os.replace(paths[0], out_path)
+        return
+    list_path = out_path + ".txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.writelines(f"file '{path}'\n" for path in paths)
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", out_path],
+        capture_output=True, text=True,
+    )
+    os.remove(list_path)
+    for path in paths:
+        os.remove(path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg concat failed: {result.stderr[:500]}")
+
+
 def _extract_usage(response) -> dict:
     """Extract token usage from an OpenAI response."""
     if hasattr(response, 'usage') and response.usage:
@@ -102,6 +268,47 @@ def _due_label(days):
         return "내일"
     return f"D-{days}"
 
+class LocalTranscriber:
+    """
+    faster-whisper on the CPU, loaded once per process and shared by every job in it.
+
+    The model uses all of LOCAL_TRANSCRIBE_THREADS for one chunk, so chunks run one at a
+    time across the whole worker; running two would only make both slower.
+    """
+    _shared: "LocalTranscriber | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model_size: str = LOCAL_TRANSCRIBE_MODEL, threads: int = LOCAL_TRANSCRIBE_THREADS):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as e:
+            raise RuntimeError(
+                "TRANSCRIBE_BACKEND=local needs faster-whisper: pip install -r requirements-local-stt.txt"
+            ) from e
+        self.model = f"faster-whisper-{model_size}-int8"
+        self._whisper = WhisperModel(model_size, device="cpu", compute_type="int8", cpu_threads=threads)
+        self._run_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "LocalTranscriber":
+        with cls._shared_lock:
+            if cls._shared is None:
+                t0 = time.perf_counter()
+                cls._shared = cls()
+                logger.info(f"Loaded {cls._shared.model} in {time.perf_counter() - t0:.1f}s")
+            return cls._shared
+
+    def transcribe(self, chunk_path: str) -> str:
+        with self._run_lock:
+            segments, _info = self._whisper.transcribe(chunk_path, language=LOCAL_TRANSCRIBE_LANGUAGE)
+            return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+class TranscriptionInterrupted(RuntimeError):
+    """transcribe_vod stopped early on request; finished chunks were reported through
+    `on_chunk`, so the caller can resume from them."""
+
+
 class AIService:
     def __init__(self):
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -239,7 +446,14 @@ Rules:
         }
 
     def _probe_duration_seconds(self, input_url: str) -> float | None:
-        """Try to fetch media duration via ffprobe. Returns None when unavailable."""
+        """
+        Media duration in seconds, or None when unavailable. Read from the HLS playlist's
+        segment list when there is one; ffprobe, which opens the stream itself, is only the
+        fallback for other inputs.
+        """
+        playlist = hls.try_load_playlist(input_url)
+        if playlist and playlist.ended:
+            return playlist.duration
         try:
             result = subprocess.run(
                 [
@@ -263,144 +477,433 @@ Rules:
         except Exception:
             return None
 
-    def _extract_audio_with_progress(self, input_url: str, output_mp3_path: str, emit):
-        duration_seconds = self._probe_duration_seconds(input_url)
-        last_pct = -1
-
+    def _extract_chunks(self, input_url: str, chunk_dir: str, duration_seconds: float | None,
+                        chunks: "queue.Queue", state: dict, stop: threading.Event,
+                        chunk_seconds: float = TRANSCRIBE_CHUNK_SECONDS, first_index: int = 0,
+                        segments: "hls.SegmentCache | None" = None, tempo: float = 1.0,
+                        offset: float | None = None):
+        """
+        One ffmpeg pass from the stream straight to mono chunks of about `chunk_seconds`,
+        encoded with TRANSCRIBE_AUDIO_PROFILE, run on a background thread by transcribe_vod.
+
+        The segment muxer appends a line to its CSV list only once a segment is closed, so
+        tailing that list yields pieces that are complete on disk, with exact start and end
+        times. Chunks up to CHUNK_SLICE_SECONDS long are those pieces as they are; longer ones
+        are joined from slices, cut where _choose_cut finds a silence. Each chunk is put on
+        `chunks` as (index, path, start_s, end_s, speech_s) while ffmpeg carries on with the
+        rest; then None, or the exception that stopped extraction. Extraction progress goes
+        into `state['extract_pct']` rather than a callback, so every progress write stays on
+        the caller's thread.
+
+        With `first_index`, extraction starts at `offset` (by default that many chunks in),
+        for a resumed job; indexes and times are still relative to the start of the lecture.
+
+        With `segments`, ffmpeg does not fetch the stream itself: the segments are downloaded
+        in parallel into the cache and written to ffmpeg's stdin in order as each completes.
+        A resumed job feeds from the segment holding its offset and trims up to the offset
+        in the filter graph.
+
+        With `tempo` above 1, audio is sped up (atempo keeps the pitch) after silence
+        detection and before encoding. Chunks still cover `chunk_seconds` of the lecture
+        each, and their times are scaled back to lecture time before being reported.
+        """
+        list_path = os.path.join(chunk_dir, "chunks.csv")
+        silence_path = os.path.join(chunk_dir, "silence.txt")
+        offset = float(first_index * chunk_seconds if offset is None else offset)
+        extension, encoder_args = AUDIO_PROFILES[TRANSCRIBE_AUDIO_PROFILE]
+        sliced = chunk_seconds > CHUNK_SLICE_SECONDS
+        piece_seconds = CHUNK_SLICE_SECONDS if sliced else chunk_seconds
+        filters = []
+        if segments is not None:
+            first_segment = segments.segment_for(offset)
+            trim = offset - segments.playlist.segments[first_segment].start
+            source = ["-i", "pipe:0"]
+            if trim:
+                # Trimmed in the filter graph, so silence times start at `offset` too.
+                filters += ["asetpts=PTS-STARTPTS", f"atrim=start={trim:.3f}", "asetpts=PTS-STARTPTS"]
+        else:
+            source = [*(["-ss", str(offset)] if offset else []), "-i", input_url]
+        if TRANSCRIBE_SKIP_SILENCE:
+            # Before atempo, so silences are measured in lecture time.
+            filters += [
+                f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_DETECT_SECONDS}",
+                f"ametadata=mode=print:file={silence_path}",
+            ]
+        if tempo != 1.0:
+            filters.append(f"atempo={tempo}")
+        audio_filter = ["-af", ",".join(filters)] if filters else []
         cmd = [
             "ffmpeg", "-v", "error", "-y",
-            "-i", input_url,
+            *source,
             "-vn",
-            "-acodec", "libmp3lame",
+            *audio_filter,
             "-ac", "1",
-            "-ab", "32k",
+            *encoder_args,
+            "-f", "segment",
+            "-segment_time", f"{piece_seconds / tempo:.6f}",
+            "-segment_start_number", str(0 if sliced else first_index),
+            "-reset_timestamps", "1",
+            "-segment_list", list_path,
+            "-segment_list_type", "csv",
             "-progress", "pipe:1",
             "-nostats",
-            output_mp3_path,
+            os.path.join(chunk_dir, f"{'slice_%05d' if sliced else 'chunk_%04d'}.{extension}"),
         ]
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-        )
+        listed = 0
+        next_index = first_index
+        pending = []   # closed slices not yet in a chunk: (path, start_s, end_s)
+        last_end = offset
+
+        def _emit_closed_chunks(final: bool = False):
+            nonlocal listed, next_index, last_end
+            try:
+                with open(list_path, encoding="utf-8") as f:
+                    lines = f.read().split("\n")[:-1]  # a line without its newline is still being written
+            except FileNotFoundError:
+                return
+            silences = []
+            if TRANSCRIBE_SKIP_SILENCE and (lines[listed:] or pending):
+                try:
+                    with open(silence_path, encoding="utf-8") as f:
+                        silences = _parse_silences(f.read(), offset)
+                except FileNotFoundError:
+                    pass
+            for line in lines[listed:]:
+                name, start, end = line.rsplit(",", 2)
+                pending.append((os.path.join(chunk_dir, name), offset + float(start) * tempo, offset + float(end) * tempo))
+                listed += 1
+            while pending:
+                if sliced:
+                    take = _choose_cut(pending[0][1], [end for _p, _s, end in pending], chunk_seconds,
+                                       silences, duration_seconds, final)
+                    if take is None:
+                        return
+                else:
+                    take = 1
+                group, pending[:take] = pending[:take], []
+                start_s, end_s = group[0][1], group[-1][2]
+                path = group[0][0]
+                if sliced:
+                    path = os.path.join(chunk_dir, f"chunk_{next_index:04d}.{extension}")
+                    _join_slices([p for p, _s, _e in group], path)
+                # By the time the muxer closes a piece the filter has seen all of it, so a
+                # silence still open at this point runs to the chunk's end.
+                speech_s = _speech_seconds(silences, start_s, end_s) if TRANSCRIBE_SKIP_SILENCE else end_s - start_s
+                chunks.put((next_index, path, start_s, end_s, speech_s))
+                next_index += 1
+                last_end = end_s
+
+        feed_error = []
+
+        def _feed(stdin):
+            try:
+                for path in segments.files(first_segment):
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, stdin, 256 * 1024)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg exited (or was killed) first; its exit status says why
+            except Exception as e:
+                feed_error.append(e)
+            finally:
+                try:
+                    stdin.close()
+                except OSError:
+                    pass
+
+        feeder = None
         try:
-            if proc.stdout:
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE if segments is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+            )
+            if segments is not None:
+                segments.start(first_segment)
+                feeder = threading.Thread(target=_feed, args=(proc.stdin.buffer,), name="hls-feed", daemon=True)
+                feeder.start()
+            try:
                 for line in proc.stdout:
+                    if stop.is_set():
+                        proc.kill()
+                        break
                     line = line.strip()
                     if line.startswith("out_time_ms=") and duration_seconds:
                         try:
-                            out_ms = int(line.split("=", 1)[1])
-                            elapsed = out_ms / 1_000_000.0
-                            pct = max(0, min(100, int((elapsed / duration_seconds) * 100)))
-                            if pct != last_pct:
-                                emit("extracting_audio", pct)
-                                last_pct = pct
-                        except Exception:
+                            elapsed = offset + int(line.split("=", 1)[1]) / 1_000_000.0 * tempo
+                            state['extract_pct'] = max(0, min(100, int((elapsed / duration_seconds) * 100)))
+                        except ValueError:
                             pass
-                    elif line == "progress=end":
-                        emit("extracting_audio", 100)
-            ret = proc.wait(timeout=900)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            raise RuntimeError("ffmpeg audio extraction timed out")
-
-        stderr_text = ""
-        if proc.stderr:
-            stderr_text = proc.stderr.read()[:500]
-        if ret != 0:
-            raise RuntimeError(f"ffmpeg failed: {stderr_text}")
-        return duration_seconds
-
-    def _split_audio_chunks(self, audio_path: str, chunk_dir: str, segment_seconds: int = TRANSCRIBE_CHUNK_SECONDS) -> list[str]:
-        pattern = os.path.join(chunk_dir, "chunk_%03d.mp3")
-        result = subprocess.run(
-            [
-                "ffmpeg", "-v", "error", "-y",
-                "-i", audio_path,
-                "-f", "segment",
-                "-segment_time", str(segment_seconds),
-                "-c:a", "libmp3lame",
-                "-b:a", "32k",
-                pattern,
-            ],
-            capture_output=True,
-            timeout=600,
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f"ffmpeg chunk split failed: {result.stderr.decode(errors='ignore')[:500]}")
-        chunks = sorted(glob.glob(os.path.join(chunk_dir, "chunk_*.mp3")))
-        return chunks
-
-    def transcribe_vod(self, m3u8_url: str, on_stage=None, on_progress=None) -> tuple[str, dict]:
+                    elif line.startswith("progress="):
+                        # End of one progress report, roughly every half second.
+                        _emit_closed_chunks()
+                ret = proc.wait(timeout=900)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                raise RuntimeError("ffmpeg audio extraction timed out")
+            if stop.is_set():
+                return
+            if feeder is not None:
+                feeder.join()
+            if feed_error:
+                raise RuntimeError(f"HLS segment download failed: {feed_error[0]}")
+            if ret != 0:
+                stderr_text = proc.stderr.read()[:500] if proc.stderr else ""
+                raise RuntimeError(f"ffmpeg failed: {stderr_text}")
+            _emit_closed_chunks(final=True)
+            state['extract_pct'] = 100
+            state['total_s'] = last_end
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            if segments is not None:
+                segments.stop()
+
+    def transcribe_vod(self, m3u8_url: str, on_stage=None, on_progress=None,
+                       concurrency: int | None = None, done_chunks: dict | None = None,
+                       on_chunk=None, should_stop=None, duration_s: float | None = None,
+                       segments: "hls.SegmentCache | None" = None,
+                       tempo: float | None = None, backend: str | None = None,
+                       chunk_seconds: float | None = None) -> tuple[str, dict]:
         """
-        Downloads audio from an HLS stream via ffmpeg and transcribes it.
-        Returns the transcript text, or raises on failure.
+        Transcribes an HLS stream, chunk by chunk, while ffmpeg is still extracting it.
+        Returns the transcript text and usage, or raises on failure.
+
+        Extraction used to finish (one full MP3, then a second pass to split it) before the
+        first chunk was sent, leaving the API idle for the whole download. Now each chunk
+        is transcribed as soon as ffmpeg closes it, so the two overlap and the first passage
+        lands about one chunk after the start. Up to `concurrency` chunks (default
+        TRANSCRIBE_CONCURRENCY) are in flight at once. Callbacks run on the calling thread.
+
+        Checkpointing, for callers that persist progress: `on_chunk(index, start_s, end_s,
+        text)` is called as each chunk completes, and `done_chunks` ({index: (start_s,
+        end_s, text)}) hands those back on a retry. Extraction then starts at the first
+        missing chunk and nothing already transcribed is sent again. When `should_stop()`
+        turns true, no new chunk is sent; those in flight are finished (and reported
+        through `on_chunk`) and TranscriptionInterrupted is raised.
+
+        `duration_s` is the media length if the caller already has it (from the playlist);
+        otherwise it is probed here. `segments`, a SegmentCache over the same playlist, has
+        the segments downloaded in parallel and fed to ffmpeg instead of ffmpeg fetching them.
+        `tempo` (default TRANSCRIBE_TEMPO) speeds the audio up before it is chunked, cutting
+        billed minutes; timestamps are reported in lecture time regardless.
+
+        `backend` (default TRANSCRIBE_BACKEND) is "openai" or "local"; the usage returned
+        names the model that actually produced the text.
+
+        `chunk_seconds` defaults to plan_chunk_seconds for the duration and concurrency. A
+        caller that checkpoints should plan it itself and pass it, since `done_chunks` are
+        only valid for the length they were cut at.
         """
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-            tmp_path = tmp.name
-
+        done_chunks = done_chunks or {}
+        first_missing = next(i for i in range(len(done_chunks) + 1) if i not in done_chunks)
+        backend = backend or TRANSCRIBE_BACKEND
+        if backend not in TRANSCRIBE_BACKENDS:
+            raise ValueError(f"unknown transcription backend {backend!r}")
+        if backend == "local":
+            # Loaded before ffmpeg starts, so a missing package fails the job up front.
+            local = LocalTranscriber.shared()
+            model = local.model
+            concurrency = 1
+        else:
+            local = None
+            model = TRANSCRIBE_MODEL
+            concurrency = max(1, concurrency or TRANSCRIBE_CONCURRENCY)
+        tempo = tempo or TRANSCRIBE_TEMPO
         last_stage = None
 
         def emit(stage: str, pct: int | None = None, message: str | None = None):
             nonlocal last_stage
-            if on_stage and stage != last_stage:
-                on_stage(stage)
+            if stage != last_stage:
+                if on_stage:
+                    on_stage(stage)
                 last_stage = stage
             if on_progress:
                 on_progress(stage, pct, message)
 
-        try:
-            safe_source = (m3u8_url or "").split("?", 1)[0]
-            start_t = time.perf_counter()
-            logger.info(f"AI transcribe start source={safe_source}")
-
-            emit("extracting_audio", 0)
-            extract_t0 = time.perf_counter()
-            probed_duration = self._extract_audio_with_progress(m3u8_url, tmp_path, emit)
-            extract_s = time.perf_counter() - extract_t0
-            audio_size_mb = os.path.getsize(tmp_path) / (1024 * 1024)
-            logger.info(
-                f"Audio extraction done in {extract_s:.1f}s "
-                f"(size={audio_size_mb:.2f}MB, probe_duration_s={probed_duration})"
+        safe_source = (m3u8_url or "").split("?", 1)[0]
+        start_t = time.perf_counter()
+        logger.info(
+            f"AI transcribe start source={safe_source} model={model}"
+            + (f" resuming at chunk {first_missing + 1} ({len(done_chunks)} done)" if done_chunks else "")
+        )
+        emit("extracting_audio", 0)
+        duration = duration_s or self._probe_duration_seconds(m3u8_url)
+        chunk_seconds = chunk_seconds or plan_chunk_seconds(duration, concurrency)
+        # Chunk ends move with silences, so a retry restarts where the last contiguous
+        # finished chunk ended rather than at a multiple of the chunk length.
+        offset = done_chunks[first_missing - 1][1] if first_missing else 0.0
+
+        with tempfile.TemporaryDirectory(prefix="transcribe_chunks_") as chunk_dir:
+            chunks: queue.Queue = queue.Queue()
+            state = {'extract_pct': 0}
+            stop = threading.Event()
+            extractor = threading.Thread(
+                target=self._extract_chunks,
+                args=(m3u8_url, chunk_dir, duration, chunks, state, stop, chunk_seconds, first_missing,
+                      segments, tempo, offset),
+                name="ffmpeg-chunks",
+                daemon=True,
             )
-
-            with tempfile.TemporaryDirectory(prefix="transcribe_chunks_") as chunk_dir:
-                chunks = self._split_audio_chunks(tmp_path, chunk_dir)
-                if not chunks:
-                    chunks = [tmp_path]
-                logger.info(f"Audio split into {len(chunks)} chunk(s)")
-
-                texts = []
-                total = len(chunks)
-                for idx, chunk_path in enumerate(chunks, start=1):
-                    emit("transcribing", int(((idx - 1) / total) * 100), f"{idx - 1}/{total}")
-                    chunk_t0 = time.perf_counter()
-                    with open(chunk_path, "rb") as audio_file:
-                        response = self.client.audio.transcriptions.create(
-                            model=TRANSCRIBE_MODEL,
-                            file=audio_file,
-                            response_format="text"
+            extractor.start()
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="transcribe-chunk")
+            inflight = {}   # future -> (idx, start_s, end_s)
+            resumed = {idx: chunk for idx, chunk in done_chunks.items() if idx < first_missing}
+            passages = {idx: (start, text) for idx, (start, _end, text) in resumed.items() if text}
+            completed = len(resumed)
+            done_s = sum(end - start for start, end, _text in resumed.values())
+            audio_s = offset
+            silence_skipped_s = 0.0
+            uploaded_bytes = 0
+            billed_audio_s = 0.0
+            extracted = False
+            stopping = False
+            first_ready = False
+            try:
+                while not extracted or inflight:
+                    if should_stop and not stopping and should_stop():
+                        stopping = True
+                        logger.info(f"Transcribe stop requested; finishing {len(inflight)} chunk(s) in flight")
+                    if stopping and not inflight:
+                        raise TranscriptionInterrupted(f"stopped with {completed} chunk(s) done")
+                    # Feed the pool up to `concurrency`. Chunks beyond that wait on disk.
+                    while not extracted and not stopping and len(inflight) < concurrency:
+                        try:
+                            item = chunks.get(timeout=0.2 if inflight else 1.0)
+                        except queue.Empty:
+                            if not passages and not inflight and last_stage == "extracting_audio":
+                                emit("extracting_audio", state['extract_pct'])
+                            break
+                        if item is None:
+                            extracted = True
+                            break
+                        if isinstance(item, Exception):
+                            raise item
+                        idx, chunk_path, chunk_start, chunk_end, speech_s = item
+                        audio_s = max(audio_s, chunk_end)
+                        if not first_ready:
+                            first_ready = True
+                            logger.info(f"First chunk ready after {time.perf_counter() - start_t:.1f}s")
+                        saved = done_chunks.get(idx)
+                        if saved and abs(saved[0] - chunk_start) < 1.0:
+                            # Transcribed before a retry: a later chunk that finished ahead of
+                            # a missing one, cut at the same place this time.
+                            os.remove(chunk_path)
+                            if saved[2]:
+                                passages[idx] = (saved[0], saved[2])
+                            completed += 1
+                            done_s += saved[1] - saved[0]
+                            continue
+                        if chunk_end - chunk_start < MIN_CHUNK_SECONDS:
+                            # A trailing segment of a few frames.
+                            os.remove(chunk_path)
+                            continue
+                        if speech_s < min(SILENCE_MIN_SPEECH_SECONDS, (chunk_end - chunk_start) / 2):
+                            # Nothing to transcribe. Recorded as done with no text, so a resumed
+                            # job does not reconsider it either.
+                            os.remove(chunk_path)
+                            silence_skipped_s += chunk_end - chunk_start
+                            completed += 1
+                            done_s += chunk_end - chunk_start
+                            logger.info(f"Chunk {idx + 1} [{chunk_start:.0f}s-{chunk_end:.0f}s] silent, skipped")
+                            if on_chunk:
+                                on_chunk(idx, chunk_start, chunk_end, "")
+                            continue
+                        inflight[pool.submit(self._transcribe_chunk, chunk_path, local)] = (idx, chunk_start, chunk_end)
+                        if local is None:
+                            billed_audio_s += (chunk_end - chunk_start) / tempo
+                        if last_stage != "transcribing":
+                            emit("transcribing", self._transcribed_pct(done_s, duration, state),
+                                 f"{completed}/{self._expected_chunks(duration, state, chunk_seconds)}")
+
+                    if not inflight:
+                        continue
+                    finished, _ = wait(
+                        inflight,
+                        timeout=None if extracted or stopping or len(inflight) >= concurrency else 0,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for fut in finished:
+                        idx, chunk_start, chunk_end = inflight.pop(fut)
+                        text, chunk_s, chunk_bytes = fut.result()
+                        uploaded_bytes += chunk_bytes
+                        completed += 1
+                        if on_chunk:
+                            on_chunk(idx, chunk_start, chunk_end, text)
+                        if text:
+                            # The segment list gives each chunk's exact start, so every
+                            # passage carries a timestamp the reader can jump to.
+                            passages[idx] = (chunk_start, text)
+                            if len(passages) == 1:
+                                logger.info(f"First passage after {time.perf_counter() - start_t:.1f}s")
+                        done_s += chunk_end - chunk_start
+                        logger.info(
+                            f"Chunk {idx + 1} [{chunk_start:.0f}s-{chunk_end:.0f}s] transcribed in {chunk_s:.1f}s "
+                            f"(chars={len(text)}, bytes={chunk_bytes}, inflight={len(inflight)}, extract_pct={state['extract_pct']})"
                         )
-                    text = response.strip() if isinstance(response, str) else str(response).strip()
-                    if text:
-                        # Chunk index is its start time, so every passage carries a
-                        # timestamp the reader can jump to.
-                        start = (idx - 1) * TRANSCRIBE_CHUNK_SECONDS
-                        texts.append(f"[{_format_timestamp(start)}] {text}")
-                    chunk_s = time.perf_counter() - chunk_t0
-                    logger.info(f"Chunk {idx}/{total} transcribed in {chunk_s:.1f}s (chars={len(text)})")
-                    emit("transcribing", int((idx / total) * 100), f"{idx}/{total}")
-
-            emit("finalizing", 100)
-            transcript = "\n\n".join(texts).strip()
-            total_s = time.perf_counter() - start_t
-            logger.info(f"AI transcribe complete in {total_s:.1f}s (chars={len(transcript)})")
-            return transcript, {"model": TRANSCRIBE_MODEL, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+                        emit(
+                            "transcribing",
+                            self._transcribed_pct(done_s, duration, state),
+                            f"{completed}/{self._expected_chunks(duration, state, chunk_seconds)}",
+                        )
+            finally:
+                stop.set()
+                # Requests already sent cannot be recalled; the rest are dropped on failure.
+                pool.shutdown(wait=True, cancel_futures=True)
+                extractor.join(timeout=10)
+
+        emit("finalizing", 100)
+        # Chunks finish out of order; the transcript is always in lecture order.
+        transcript = "\n\n".join(
+            f"[{_format_timestamp(int(start))}] {text}" for _, (start, text) in sorted(passages.items())
+        ).strip()
+        total_s = time.perf_counter() - start_t
+        logger.info(
+            f"AI transcribe complete in {total_s:.1f}s (audio_s={audio_s:.0f}, probe_duration_s={duration}, "
+            f"concurrency={concurrency}, chunk_seconds={chunk_seconds}, silence_skipped_s={silence_skipped_s:.0f}, "
+            f"profile={TRANSCRIBE_AUDIO_PROFILE}, uploaded_bytes={uploaded_bytes}, tempo={tempo}, "
+            f"billed_audio_s={billed_audio_s:.0f}, chars={len(transcript)}"
+            + (f", segments_downloaded={segments.downloaded}, segments_reused={segments.reused}" if segments else "")
+            + ")"
+        )
+        return transcript, {
+            "model": model, "backend": backend, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+            "silence_skipped_s": round(silence_skipped_s, 1),
+            "audio_profile": TRANSCRIBE_AUDIO_PROFILE, "uploaded_bytes": uploaded_bytes,
+            "tempo": tempo, "billed_audio_s": round(billed_audio_s, 1), "chunk_seconds": chunk_seconds,
+        }
+
+    def _transcribe_chunk(self, chunk_path: str, local: LocalTranscriber | None = None) -> tuple[str, float, int]:
+        """Transcribe one chunk, with `local` if given, else through the API; returns its
+        text, seconds taken and size in bytes. Runs on a pool thread."""
+        chunk_t0 = time.perf_counter()
+        size = os.path.getsize(chunk_path)
+        if local is not None:
+            text = local.transcribe(chunk_path)
+            os.remove(chunk_path)
+            return text, time.perf_counter() - chunk_t0, 0
+        with open(chunk_path, "rb") as audio_file:
+            response = self.client.audio.transcriptions.create(
+                model=TRANSCRIBE_MODEL,
+                file=audio_file,
+                response_format="text"
+            )
+        os.remove(chunk_path)
+        text = response.strip() if isinstance(response, str) else str(response).strip()
+        return text, time.perf_counter() - chunk_t0, size
+
+    @staticmethod
+    def _expected_chunks(duration: float | None, state: dict, chunk_seconds: float) -> str:
+        total = duration or state.get('total_s')
+        return str(max(1, math.ceil((total - MIN_CHUNK_SECONDS) / chunk_seconds))) if total else "?"
+
+    @staticmethod
+    def _transcribed_pct(transcribed_s: float, duration: float | None, state: dict) -> int | None:
+        """Share of the lecture transcribed so far. Without a probed duration the total is
+        only known once extraction ends, so until then there is no honest percentage."""
+        total = duration or state.get('total_s')
+        if total:
+            return max(0, min(100, int(transcribed_s / total * 100)))
+        return None
 
     def caption_slide(self, image_path: str, lecture_title: str = "", page_no: int = 0) -> tuple[str, dict]:
         """
@@ -470,7 +973,7 @@ Rules:
             logger.warning(f"caption_slide failed for {image_path}: {e}")
             return "", {"model": VISION_MODEL, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-    def chat_about_course_stream(self, corpus: str, course_name: str, messages: list):
+    def chat_about_course_stream(self, corpus: str, course_name: str, messages: list, excerpts: bool = False):
         """
         Answer questions grounded in a whole course, citing where each claim came from.
 
@@ -479,11 +982,19 @@ Rules:
         cache bill it at a tenth of the rate after the first turn. Anything varying (the
         question, the history) must come after it or the cache never hits.
 
+        With `excerpts`, `corpus` holds only the passages retrieved for this question, and
+        the model is told the rest of the course exists but was not included.
+
         Yields ("token", str) then ("usage", dict), matching the VOD chat stream.
         """
+        scope = (
+            "Below are the passages of this course's material that best match the question, in course "
+            "order. Other material exists but was not included."
+            if excerpts else "Everything you know about this course is below."
+        )
         system_prompt = f"""You are a study assistant for the Yonsei course "{course_name}".
 
-Everything you know about this course is below. Each source is introduced by a marker like
+{scope} Each source is introduced by a marker like
 [S3]. Answer only from these sources.
 
 Rules:
@@ -513,8 +1024,8 @@ Pointing at a moment in a lecture video:
 - When the answer comes from something said in a video, write [[vod:S8@12:00]] on its own
   line, using that passage's timestamp. The reader can then play from that point.
 - Use the timestamp of the passage you actually drew on, not the start of the lecture.
-- Timestamps mark the start of a two-minute stretch, so treat them as approximate and
-  never claim a precise second.
+- Timestamps mark the start of a stretch of one to three minutes, so treat them as
+  approximate and never claim a precise second.
 - At most two per answer, same as slides.
 
 === COURSE MATERIAL ===
@@ -1,17 +1,25 @@
+import asyncio
 import os
 from fastapi import FastAPI, HTTPException, Depends, Header, Request, BackgroundTasks
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import APIKeyHeader
 from typing import List, Optional
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from database import init_db, User, Course, Assignment, VOD, Board, Post, VodTranscript, LoginDebugReport, Job, PushToken, NotificationHistory, AIUsageLog, FlashcardDeck, Flashcard, FileResource
+from database import init_db, User, Course, Assignment, VOD, Board, Post, VodTranscript, TranscriptChunk, LoginDebugReport, Job, PushToken, NotificationHistory, AIUsageLog, FlashcardDeck, Flashcard, FileResource
 from moodle_client import MoodleClient
+import eta_model
+import events
+import job_queue
 from slowapi import Limiter
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 import logging
+import threading
+import time
 import uuid
 import json
 from datetime import datetime, timedelta, date
@@ -550,6 +558,9 @@ def brain_chat(
     Citations are resolved server-side rather than trusted from the model: the answer is
     scanned for [S<n>] markers and only markers that match a real assembled source are
     returned, so a hallucinated reference cannot become a tappable link to nowhere.
+
+    In retrieval mode only the passages matching the recent questions are sent, numbered
+    as in the full corpus; if none match, the full corpus is sent after all.
     """
     _require_brain_enabled(user)
 
@@ -559,7 +570,13 @@ def brain_chat(
     _require_course_brain(course)
 
     import course_brain
-    corpus, sources = course_brain.assemble_corpus(db, course)
+    messages = [m.model_dump() if hasattr(m, 'model_dump') else dict(m) for m in req.messages]
+    retrieved = None
+    if (req.mode or BRAIN_CHAT_MODE) == 'retrieval':
+        # The last two questions, so a follow-up like "그건 왜요?" still finds its topic.
+        asked = [str(m.get('content') or '') for m in messages if m.get('role') == 'user'][-2:]
+        retrieved = course_brain.retrieve_corpus(db, course, "\n".join(asked))
+    corpus, sources = retrieved or course_brain.cached_corpus(db, course)
     if not corpus.strip() or not sources:
         raise HTTPException(409, "아직 학습된 자료가 없어요. 먼저 강의 자료를 학습시켜주세요.")
 
@@ -575,13 +592,13 @@ def brain_chat(
     user_id = user.id
     course_name = course.name
     by_ref = {s['ref']: s for s in sources}
-    messages = [m.model_dump() if hasattr(m, 'model_dump') else dict(m) for m in req.messages]
+    excerpts = retrieved is not None
 
     def event_generator():
         answer = []
         try:
             for event_type, event_data in AIService().chat_about_course_stream(
-                corpus, course_name, messages
+                corpus, course_name, messages, excerpts=excerpts
             ):
                 if event_type == "token":
                     answer.append(event_data)
@@ -1011,54 +1028,37 @@ def get_vods(course_id: int, user: User = Depends(get_current_user), db: Session
     return [{"id": v.moodle_id, "title": v.title, "start_date": v.start_date, "end_date": v.end_date, "is_completed": v.is_completed, "url": v.url} for v in vods]
 
 
-def _extract_vod_moodle_id_from_job(job: Job) -> Optional[int]:
-    payload = job.payload
-    if isinstance(payload, dict):
-        return payload.get("vod_moodle_id")
-    if isinstance(payload, str):
-        try:
-            parsed = json.loads(payload)
-            if isinstance(parsed, dict):
-                return parsed.get("vod_moodle_id")
-        except Exception:
-            return None
-    return None
+def _transcribe_slots(db: Session, coefficients: dict) -> int:
+    """
+    Transcriptions the workers can run at once: each live worker's interactive lane, where
+    a live worker is one holding an unexpired lease. With nothing running that count is
+    zero, so at least one worker is assumed.
+    """
+    workers = (
+        db.query(func.count(func.distinct(Job.lease_owner)))
+        .filter(Job.status == "processing", Job.lease_expires_at > datetime.now())
+        .scalar()
+    )
+    return coefficients["slots_per_worker"] * max(1, workers or 0)
 
 
 def _estimate_transcribe_eta_seconds(
+    db: Session,
     vod_duration: Optional[int],
     queue_ahead: int,
     stage: Optional[str],
     progress_pct: Optional[int] = None,
     elapsed_seconds: Optional[int] = None,
 ):
-    # Heuristic baseline for queued jobs; refined below with live progress when available.
-    base = 150 if not vod_duration else max(90, min(1500, int(vod_duration * 0.45)))
-    low = base
-    high = int(base * 1.5)
-
-    if queue_ahead > 0:
-        low += queue_ahead * 60
-        high += queue_ahead * 150
-
-    if stage == "transcribing":
-        low = max(20, int(low * 0.25))
-        high = max(60, int(high * 0.45))
-    elif stage == "finalizing":
-        low = 8
-        high = 35
-
-    # If we have live progress while running, prefer a data-driven ETA.
-    if elapsed_seconds and progress_pct and progress_pct > 4:
-        remaining = int(elapsed_seconds * (100 - progress_pct) / progress_pct)
-        remaining = max(5, min(3600, remaining))
-        low = max(8, int(remaining * 0.75))
-        high = max(low + 15, int(remaining * 1.35))
-        if stage == "finalizing":
-            low = min(low, 20)
-            high = min(high, 60)
-
-    return {"low": low, "high": high}
+    # Fitted from the worker's timing log once it has enough jobs; hand-tuned until then.
+    coefficients = eta_model.load(db)
+    if coefficients:
+        eta = eta_model.estimate(
+            coefficients, vod_duration, queue_ahead, _transcribe_slots(db, coefficients), stage, progress_pct,
+        )
+        if eta:
+            return eta
+    return eta_model.heuristic_eta(vod_duration, queue_ahead, stage, progress_pct, elapsed_seconds)
 
 
 def _build_transcribe_status(db: Session, vod: VOD, row: Optional[VodTranscript]):
@@ -1079,20 +1079,28 @@ def _build_transcribe_status(db: Session, vod: VOD, row: Optional[VodTranscript]
 
     queue_position = None
     queue_ahead = None
-    jobs = (
+    active = ("pending", "processing")
+    job = (
         db.query(Job)
-        .filter(Job.type == "transcribe", Job.status.in_(["pending", "processing"]))
+        .filter(Job.type == "transcribe", Job.vod_moodle_id == vod.moodle_id, Job.status.in_(active))
         .order_by(Job.created_at, Job.id)
-        .all()
+        .first()
     )
 
     vod_job_index = None
-    for idx, job in enumerate(jobs):
-        if _extract_vod_moodle_id_from_job(job) == vod.moodle_id:
-            vod_job_index = idx
-            if job.status == "processing":
-                status = "running"
-            break
+    if job:
+        if job.status == "processing":
+            status = "running"
+        # Active transcriptions that arrived first, off the (type, status, created_at) index.
+        vod_job_index = (
+            db.query(func.count(Job.id))
+            .filter(
+                Job.type == "transcribe",
+                Job.status.in_(active),
+                or_(Job.created_at < job.created_at, and_(Job.created_at == job.created_at, Job.id < job.id)),
+            )
+            .scalar()
+        )
 
     if status in ("queued", "running"):
         if vod_job_index is not None:
@@ -1112,7 +1120,9 @@ def _build_transcribe_status(db: Session, vod: VOD, row: Optional[VodTranscript]
     eta_seconds = None
     if status in ("queued", "running"):
         eta_seconds = _estimate_transcribe_eta_seconds(
-            vod.duration,
+            db,
+            # The playlist's exact length once the worker has read it; the scraped one before.
+            int(row.media_duration_s) if row.media_duration_s else vod.duration,
             queue_ahead or 0,
             stage,
             row.progress_pct,
@@ -1174,6 +1184,244 @@ def get_vod_transcript(vod_moodle_id: int, user: User = Depends(get_current_user
         }
     return {"status": "not_found"}
 
+
+# How often the transcript stream looks for new chunks, how often it re-sends the status
+# (which doubles as a keep-alive), and when it hangs up; EventSource clients reconnect.
+TRANSCRIPT_STREAM_POLL_SECONDS = 1.0
+TRANSCRIPT_STREAM_STATUS_SECONDS = 15.0
+TRANSCRIPT_STREAM_MAX_SECONDS = 30 * 60
+# Transcript streams open per user in this process; opening another closes the oldest.
+TRANSCRIPT_STREAM_MAX_PER_USER = 3
+_transcript_streams_lock = threading.Lock()
+_transcript_streams: dict[int, list[threading.Event]] = {}
+
+
+def _open_transcript_stream(user_id: int) -> threading.Event:
+    """Register a stream; the event is set when a newer stream of the user's displaces it."""
+    closed = threading.Event()
+    with _transcript_streams_lock:
+        streams = _transcript_streams.setdefault(user_id, [])
+        streams.append(closed)
+        for old in streams[:-TRANSCRIPT_STREAM_MAX_PER_USER]:
+            old.set()
+        del streams[:-TRANSCRIPT_STREAM_MAX_PER_USER]
+    return closed
+
+
+def _close_transcript_stream(user_id: int, closed: threading.Event):
+    with _transcript_streams_lock:
+        streams = _transcript_streams.get(user_id)
+        if streams and closed in streams:
+            streams.remove(closed)
+            if not streams:
+                del _transcript_streams[user_id]
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/vods/{vod_moodle_id}/transcript/stream")
+@limiter.limit("10/minute")
+def stream_vod_transcript(request: Request, vod_moodle_id: int, user: User = Depends(get_current_user),
+                          db: Session = Depends(get_db)):
+    """
+    SSE feed of a transcription in progress, so the first minutes of a lecture are readable
+    while the rest is still being transcribed.
+
+    Events: `status` (the /transcribe/status payload, on every change), `chunk` (one
+    checkpointed chunk: index, start_s, end_s, text — in any order, and again if a retry
+    re-cut it), `reset` (the job restarted with a different chunk length; drop the chunks so
+    far), then `done` with the full transcript or `error`. Opening more than
+    TRANSCRIPT_STREAM_MAX_PER_USER of them ends the user's oldest.
+    """
+    vod = db.query(VOD).join(Course).filter(VOD.moodle_id == vod_moodle_id, Course.owner_id == user.id).first()
+    if not vod:
+        raise HTTPException(404, "VOD not found")
+    if not db.query(VodTranscript).filter(VodTranscript.moodle_id == vod_moodle_id).first():
+        raise HTTPException(404, "Transcription not started")
+    vod_id = vod.id
+    engine = db.get_bind()
+    # Hand the request's connection back; each poll below uses its own short session.
+    db.commit()
+
+    sent: dict[int, tuple[float, str]] = {}
+    last = {"chunk_seconds": None, "chunk_id": 0, "status": None, "status_at": 0.0}
+
+    def poll() -> tuple[list[str], bool]:
+        """One look at the job: the frames to send, and whether the stream is finished."""
+        with Session(bind=engine) as poll_db:
+            row = poll_db.query(VodTranscript).filter(VodTranscript.moodle_id == vod_moodle_id).first()
+            if row is None:
+                return [_sse("error", {"error": "Transcription not started"})], True
+            if row.transcript and not row.is_processing:
+                return [_sse("done", {"transcript": row.transcript})], True
+            if row.status == "failed" and not row.is_processing:
+                return [_sse("error", {"error": row.error_message or "Transcription failed"})], True
+
+            frames = []
+            marker = (row.status, row.stage, row.progress_pct)
+            if marker != last["status"] or time.monotonic() - last["status_at"] >= TRANSCRIPT_STREAM_STATUS_SECONDS:
+                frames.append(_sse("status", _build_transcribe_status(poll_db, poll_db.get(VOD, vod_id), row)))
+                last["status"], last["status_at"] = marker, time.monotonic()
+
+            # Only rows written since the last poll: the worker never updates a chunk in place,
+            # so anything new or re-cut has a higher id than the last one read.
+            chunks = (
+                poll_db.query(TranscriptChunk)
+                .filter(TranscriptChunk.vod_moodle_id == vod_moodle_id, TranscriptChunk.id > last["chunk_id"])
+                .order_by(TranscriptChunk.id)
+                .all()
+            )
+            if chunks:
+                last["chunk_id"] = chunks[-1].id
+                # Rows left by an earlier attempt at another length are superseded.
+                current = chunks[-1].chunk_seconds
+                if last["chunk_seconds"] is not None and current != last["chunk_seconds"]:
+                    sent.clear()
+                    frames.append(_sse("reset", {"chunk_seconds": current}))
+                    # A retry at a length tried before resumes from that attempt's chunks.
+                    chunks = (
+                        poll_db.query(TranscriptChunk)
+                        .filter(TranscriptChunk.vod_moodle_id == vod_moodle_id,
+                                TranscriptChunk.chunk_seconds == current)
+                        .all()
+                    )
+                last["chunk_seconds"] = current
+                for chunk in sorted((c for c in chunks if c.chunk_seconds == current), key=lambda c: c.start_s):
+                    if sent.get(chunk.chunk_index) == (chunk.start_s, chunk.text):
+                        continue
+                    sent[chunk.chunk_index] = (chunk.start_s, chunk.text)
+                    frames.append(_sse("chunk", {
+                        "index": chunk.chunk_index,
+                        "start_s": chunk.start_s,
+                        "end_s": chunk.end_s,
+                        "text": chunk.text,
+                    }))
+            return frames, False
+
+    user_id = user.id
+
+    # Async, with only the poll itself on the threadpool: a sync generator would hold one of
+    # the threadpool's few threads for as long as the app keeps the stream open.
+    async def event_generator():
+        closed = _open_transcript_stream(user_id)
+        try:
+            started = time.monotonic()
+            while time.monotonic() - started < TRANSCRIPT_STREAM_MAX_SECONDS and not closed.is_set():
+                frames, finished = await run_in_threadpool(poll)
+                for frame in frames:
+                    yield frame
+                if finished:
+                    return
+                await asyncio.sleep(TRANSCRIPT_STREAM_POLL_SECONDS)
+        finally:
+            _close_transcript_stream(user_id, closed)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# The per-user progress stream: how often it proves the connection alive, how often it
+# re-reads state when the broker only hears this process (SQLite), and when it hangs up.
+EVENTS_KEEPALIVE_SECONDS = 15.0
+EVENTS_SNAPSHOT_SECONDS = 3.0
+EVENTS_STREAM_MAX_SECONDS = 30 * 60
+# Finished transcriptions stay in the snapshot this long, so a stream that missed the
+# final event (SQLite, a listener reconnect) still sees the bar reach the end.
+EVENTS_RECENT_SECONDS = 10 * 60
+
+
+def _progress_snapshot(db: Session, user_id: int) -> list[str]:
+    """SSE frames for everything the user is waiting on: their transcriptions and the
+    brain state of every course they have switched on or that is mid-build."""
+    recent = datetime.now() - timedelta(seconds=EVENTS_RECENT_SECONDS)
+    vod_ids = [
+        vod_id for (vod_id,) in
+        db.query(Job.vod_moodle_id)
+        .filter(
+            Job.type == "transcribe",
+            Job.user_id == user_id,
+            Job.vod_moodle_id.isnot(None),
+            or_(Job.status.in_(("pending", "processing")), Job.completed_at >= recent),
+        )
+        .distinct()
+    ]
+    frames = []
+    if vod_ids:
+        for row in db.query(VodTranscript).filter(VodTranscript.moodle_id.in_(vod_ids)):
+            frames.append(_sse("transcribe", events.transcribe_event(row)))
+    courses = db.query(Course).filter(
+        Course.owner_id == user_id,
+        or_(Course.brain_enabled.is_(True), Course.brain_status.in_(("queued", "building"))),
+    )
+    for course in courses:
+        frames.append(_sse("brain", events.brain_event(course)))
+    return frames
+
+
+@app.get("/events")
+@limiter.limit("10/minute")
+def stream_progress_events(request: Request, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    One SSE stream per user carrying every progress bar, instead of a poll per bar.
+
+    Opens with the current state, then: `transcribe` (a transcription's status, stage and
+    percent), `brain` (a course build's status, stage and progress) and `job` (a job
+    finished, done or failed). The state is sent again after the server loses events, so
+    clients can treat each event as the latest word rather than a delta. Opening more than
+    events.MAX_SUBSCRIBERS_PER_USER of them ends the user's oldest.
+    """
+    user_id = user.id
+    engine = db.get_bind()
+    broker = events.broker.listen(engine)
+    db.commit()
+
+    def snapshot() -> list[str]:
+        with Session(bind=engine) as snapshot_db:
+            return _progress_snapshot(snapshot_db, user_id)
+
+    async def event_generator():
+        sub = broker.subscribe(user_id)
+        try:
+            started = last_sent = time.monotonic()
+            snapshot_due = started
+            while time.monotonic() - started < EVENTS_STREAM_MAX_SECONDS:
+                now = time.monotonic()
+                if now >= snapshot_due:
+                    for frame in await run_in_threadpool(snapshot):
+                        yield frame
+                    last_sent = now
+                    # With the PostgreSQL feed, events are complete and one snapshot is enough.
+                    snapshot_due = float("inf") if broker.cross_process else now + EVENTS_SNAPSHOT_SECONDS
+                wait = min(snapshot_due, last_sent + EVENTS_KEEPALIVE_SECONDS, started + EVENTS_STREAM_MAX_SECONDS)
+                item = await sub.get(max(0.0, wait - time.monotonic()))
+                if item is None:
+                    if time.monotonic() - last_sent >= EVENTS_KEEPALIVE_SECONDS:
+                        yield ": keep-alive\n\n"
+                        last_sent = time.monotonic()
+                    continue
+                event, data = item
+                if event == events.CLOSE:
+                    return
+                if event == events.RESYNC:
+                    snapshot_due = time.monotonic()
+                    continue
+                yield _sse(event, data)
+                last_sent = time.monotonic()
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/vods/{vod_moodle_id}/transcribe")
 def transcribe_vod(request: Request, vod_moodle_id: int, req: Optional[ManualTranscribeRequest] = None, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     logger.info(f"Transcribe request user={user.username} user_id={user.id} vod={vod_moodle_id}")
@@ -1276,14 +1524,14 @@ def transcribe_vod(request: Request, vod_moodle_id: int, req: Optional[ManualTra
         ))
 
     # Enqueue job for the worker
-    db.add(Job(type='transcribe', payload={
+    job_queue.enqueue(db, 'transcribe', {
         'vod_moodle_id': vod_moodle_id,
         'm3u8_url': m3u8_url,
         'cookies': user.moodle_cookies or '',
         'user_id': user.id,
         'vod_title': vod_title,
         'course_name': course_name,
-    }))
+    })
     db.commit()
     queue_depth = db.query(Job).filter(Job.type == 'transcribe', Job.status.in_(['pending', 'processing'])).count()
     logger.info(
@@ -1320,6 +1568,9 @@ def summarize_vod(request: Request, vod_moodle_id: int, user: User = Depends(get
     return {"status": "ok", "summary": summary}
 
 DAILY_CHAT_LIMIT = int(os.getenv('DAILY_CHAT_LIMIT', '30'))
+# Brain chat's default mode: 'full' sends the whole course, 'retrieval' the passages
+# that match the question (see course_brain.retrieve_corpus).
+BRAIN_CHAT_MODE = os.getenv('BRAIN_CHAT_MODE', 'full')
 DAILY_TRANSCRIBE_LIMIT = int(os.getenv('DAILY_TRANSCRIBE_LIMIT', '3'))
 
 
@@ -1726,7 +1977,7 @@ def watch_single_vod(vod_moodle_id: int, user: User = Depends(get_current_user),
     client = get_moodle_client(user)
     if not client.is_session_valid():
         raise HTTPException(401, "Moodle session expired. Please re-login.")
-    db.add(Job(type='watch_one', payload={'user_id': user.id, 'vod_moodle_id': vod_moodle_id}))
+    job_queue.enqueue(db, 'watch_one', {'user_id': user.id, 'vod_moodle_id': vod_moodle_id})
     db.commit()
     return {"status": "started"}
 
@@ -1743,10 +1994,10 @@ def trigger_watch_all(request: Request, user: User = Depends(get_current_user),
     existing = db.query(Job).filter(
         Job.type == 'watch_all',
         Job.status.in_(['pending', 'processing']),
-    ).filter(Job.payload['user_id'].as_integer() == user.id).first()
+    ).filter(Job.user_id == user.id).first()
     if existing:
         return {"status": "already_running", "message": "VOD watching is already queued"}
-    db.add(Job(type='watch_all', payload={'user_id': user.id}))
+    job_queue.enqueue(db, 'watch_all', {'user_id': user.id})
     db.commit()
     return {"status": "started", "message": "VOD watching started in background"}
 
@@ -1894,6 +2145,8 @@ def delete_test_assignments(user: User = Depends(get_current_user), db: Session
         return {"status": "success", "message": "No test course found, nothing to delete."}
 
     deleted_count = db.query(Assignment).filter(Assignment.course_id == test_course.id).delete()
+    # A bulk delete skips the flush hook that versions the brain corpus.
+    test_course.brain_corpus_version = Course.brain_corpus_version + 1
     db.commit()
 
     return {"status": "success", "message": f"Deleted {deleted_count} test assignments."}
@@ -1941,6 +2194,8 @@ def delete_test_vods(user: User = Depends(get_current_user), db: Session = Depen
         return {"status": "success", "message": "No test course found, nothing to delete."}
 
     deleted_count = db.query(VOD).filter(VOD.course_id == test_course.id).delete()
+    # A bulk delete skips the flush hook that versions the brain corpus.
+    test_course.brain_corpus_version = Course.brain_corpus_version + 1
     db.commit()
 
     return {"status": "success", "message": f"Deleted {deleted_count} test VODs."}
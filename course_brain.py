@@ -13,11 +13,23 @@ Three properties this is built around:
   an interrupted build resumes instead of restarting.
 * **Failure is per-file.** One unreadable PDF records its error and the build continues.
 """
+import hashlib
 import logging
+import math
 import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
+from urllib.parse import urlsplit
+
+from sqlalchemy.exc import IntegrityError
 
 import content_extract as ce
+import events
+import job_queue
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +41,18 @@ FILES_ROOT = os.getenv('COURSE_FILES_ROOT', '/app/course_files')
 # 300-page document, and the daily transcription cap does not apply to captioning.
 MAX_CAPTIONS_PER_FILE = 60
 
+# Network calls a build makes at once, per stage, and to any one host. The host cap is
+# the politeness limit towards LearnUs: downloads and assignment pages share it.
+BUILD_CONCURRENCY = {
+    'downloads': max(1, int(os.getenv('BRAIN_DOWNLOAD_CONCURRENCY', '4'))),
+    'assignments': max(1, int(os.getenv('BRAIN_ASSIGNMENT_CONCURRENCY', '4'))),
+    'captions': max(1, int(os.getenv('BRAIN_CAPTION_CONCURRENCY', '6'))),
+    # One lecture at a time: transcribe_vod already sends TRANSCRIBE_CONCURRENCY chunks
+    # at once, and the spend gate is asked between lectures.
+    'lectures': 1,
+}
+BUILD_HOST_CONCURRENCY = max(1, int(os.getenv('BRAIN_HOST_CONCURRENCY', '4')))
+
 
 def _safe_name(name: str) -> str:
     keep = [c if (c.isalnum() or c in '._- ') else '_' for c in (name or 'file')]
@@ -106,66 +130,143 @@ def warm_pages(local_path: str, file_kind: str, course_moodle_id: int, file_mood
         logger.warning(f"page warm failed for {local_path}: {e}")
 
 
-def build_file(session, file_row, course_moodle_id: int, ai_service=None,
-               caption: bool = True, force: bool = False) -> dict:
+class FetchExecutor:
     """
-    Download, extract and (optionally) caption one file resource.
+    Runs a build's network calls concurrently: file downloads, assignment pages, slide
+    captions and lecture transcriptions, each stage with its own cap and every request
+    to one host under a shared one.
 
-    Mutates `file_row` but does not commit — the caller owns the transaction so a build
-    can commit per file and survive interruption.
+    Only the network work runs on its threads. `map` and `submit` hand each result back
+    to the calling thread, and that thread — the one that owns the session — does every
+    database read and write, so rows are never touched from two threads.
     """
-    report = {'title': file_row.title, 'status': None, 'chars': 0, 'captioned': 0, 'error': None}
+
+    def __init__(self, limits: dict[str, int] | None = None, per_host: int | None = None):
+        self.limits = {**BUILD_CONCURRENCY, **(limits or {})}
+        self.per_host = max(1, per_host or BUILD_HOST_CONCURRENCY)
+        self._pools: dict[str, ThreadPoolExecutor] = {}
+        self._hosts: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'FetchExecutor':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @contextmanager
+    def host(self, url: str):
+        """Hold one of `url`'s host slots for the duration of a request."""
+        netloc = urlsplit(url).netloc
+        with self._lock:
+            slot = self._hosts.setdefault(netloc, threading.BoundedSemaphore(self.per_host))
+        with slot:
+            yield
+
+    def _pool(self, stage: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if stage not in self._pools:
+                self._pools[stage] = ThreadPoolExecutor(
+                    max_workers=self.limits[stage], thread_name_prefix=f'brain-{stage}')
+            return self._pools[stage]
+
+    def submit(self, stage: str, fn, item) -> Future:
+        """Run `fn(item)` on the stage's pool."""
+        return self._pool(stage).submit(fn, item)
+
+    def map(self, stage: str, fn, items):
+        """
+        Yield (item, result, error) for `fn(item)` over `items`, in completion order, at
+        most `limits[stage]` at a time. A failed call yields its exception rather than
+        raising, so one bad item does not end the stage. Closing the generator early
+        cancels whatever has not started.
+        """
+        futures = {self.submit(stage, fn, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                error = future.exception()
+                yield futures[future], (None if error else future.result()), error
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _host_slot(executor: FetchExecutor | None, url: str):
+    return executor.host(url) if executor else nullcontext()
+
+
+def _file_skip_report(file_row, force: bool) -> dict | None:
+    """The report for a file with nothing to do, or None if it needs building."""
+    report = {'title': file_row.title, 'status': 'skipped', 'chars': 0, 'captioned': 0, 'error': None}
 
     if file_row.content and not force:
-        report['status'] = 'skipped'
         report['chars'] = file_row.content_chars or len(file_row.content)
         return report
 
     # Labels carry their text inline from the course page and have no URL to fetch, so
     # there is nothing for a rebuild to do — including a forced one.
     if not file_row.url:
-        report['status'] = 'skipped'
         report['chars'] = file_row.content_chars or len(file_row.content or '')
         return report
 
-    target_dir = file_dir(course_moodle_id, file_row.moodle_id)
+    return None
+
+
+def _file_task(file_row) -> dict:
+    """What fetching a file needs to know, copied off the row on the session's thread."""
+    return {'id': file_row.id, 'moodle_id': file_row.moodle_id, 'url': file_row.url, 'title': file_row.title}
+
+
+def _fetch_file(session, task: dict, course_moodle_id: int, ai_service=None,
+                caption: bool = True, executor: FetchExecutor | None = None) -> tuple[dict, dict]:
+    """
+    Download, extract and caption one file without touching the database. Returns the
+    column values to store on its row and the build report; safe to run off the
+    session's thread.
+    """
+    report = {'title': task['title'], 'status': None, 'chars': 0, 'captioned': 0, 'error': None}
+    fields: dict = {}
+
+    target_dir = file_dir(course_moodle_id, task['moodle_id'])
     os.makedirs(target_dir, exist_ok=True)
 
     # --- download -----------------------------------------------------------------
     try:
-        response = session.get(file_row.url, timeout=120, allow_redirects=True)
+        with _host_slot(executor, task['url']):
+            response = session.get(task['url'], timeout=120, allow_redirects=True)
         response.raise_for_status()
         data = response.content
         filename = _safe_name(response.url.split('?')[0].rsplit('/', 1)[-1])
     except Exception as e:
-        file_row.extract_status = 'error'
-        file_row.extract_error = f"download: {type(e).__name__}: {e}"
-        file_row.extracted_at = datetime.now()
-        report.update(status='error', error=file_row.extract_error)
-        return report
+        fields.update(extract_status='error', extract_error=f"download: {type(e).__name__}: {e}",
+                      extracted_at=datetime.now())
+        report.update(status='error', error=fields['extract_error'])
+        return fields, report
 
     if len(data) > ce.MAX_FILE_BYTES:
-        file_row.extract_status = 'too_large'
-        file_row.file_bytes = len(data)
-        file_row.extracted_at = datetime.now()
+        fields.update(extract_status='too_large', file_bytes=len(data), extracted_at=datetime.now())
         report['status'] = 'too_large'
-        return report
+        return fields, report
 
     local_path = os.path.join(target_dir, filename)
     with open(local_path, 'wb') as f:
         f.write(data)
 
-    file_row.local_path = local_path
-    file_row.file_bytes = len(data)
     kind = ce.guess_kind(response.url, response.headers.get('Content-Type', ''))
-    file_row.file_kind = kind
+    fields.update(local_path=local_path, file_bytes=len(data), file_kind=kind)
 
     # --- extract ------------------------------------------------------------------
     captioned = 0
     try:
         if kind == 'pdf':
             pages = ce.extract_pdf_pages(data)
-            file_row.page_count = len(pages)
+            fields['page_count'] = len(pages)
             captions = {}
 
             if caption and ai_service is not None:
@@ -173,10 +274,19 @@ def build_file(session, file_row, course_moodle_id: int, ai_service=None,
                 if targets:
                     render_dir = os.path.join(target_dir, 'pages')
                     renders = ce.render_pdf_pages(local_path, targets, render_dir)
-                    for page_no, image_path in sorted(renders.items()):
-                        text, _usage = ai_service.caption_slide(
-                            image_path, file_row.title or '', page_no)
-                        if text:
+
+                    def _caption(page):
+                        page_no, image_path = page
+                        return ai_service.caption_slide(image_path, task['title'] or '', page_no)[0]
+
+                    if executor:
+                        results = executor.map('captions', _caption, sorted(renders.items()))
+                    else:
+                        results = ((page, _caption(page), None) for page in sorted(renders.items()))
+                    for (page_no, _), text, error in results:
+                        if error:
+                            logger.warning(f"caption failed for {task['title']!r} p.{page_no}: {error}")
+                        elif text:
                             captions[page_no] = text
                             captioned += 1
 
@@ -189,34 +299,57 @@ def build_file(session, file_row, course_moodle_id: int, ai_service=None,
         else:
             content, kind = ce.extract(data, response.url,
                                        response.headers.get('Content-Type', ''))
-            file_row.file_kind = kind
+            fields['file_kind'] = kind
 
     except ce.ExtractionError as e:
-        file_row.extract_status = 'error'
-        file_row.extract_error = str(e)
-        file_row.extracted_at = datetime.now()
+        fields.update(extract_status='error', extract_error=str(e), extracted_at=datetime.now())
         report.update(status='error', error=str(e))
-        return report
+        return fields, report
 
     if len(content) > ce.MAX_TEXT_CHARS:
         content = content[:ce.MAX_TEXT_CHARS]
 
-    file_row.content = content
-    file_row.content_chars = len(content)
-    file_row.captioned_pages = captioned
-    file_row.extract_error = None
-    file_row.extracted_at = datetime.now()
-    # An image-only document parses cleanly and yields nothing; that is worth telling
-    # apart from success so it can be surfaced rather than silently emptying the corpus.
-    file_row.extract_status = 'ok' if content.strip() else 'empty'
+    fields.update(
+        content=content,
+        content_chars=len(content),
+        captioned_pages=captioned,
+        extract_error=None,
+        extracted_at=datetime.now(),
+        # An image-only document parses cleanly and yields nothing; that is worth telling
+        # apart from success so it can be surfaced rather than silently emptying the corpus.
+        extract_status='ok' if content.strip() else 'empty',
+    )
+    report.update(status=fields['extract_status'], chars=len(content), captioned=captioned)
+    return fields, report
+
+
+def _apply_file(file_row, fields: dict) -> None:
+    for column, value in fields.items():
+        setattr(file_row, column, value)
 
-    report.update(status=file_row.extract_status, chars=len(content), captioned=captioned)
+
+def build_file(session, file_row, course_moodle_id: int, ai_service=None,
+               caption: bool = True, force: bool = False, executor: FetchExecutor | None = None) -> dict:
+    """
+    Download, extract and (optionally) caption one file resource.
+
+    Mutates `file_row` but does not commit — the caller owns the transaction so a build
+    can commit per file and survive interruption. With an `executor`, the file's slide
+    captions run concurrently.
+    """
+    report = _file_skip_report(file_row, force)
+    if report:
+        return report
+    fields, report = _fetch_file(session, _file_task(file_row), course_moodle_id,
+                                 ai_service=ai_service, caption=caption, executor=executor)
+    _apply_file(file_row, fields)
     return report
 
 
 def queued_items(db, course) -> set:
     """
-    (item_type, item_id) pairs with a manual learn queued or running for this course.
+    (item_type, item_id) pairs with a manual learn or a build item queued or running for
+    this course.
 
     Read straight off the job queue rather than tracked on the item, so it cannot drift
     out of sync with reality: if the job is gone, the row is no longer "learning".
@@ -224,14 +357,17 @@ def queued_items(db, course) -> set:
     from database import Job
 
     jobs = db.query(Job).filter(
-        Job.type == 'brain_learn_item',
+        Job.type.in_(('brain_learn_item', 'brain_build_item')),
+        Job.course_id == course.id,
         Job.status.in_(('pending', 'processing')),
     ).all()
-    return {
-        (p.get('item_type'), p.get('item_id'))
-        for p in (j.payload or {} for j in jobs)
-        if p.get('course_id') == course.id
-    }
+    queued = set()
+    for payload in (j.payload or {} for j in jobs):
+        if payload.get('item_type') == 'assignments':
+            queued.update(('assignment', item_id) for item_id in payload.get('item_ids') or ())
+        else:
+            queued.add((payload.get('item_type'), payload.get('item_id')))
+    return queued
 
 
 def corpus_size(db, course) -> dict:
@@ -407,17 +543,14 @@ _TYPE_LABEL = {
 }
 
 
-def assemble_corpus(db, course) -> tuple[str, list[dict]]:
+def _corpus_items(db, course) -> list[tuple[int, str, dict]]:
     """
-    The whole course as one document, plus the source list its citations refer to.
+    Every item the corpus draws on, in corpus order, as (section, week heading, item).
 
-    Ordered by week and rendered as markdown so the structure the student sees in the
-    library is the structure the model reads. Every item is introduced by a stable `[S<n>]`
-    marker; the model is told to cite those, and the returned source list maps each back to
-    a real row so the app can turn a citation into a tappable destination.
-
-    Assembly is deterministic — same corpus, same bytes — which is what lets the provider's
-    prompt cache treat it as a repeated prefix across every question about this course.
+    Each item's `units` are its natural pieces — a file's pages or paragraphs, a
+    transcript's timestamped passages, a board's posts — and `body` is them joined. Both
+    the full corpus and the retrieval index are built from this, so they number sources
+    the same way.
     """
     from database import Assignment, VOD, VodTranscript, FileResource, Board, Post
 
@@ -433,7 +566,7 @@ def assemble_corpus(db, course) -> tuple[str, list[dict]]:
 
     buckets: dict[int, list[dict]] = {}
 
-    def add(section, week, entry):
+    def add(section, week, entry, units, sep):
         buckets.setdefault(
             section if section is not None else 9999,
             {'week': week or '기타', 'items': []},
@@ -441,6 +574,8 @@ def assemble_corpus(db, course) -> tuple[str, list[dict]]:
         bucket = buckets[section if section is not None else 9999]
         if week and bucket['week'] == '기타':
             bucket['week'] = week
+        entry['body'] = sep.join(units)
+        entry['units'] = [u for u in units if u.strip()]
         bucket['items'].append(entry)
 
     for f in files:
@@ -448,16 +583,16 @@ def assemble_corpus(db, course) -> tuple[str, list[dict]]:
             continue
         add(f.section, f.week, {
             'type': 'label' if f.file_kind == 'label' else 'file',
-            'id': f.id, 'title': f.title, 'body': f.content, 'week': f.week,
-        })
+            'id': f.id, 'title': f.title, 'week': f.week,
+        }, f.content.split("\n\n"), "\n\n")
 
     for v in vods:
         t = transcripts.get(v.moodle_id)
         if not (t and t.transcript):
             continue
         add(v.section, v.week, {
-            'type': 'vod', 'id': v.id, 'title': v.title, 'body': t.transcript, 'week': v.week,
-        })
+            'type': 'vod', 'id': v.id, 'title': v.title, 'week': v.week,
+        }, t.transcript.split("\n"), "\n")
 
     for a in assignments:
         parts = []
@@ -468,9 +603,8 @@ def assemble_corpus(db, course) -> tuple[str, list[dict]]:
         if not parts:
             continue
         add(a.section, a.week, {
-            'type': 'assignment', 'id': a.id, 'title': a.title,
-            'body': "\n".join(parts), 'week': a.week,
-        })
+            'type': 'assignment', 'id': a.id, 'title': a.title, 'week': a.week,
+        }, parts, "\n")
 
     for b in boards:
         posts = db.query(Post).filter_by(board_id=b.id).all()
@@ -484,43 +618,333 @@ def assemble_corpus(db, course) -> tuple[str, list[dict]]:
         if not rendered:
             continue
         add(b.section, b.week, {
-            'type': 'board', 'id': b.id, 'title': b.title,
-            'body': "\n\n".join(rendered), 'week': b.week,
-        })
+            'type': 'board', 'id': b.id, 'title': b.title, 'week': b.week,
+        }, rendered, "\n\n")
 
+    return [
+        (key, buckets[key]['week'], item)
+        for key in sorted(buckets)
+        for item in buckets[key]['items']
+    ]
+
+
+def _source(ref_no: int, item: dict) -> dict:
+    return {
+        'ref': f"S{ref_no}", 'type': item['type'], 'id': item['id'],
+        'title': item['title'], 'week': item['week'],
+    }
+
+
+def _source_heading(source: dict) -> str:
+    return f"### [{source['ref']}] {_TYPE_LABEL.get(source['type'], source['type'])}: {source['title']}"
+
+
+def assemble_corpus(db, course) -> tuple[str, list[dict]]:
+    """
+    The whole course as one document, plus the source list its citations refer to.
+
+    Ordered by week and rendered as markdown so the structure the student sees in the
+    library is the structure the model reads. Every item is introduced by a stable `[S<n>]`
+    marker; the model is told to cite those, and the returned source list maps each back to
+    a real row so the app can turn a citation into a tappable destination.
+
+    Assembly is deterministic — same corpus, same bytes — which is what lets the provider's
+    prompt cache treat it as a repeated prefix across every question about this course.
+    """
     lines = [f"# {course.name}", ""]
     sources: list[dict] = []
     total = len(lines[0])
-    ref_no = 0
+    section = None
 
-    for key in sorted(buckets):
-        bucket = buckets[key]
-        if not bucket['items']:
-            continue
-        header = f"## {bucket['week']}"
-        lines.append(header)
-        lines.append("")
-        total += len(header)
-
-        for item in bucket['items']:
-            body = (item['body'] or '').strip()
-            if len(body) > MAX_ITEM_CHARS:
-                body = body[:MAX_ITEM_CHARS] + "\n…(이하 생략)"
-            if total + len(body) > MAX_CORPUS_CHARS:
-                lines.append("(길이 제한으로 이후 자료는 생략되었습니다.)")
-                return "\n".join(lines), sources
-
-            ref_no += 1
-            ref = f"S{ref_no}"
-            sources.append({
-                'ref': ref, 'type': item['type'], 'id': item['id'],
-                'title': item['title'], 'week': item['week'],
-            })
-            lines.append(f"### [{ref}] {_TYPE_LABEL.get(item['type'], item['type'])}: {item['title']}")
-            lines.append(body)
+    for item_section, week, item in _corpus_items(db, course):
+        if item_section != section:
+            section = item_section
+            header = f"## {week}"
+            lines.append(header)
             lines.append("")
-            total += len(body)
+            total += len(header)
+
+        body = (item['body'] or '').strip()
+        if len(body) > MAX_ITEM_CHARS:
+            body = body[:MAX_ITEM_CHARS] + "\n…(이하 생략)"
+        if total + len(body) > MAX_CORPUS_CHARS:
+            lines.append("(길이 제한으로 이후 자료는 생략되었습니다.)")
+            return "\n".join(lines), sources
+
+        sources.append(_source(len(sources) + 1, item))
+        lines.append(_source_heading(sources[-1]))
+        lines.append(body)
+        lines.append("")
+        total += len(body)
+
+    return "\n".join(lines), sources
+
+
+# Assembled corpora kept in this process, most recently used last. At the 900K-character
+# cap one entry is a few MB, so the default holds a busy API's working set of courses.
+CORPUS_CACHE_ENTRIES = max(0, int(os.getenv('CORPUS_CACHE_ENTRIES', '16')))
+_corpus_cache: OrderedDict[int, tuple[int, str, list[dict]]] = OrderedDict()
+_corpus_cache_lock = threading.Lock()
+
+
+def _remember_corpus(course_id: int, entry: tuple[int, str, list[dict]]) -> None:
+    with _corpus_cache_lock:
+        _corpus_cache[course_id] = entry
+        _corpus_cache.move_to_end(course_id)
+        while len(_corpus_cache) > CORPUS_CACHE_ENTRIES:
+            _corpus_cache.popitem(last=False)
+
+
+def cached_corpus(db, course) -> tuple[str, list[dict]]:
+    """
+    `assemble_corpus`, re-run only when the course's brain content has changed.
+
+    Keyed by `course.brain_corpus_version`, which every write to the corpus's inputs bumps
+    (database._bump_corpus_versions). Looked up in this process's LRU first, then in the
+    `corpus_cache` table — which survives restarts and is shared by every API process —
+    and only then assembled and stored in both. The version is read before assembling, so
+    a change that commits mid-assembly leaves the stored copy already out of date rather
+    than wrongly current.
+    """
+    from database import CorpusCache
+
+    version = course.brain_corpus_version or 0
+    with _corpus_cache_lock:
+        hit = _corpus_cache.get(course.id)
+        if hit and hit[0] == version:
+            _corpus_cache.move_to_end(course.id)
+            return hit[1], hit[2]
+
+    stored = db.query(CorpusCache).filter(CorpusCache.course_id == course.id).first()
+    if stored and stored.version == version:
+        _remember_corpus(course.id, (version, stored.corpus, stored.sources))
+        return stored.corpus, stored.sources
+
+    corpus, sources = assemble_corpus(db, course)
+    _remember_corpus(course.id, (version, corpus, sources))
+    if stored is None:
+        stored = CorpusCache(course_id=course.id)
+        db.add(stored)
+    stored.version, stored.corpus, stored.sources = version, corpus, sources
+    stored.assembled_at = datetime.now()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request stored this course's first copy at the same moment.
+        db.rollback()
+    return corpus, sources
+
+
+# ─── Retrieval ────────────────────────────────────────────────────────────────
+#
+# The full corpus makes every question pay for the whole course: up to 900K characters
+# of prompt, however narrow the question. Retrieval mode sends only the passages that
+# match it. Each item is cut into chunks along its units (a page, a run of transcript
+# passages, a post) and indexed with BM25. Korean has no spaces between a word and its
+# particles, so Hangul is indexed as character bigrams — "스택을" and "스택에서" share
+# "스택" — while Latin words and numbers are whole tokens.
+
+# Target chunk size. About a page of slides or two minutes of lecture.
+RETRIEVAL_CHUNK_CHARS = 1200
+RETRIEVAL_TOP_K = max(1, int(os.getenv('BRAIN_RETRIEVAL_TOP_K', '12')))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_HANGUL_RUN = re.compile(r'[가-힣]+')
+_WORD = re.compile(r'[a-z0-9]+')
+_PAGE_MARKER = re.compile(r'^\[p\.(\d+)\]')
+
+
+def tokenize(text: str) -> list[str]:
+    """Hangul runs as character bigrams (a lone syllable as itself), other words whole."""
+    text = text.lower()
+    tokens = _WORD.findall(text)
+    for run in _HANGUL_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _chunk_units(item: dict) -> list[str]:
+    """
+    An item's units packed into chunks of about RETRIEVAL_CHUNK_CHARS, in order. A file
+    chunk that starts mid-page is prefixed with that page's marker, so the model can
+    still cite and embed the page.
+    """
+    sep = "\n" if item['type'] in ('vod', 'assignment') else "\n\n"
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    page = None
+    for unit in item['units']:
+        for start in range(0, len(unit), RETRIEVAL_CHUNK_CHARS):
+            piece = unit[start:start + RETRIEVAL_CHUNK_CHARS]
+            if current and size + len(piece) > RETRIEVAL_CHUNK_CHARS:
+                chunks.append(sep.join(current))
+                current, size = [], 0
+            marker = _PAGE_MARKER.match(piece)
+            if not current and page and not marker:
+                current.append(f"[p.{page}]")
+            if marker:
+                page = marker.group(1)
+            current.append(piece)
+            size += len(piece)
+    if current:
+        chunks.append(sep.join(current))
+    return chunks
+
+
+class CorpusIndex:
+    """
+    A BM25 index over one course's chunks.
 
+    Updated item by item: `update` hashes each item's text and only re-chunks and
+    re-indexes the items that changed, so a sync that adds one post does not re-tokenize
+    every transcript.
+    """
+
+    def __init__(self):
+        self.version: int | None = None
+        # (section, week heading, source stub) per item in corpus order, for rendering.
+        self.outline: list[tuple[int, str, dict]] = []
+        self._items: dict[tuple, tuple[str, list[int]]] = {}   # (type, id) -> (digest, chunk ids)
+        self._chunks: dict[int, tuple[tuple, int, str, int]] = {}  # id -> (item, seq, text, length)
+        self._postings: dict[str, dict[int, int]] = {}        # term -> {chunk id: frequency}
+        self._total_length = 0
+        self._next_id = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, key: tuple) -> None:
+        _, chunk_ids = self._items.pop(key)
+        for chunk_id in chunk_ids:
+            _, _, text, length = self._chunks.pop(chunk_id)
+            self._total_length -= length
+            for term in set(tokenize(text)):
+                postings = self._postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self._postings[term]
+
+    def _add(self, key: tuple, digest: str, item: dict) -> None:
+        chunk_ids = []
+        for seq, text in enumerate(_chunk_units(item)):
+            terms = Counter(tokenize(text))
+            chunk_id = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self._chunks[chunk_id] = (key, seq, text, length)
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = count
+            chunk_ids.append(chunk_id)
+        self._items[key] = (digest, chunk_ids)
+
+    def update(self, items: list[tuple[int, str, dict]], version: int) -> int:
+        """Bring the index in line with `_corpus_items`; returns how many were (re)indexed."""
+        seen = set()
+        changed = 0
+        for _, _, item in items:
+            key = (item['type'], item['id'])
+            seen.add(key)
+            digest = hashlib.sha1(
+                "\x00".join((item['title'] or '', *item['units'])).encode('utf-8')
+            ).hexdigest()
+            if key in self._items:
+                if self._items[key][0] == digest:
+                    continue
+                self._remove(key)
+            self._add(key, digest, item)
+            changed += 1
+        for key in [k for k in self._items if k not in seen]:
+            self._remove(key)
+            changed += 1
+        self.outline = [
+            (section, week, {k: item[k] for k in ('type', 'id', 'title', 'week')})
+            for section, week, item in items
+        ]
+        self.version = version
+        return changed
+
+    def search(self, query: str, k: int) -> list[tuple[tuple, int, str]]:
+        """The `k` best chunks for `query` as (item, seq, text), best first."""
+        if not self._chunks:
+            return []
+        n = len(self._chunks)
+        average = self._total_length / n or 1.0
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings.items():
+                length = self._chunks[chunk_id][3]
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (BM25_K1 + 1) / (
+                    count + BM25_K1 * (1 - BM25_B + BM25_B * length / average)
+                )
+        best = sorted(scores, key=lambda c: (-scores[c], c))[:k]
+        return [self._chunks[c][:3] for c in best]
+
+
+_indexes: OrderedDict[int, CorpusIndex] = OrderedDict()
+
+
+def _course_index(db, course) -> CorpusIndex:
+    """This course's index, brought up to its corpus version first if it has moved on."""
+    with _corpus_cache_lock:
+        index = _indexes.get(course.id)
+        if index is None:
+            index = _indexes[course.id] = CorpusIndex()
+        _indexes.move_to_end(course.id)
+        while len(_indexes) > CORPUS_CACHE_ENTRIES:
+            _indexes.popitem(last=False)
+    version = course.brain_corpus_version or 0
+    with index.lock:
+        if index.version != version:
+            changed = index.update(_corpus_items(db, course), version)
+            logger.info(f"Corpus index course={course.id} version={version} items_reindexed={changed}")
+    return index
+
+
+def retrieve_corpus(db, course, query: str, k: int = RETRIEVAL_TOP_K) -> tuple[str, list[dict]] | None:
+    """
+    The `k` passages of the course that best match `query`, rendered like the full
+    corpus — same `[S<n>]` markers, week and source headings, course order — plus the
+    source list for every item, so citations resolve exactly as they do in full mode.
+    None when nothing matches (a greeting, a question in other words than the material's),
+    for the caller to fall back to the full corpus.
+    """
+    index = _course_index(db, course)
+    with index.lock:
+        hits = index.search(query, k)
+        outline = index.outline
+    if not hits:
+        return None
+
+    sources = [_source(n, item) for n, (_, _, item) in enumerate(outline, start=1)]
+    position = {(item['type'], item['id']): n for n, (_, _, item) in enumerate(outline)}
+    picked: dict[int, list[tuple[int, str]]] = {}
+    for key, seq, text in hits:
+        if key in position:
+            picked.setdefault(position[key], []).append((seq, text))
+
+    lines = [f"# {course.name}", "", "(질문과 관련된 부분만 발췌했습니다.)", ""]
+    section = None
+    for n in sorted(picked):
+        item_section, week, _ = outline[n]
+        if item_section != section:
+            section = item_section
+            lines.extend([f"## {week}", ""])
+        lines.append(_source_heading(sources[n]))
+        previous = None
+        for seq, text in sorted(picked[n]):
+            if previous is not None and seq != previous + 1:
+                lines.append("…")
+            lines.append(text)
+            previous = seq
+        lines.append("")
     return "\n".join(lines), sources
 
 
@@ -593,72 +1017,148 @@ def get_item_detail(db, course, item_type: str, item_id: int) -> dict | None:
     return None
 
 
-def fetch_assignment_descriptions(client, db, course, force: bool = False) -> dict:
+def fetch_assignment_descriptions(client, db, course, force: bool = False,
+                                  executor: FetchExecutor | None = None, ids=None) -> dict:
     """
-    Fill in assignment instructions, one request per assignment.
+    Fill in assignment instructions, one request per assignment, several at once.
 
     Deliberately part of the brain build rather than the regular sync: sync runs on a
     schedule for every course, and adding a page fetch per assignment there would slow a
     frequent path to populate a field only the brain reads. Skips anything already
-    fetched, so the cost is one-time.
+    fetched, so the cost is one-time. `ids` limits it to those assignments (one batch of
+    a fanned-out build).
     """
     from database import Assignment
 
-    rows = db.query(Assignment).filter_by(course_id=course.id).all()
-    summary = {'total': len(rows), 'fetched': 0, 'skipped': 0, 'empty': 0}
+    query = db.query(Assignment).filter_by(course_id=course.id)
+    if ids is not None:
+        query = query.filter(Assignment.id.in_(ids))
+    rows = query.all()
+    summary = {'total': len(rows), 'fetched': 0, 'skipped': 0, 'empty': 0, 'failed': 0}
 
+    pending = {}
     for row in rows:
         if row.description and not force:
             summary['skipped'] += 1
-            continue
-        if not row.url:
+        elif not row.url:
             summary['empty'] += 1
-            continue
+        else:
+            pending[row.id] = row
 
-        detail = client.get_assignment_detail(row.url)
-        row.description = detail.get('description')
-        row.description_fetched_at = datetime.now()
-        db.commit()
+    def _fetch(task):
+        _, url = task
+        with executor.host(url):
+            return client.get_assignment_detail(url)
 
-        if row.description:
-            summary['fetched'] += 1
-        else:
-            summary['empty'] += 1
+    owned = executor is None
+    executor = executor or FetchExecutor()
+    try:
+        tasks = [(row_id, row.url) for row_id, row in pending.items()]
+        for (row_id, _), detail, error in executor.map('assignments', _fetch, tasks):
+            if error:
+                summary['failed'] += 1
+                logger.warning(f"assignment {row_id} detail failed: {type(error).__name__}: {error}")
+                continue
+            row = pending[row_id]
+            row.description = detail.get('description')
+            row.description_fetched_at = datetime.now()
+            db.commit()
+
+            if row.description:
+                summary['fetched'] += 1
+            else:
+                summary['empty'] += 1
+    finally:
+        if owned:
+            executor.close()
 
     return summary
 
 
-def build_course_files(session, db, course, ai_service=None, caption: bool = True,
-                       force: bool = False, on_progress=None) -> dict:
+class _FileStage:
     """
-    Build every file resource in a course. Commits after each file so an interrupted
-    run keeps its work.
+    The file stage's bookkeeping, shared by build_course_files and the pipelined
+    build: `tasks()` to fetch off-thread with `fetch`, and `apply` for each result on
+    the session's thread, which writes, commits and reports it.
     """
-    from database import FileResource
 
-    files = db.query(FileResource).filter_by(course_id=course.id).all()
-    summary = {'total': len(files), 'ok': 0, 'skipped': 0, 'empty': 0,
-               'error': 0, 'too_large': 0, 'chars': 0, 'captioned': 0}
-
-    for index, row in enumerate(files, start=1):
-        report = build_file(session, row, course.moodle_id, ai_service=ai_service,
-                            caption=caption, force=force)
-        db.commit()
-
-        key = report['status'] if report['status'] in summary else 'error'
-        summary[key] += 1
-        summary['chars'] += report['chars']
-        summary['captioned'] += report['captioned']
+    def __init__(self, session, db, course, ai_service=None, caption: bool = True,
+                 force: bool = False, on_progress=None, executor: FetchExecutor | None = None):
+        from database import FileResource
+
+        self.session, self.db, self.course = session, db, course
+        self.ai_service, self.caption, self.executor = ai_service, caption, executor
+        self.on_progress = on_progress
+        files = db.query(FileResource).filter_by(course_id=course.id).all()
+        self.total, self.done = len(files), 0
+        self.summary = {'total': len(files), 'ok': 0, 'skipped': 0, 'empty': 0,
+                        'error': 0, 'too_large': 0, 'chars': 0, 'captioned': 0}
+
+        self.pending = {}
+        for row in files:
+            report = _file_skip_report(row, force)
+            if report:
+                self._record(row, report)
+            else:
+                self.pending[row.id] = row
+
+    def tasks(self) -> list[dict]:
+        return [_file_task(row) for row in self.pending.values()]
+
+    def fetch(self, task: dict) -> tuple[dict, dict]:
+        return _fetch_file(self.session, task, self.course.moodle_id, ai_service=self.ai_service,
+                           caption=self.caption, executor=self.executor)
+
+    def apply(self, task: dict, result: tuple[dict, dict] | None, error: BaseException | None):
+        row = self.pending.pop(task['id'])
+        if error:
+            logger.error(f"brain build: file {task['id']} failed: {error}")
+            result = (
+                {'extract_status': 'error', 'extract_error': f"{type(error).__name__}: {error}",
+                 'extracted_at': datetime.now()},
+                {'title': task['title'], 'status': 'error', 'chars': 0, 'captioned': 0, 'error': str(error)},
+            )
+        fields, report = result
+        _apply_file(row, fields)
+        self.db.commit()
+        self._record(row, report)
+
+    def _record(self, row, report: dict):
+        self.done += 1
+        key = report['status'] if report['status'] in self.summary else 'error'
+        self.summary[key] += 1
+        self.summary['chars'] += report['chars']
+        self.summary['captioned'] += report['captioned']
 
         logger.info(
-            f"brain build course={course.moodle_id} [{index}/{len(files)}] "
+            f"brain build course={self.course.moodle_id} [{self.done}/{self.total}] "
             f"{report['status']} chars={report['chars']} cap={report['captioned']} "
             f"{(row.title or '')[:50]}"
         )
-        if on_progress:
-            on_progress(index, len(files), report)
+        if self.on_progress:
+            self.on_progress(self.done, self.total, report)
 
-    return summary
+
+def build_course_files(session, db, course, ai_service=None, caption: bool = True,
+                       force: bool = False, on_progress=None,
+                       executor: FetchExecutor | None = None) -> dict:
+    """
+    Build every file resource in a course, BRAIN_DOWNLOAD_CONCURRENCY files at a time.
+    Each result is written and committed on this thread as it arrives, so an
+    interrupted run keeps its work.
+    """
+    owned = executor is None
+    executor = executor or FetchExecutor()
+    try:
+        stage = _FileStage(session, db, course, ai_service=ai_service, caption=caption,
+                           force=force, on_progress=on_progress, executor=executor)
+        for task, result, error in executor.map('downloads', stage.fetch, stage.tasks()):
+            stage.apply(task, result, error)
+    finally:
+        if owned:
+            executor.close()
+
+    return stage.summary
 
 
 # ─── Whole-course build ───────────────────────────────────────────────────────
@@ -719,23 +1219,55 @@ def pending_work(db, course) -> dict:
             'total': files + vods + assignments}
 
 
+def _needs_transcript(row) -> bool:
+    """Whether a lecture's transcript row (or None) still has to be transcribed."""
+    done_already = row and row.transcript and row.status == 'done'
+    # Transcripts predating chunk timestamps have no leading marker, so they are redone
+    # once to make the chat's [[vod:...]] seek links land correctly.
+    timestamped = done_already and row.transcript.lstrip().startswith('[')
+    return not (done_already and timestamped)
+
+
 class _Skipped(Exception):
     """A stage the course's scope excludes. Not an error, so it is caught separately."""
 
 
+def _transcribe_lecture(client, ai_service, executor: FetchExecutor, vod_moodle_id: int,
+                        viewer_url: str | None, backend: str | None) -> str | None:
+    """Transcribe one lecture, off the session's thread. None when it has no stream URL."""
+    with executor.host(viewer_url or client.base_url):
+        stream = client.get_vod_stream_url(vod_moodle_id, viewer_url)
+    m3u8 = stream if isinstance(stream, str) else (stream or {}).get('m3u8_url')
+    if not m3u8:
+        return None
+    transcript, _usage = ai_service.transcribe_vod(m3u8, backend=backend)
+    return transcript
+
+
 def build_course_brain(client, db, course, ai_service, *, transcribe: bool = True,
-                       force: bool = False, on_stage=None, can_transcribe=None) -> dict:
+                       force: bool = False, on_stage=None, can_transcribe=None,
+                       transcribe_backend: str | None = None) -> dict:
     """
-    Bring a course's corpus up to date: assignment instructions, lecture transcripts,
-    then file text and captions.
+    Bring a course's corpus up to date: assignment instructions first, then lecture
+    transcripts and file text with captions side by side.
+
+    Transcription waits on the API and files on downloads, extraction and captioning,
+    so the two stages run as a pipeline through one FetchExecutor: lectures one after
+    another on their own thread, files alongside at the download limit. Their results
+    come back to this thread, which writes and commits each as it completes.
 
-    `on_stage(stage, done, total)` reports coarse progress for the UI. Every stage
-    commits as it goes, so a deploy that restarts the container mid-build loses only the
-    item in flight — the next run resumes from there rather than starting over.
+    `on_stage(stage, done, total)` reports coarse progress for the UI; with the two
+    stages overlapping, calls for 'vods' and 'files' interleave, each with its own
+    count. Every stage commits per item, so a deploy that restarts the container
+    mid-build loses only the items in flight — the next run resumes from there rather
+    than starting over.
 
     `can_transcribe()` is asked before each lecture and gates spend. Returning False
     stops the transcription stage cleanly rather than failing the build: what is already
-    done is kept, and the next run picks up where the budget ran out.
+    done is kept, and the next run picks up where the budget ran out. Files carry on.
+
+    `transcribe_backend` is handed to transcribe_vod ("openai" or "local"; None for the
+    configured default).
 
     Failure is per-item throughout. A lecture whose stream URL has expired records the
     error and the build moves on; one bad item must not cost the whole sweep.
@@ -745,98 +1277,191 @@ def build_course_brain(client, db, course, ai_service, *, transcribe: bool = Tru
     scope = scope_of(course)
     summary = {'assignments': {}, 'vods': {'total': 0, 'ok': 0, 'skipped': 0, 'failed': 0, 'deferred': 0},
                'files': {}, 'errors': [], 'scope': scope}
+    vod_summary = summary['vods']
 
     def stage(name, done, total):
         if on_stage:
             on_stage(name, done, total)
 
-    # 1. Assignment instructions. Cheap, and the answers lean on them heavily.
-    stage('assignments', 0, 1)
-    try:
-        if not scope['assignments']:
-            raise _Skipped()
-        summary['assignments'] = fetch_assignment_descriptions(client, db, course, force=force)
-    except _Skipped:
-        summary['assignments'] = {'skipped_by_scope': True}
-    except Exception as e:
-        logger.exception("brain build: assignment descriptions failed")
-        summary['errors'].append(f"assignments: {type(e).__name__}: {e}")
-    stage('assignments', 1, 1)
-
-    # 2. Lecture transcripts. The expensive stage, and the one most worth resuming:
-    #    each finished lecture is committed before the next begins.
-    if transcribe and scope['vods']:
-        vods = db.query(VOD).filter_by(course_id=course.id).all()
-        summary['vods']['total'] = len(vods)
-        for index, vod in enumerate(vods, start=1):
-            stage('vods', index - 1, len(vods))
-            row = db.query(VodTranscript).filter_by(moodle_id=vod.moodle_id).first()
-            done_already = row and row.transcript and row.status == 'done'
-            # Transcripts predating chunk timestamps have no leading marker, so they are
-            # redone once to make the chat's [[vod:...]] seek links land correctly.
-            timestamped = done_already and row.transcript.lstrip().startswith('[')
-            if done_already and timestamped and not force:
-                summary['vods']['skipped'] += 1
-                continue
+    with FetchExecutor() as executor:
+        # 1. Assignment instructions. Cheap, and the answers lean on them heavily.
+        stage('assignments', 0, 1)
+        try:
+            if not scope['assignments']:
+                raise _Skipped()
+            summary['assignments'] = fetch_assignment_descriptions(
+                client, db, course, force=force, executor=executor)
+        except _Skipped:
+            summary['assignments'] = {'skipped_by_scope': True}
+        except Exception as e:
+            logger.exception("brain build: assignment descriptions failed")
+            summary['errors'].append(f"assignments: {type(e).__name__}: {e}")
+        stage('assignments', 1, 1)
+
+        # 2. Lecture transcripts: decide here which still need doing. The expensive
+        #    stage, and the one most worth resuming: each lecture is committed as it lands.
+        lectures = []
+        if transcribe and scope['vods']:
+            vods = db.query(VOD).filter_by(course_id=course.id).all()
+            vod_summary['total'] = len(vods)
+            for vod in vods:
+                row = db.query(VodTranscript).filter_by(moodle_id=vod.moodle_id).first()
+                if not _needs_transcript(row) and not force:
+                    vod_summary['skipped'] += 1
+                else:
+                    lectures.append((vod.moodle_id, vod.url))
+            stage('vods', vod_summary['skipped'], len(vods))
+
+        # 3. File text and slide captions, fetched while the lectures transcribe.
+        files = None
+        try:
+            if not scope['files']:
+                raise _Skipped()
+            files = _FileStage(client.session, db, course, ai_service=ai_service, caption=True,
+                               force=force, on_progress=lambda done, total, _: stage('files', done, total),
+                               executor=executor)
+        except _Skipped:
+            summary['files'] = {'skipped_by_scope': True}
+        except Exception as e:
+            logger.exception("brain build: file build failed")
+            summary['errors'].append(f"files: {type(e).__name__}: {e}")
+
+        in_flight = {}
+
+        def transcribe_one(lecture):
+            return _transcribe_lecture(client, ai_service, executor, *lecture, transcribe_backend)
+
+        def next_lecture():
+            if not lectures:
+                return
             if can_transcribe is not None and not can_transcribe():
                 # Budget spent. Everything transcribed so far is committed, and the
                 # remaining lectures are simply still pending for the next run.
-                summary['vods']['deferred'] = len(vods) - index + 1
+                vod_summary['deferred'] = len(lectures)
+                lectures.clear()
                 logger.info(
                     f"brain build course={course.moodle_id}: transcription budget spent, "
-                    f"deferring {summary['vods']['deferred']} lectures"
+                    f"deferring {vod_summary['deferred']} lectures"
                 )
-                break
-            try:
-                stream = client.get_vod_stream_url(vod.moodle_id, vod.url)
-                m3u8 = stream if isinstance(stream, str) else (stream or {}).get('m3u8_url')
-                if not m3u8:
-                    summary['vods']['failed'] += 1
-                    summary['errors'].append(f"vod {vod.moodle_id}: no stream url")
+                return
+            lecture = lectures.pop(0)
+            in_flight[executor.submit('lectures', transcribe_one, lecture)] = ('vod', lecture[0])
+
+        next_lecture()
+        if files:
+            for task in files.tasks():
+                in_flight[executor.submit('downloads', files.fetch, task)] = ('file', task)
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                kind, item = in_flight.pop(future)
+                error = future.exception()
+                result = None if error else future.result()
+
+                if kind == 'file':
+                    try:
+                        files.apply(item, result, error)
+                    except Exception as e:
+                        db.rollback()
+                        summary['errors'].append(f"file {item['id']}: {type(e).__name__}: {e}")
+                        logger.exception(f"brain build: file {item['id']} failed")
                     continue
-                transcript, _usage = ai_service.transcribe_vod(m3u8)
-                if not row:
-                    row = VodTranscript(moodle_id=vod.moodle_id)
-                    db.add(row)
-                row.transcript = transcript
-                row.status = 'done'
-                row.stage = 'completed'
-                row.is_processing = False
-                row.progress_pct = 100
-                row.completed_at = datetime.now()
-                db.commit()
-                summary['vods']['ok'] += 1
-            except Exception as e:
-                db.rollback()
-                summary['vods']['failed'] += 1
-                summary['errors'].append(f"vod {vod.moodle_id}: {type(e).__name__}: {e}")
-                logger.exception(f"brain build: vod {vod.moodle_id} failed")
-        stage('vods', len(vods), len(vods))
-
-    # 3. File text and slide captions.
-    def file_progress(index, total, _report):
-        stage('files', index, total)
 
-    try:
-        if not scope['files']:
-            raise _Skipped()
-        summary['files'] = build_course_files(
-            client.session, db, course, ai_service=ai_service,
-            caption=True, force=force, on_progress=file_progress,
-        )
-    except _Skipped:
-        summary['files'] = {'skipped_by_scope': True}
-    except Exception as e:
-        logger.exception("brain build: file build failed")
-        summary['errors'].append(f"files: {type(e).__name__}: {e}")
+                try:
+                    if error:
+                        raise error
+                    if result is None:
+                        vod_summary['failed'] += 1
+                        summary['errors'].append(f"vod {item}: no stream url")
+                    else:
+                        row = db.query(VodTranscript).filter_by(moodle_id=item).first()
+                        if not row:
+                            row = VodTranscript(moodle_id=item)
+                            db.add(row)
+                        row.transcript = result
+                        row.status = 'done'
+                        row.stage = 'completed'
+                        row.is_processing = False
+                        row.progress_pct = 100
+                        row.completed_at = datetime.now()
+                        db.commit()
+                        vod_summary['ok'] += 1
+                except Exception as e:
+                    db.rollback()
+                    vod_summary['failed'] += 1
+                    summary['errors'].append(f"vod {item}: {type(e).__name__}: {e}")
+                    logger.exception(f"brain build: vod {item} failed")
+                stage('vods', vod_summary['skipped'] + vod_summary['ok'] + vod_summary['failed'],
+                      vod_summary['total'])
+                next_lecture()
+
+        if transcribe and scope['vods']:
+            stage('vods', vod_summary['total'], vod_summary['total'])
+        if files:
+            summary['files'] = files.summary
 
     return summary
 
 
+# Assignments per child job of a fanned-out build: each is one cheap page fetch, so they
+# go in batches rather than a job apiece.
+ASSIGNMENT_BATCH_SIZE = 20
+
+# The progress stage each kind of build item counts towards.
+ITEM_STAGES = {'assignments': 'assignments', 'vod': 'vods', 'file': 'files'}
+
+
+def plan_brain_build(db, course) -> list[dict]:
+    """
+    The items a build of this course still has to do, one child job payload each: a
+    batch of assignments, a lecture, or a file.
+
+    Reads only the database, so it can run in the request that enables a course. The
+    same skip rules as build_course_brain decide what is outstanding. Lectures and files
+    alternate, so the slots that pick the children up transcribe and extract side by
+    side rather than draining every lecture first.
+    """
+    from database import Assignment, FileResource, VOD, VodTranscript
+
+    scope = scope_of(course)
+    items = []
+
+    if scope['assignments']:
+        ids = [row.id for row in db.query(Assignment).filter(
+            Assignment.course_id == course.id,
+            Assignment.description.is_(None),
+            Assignment.url.isnot(None),
+        ).order_by(Assignment.id)]
+        for start in range(0, len(ids), ASSIGNMENT_BATCH_SIZE):
+            items.append({'item_type': 'assignments', 'item_ids': ids[start:start + ASSIGNMENT_BATCH_SIZE]})
+
+    lectures, files = [], []
+    if scope['vods']:
+        for vod in db.query(VOD).filter_by(course_id=course.id).order_by(VOD.id):
+            row = db.query(VodTranscript).filter_by(moodle_id=vod.moodle_id).first()
+            if _needs_transcript(row):
+                lectures.append({'item_type': 'vod', 'item_id': vod.id})
+    if scope['files']:
+        for row in db.query(FileResource).filter_by(course_id=course.id).order_by(FileResource.id):
+            if _file_skip_report(row, force=False) is None:
+                files.append({'item_type': 'file', 'item_id': row.id})
+
+    for index in range(max(len(lectures), len(files))):
+        items += lectures[index:index + 1] + files[index:index + 1]
+    return items
+
+
 def enqueue_brain_build(db, course, *, full: bool = False) -> bool:
     """
     Queue a build for this course unless one is already waiting or running.
 
+    The build is planned here into one child job per item (plan_brain_build) under a
+    'waiting' brain_build parent, so the worker slots and replicas share a course instead
+    of one thread doing all of it. The parent is never claimed: each child, as it starts
+    and finishes, updates the course's progress from its siblings, and the last one marks
+    the course ready (worker._settle_brain_build).
+
     Returns True if a job was created. The duplicate check matters because syncs are
     frequent: without it, an hourly sync of a course whose build is still running would
     pile up jobs that each redo the same work.
@@ -845,26 +1470,79 @@ def enqueue_brain_build(db, course, *, full: bool = False) -> bool:
 
     existing = db.query(Job).filter(
         Job.type == 'brain_build',
-        Job.status.in_(('pending', 'processing')),
-    ).all()
-    if any((j.payload or {}).get('course_id') == course.id for j in existing):
+        Job.course_id == course.id,
+        Job.status.in_(('waiting', 'pending', 'processing')),
+    ).first()
+    if existing:
         return False
 
-    db.add(Job(type='brain_build', payload={
+    items = plan_brain_build(db, course)
+    if not items:
+        # Everything in scope is already learned.
+        course.brain_status = 'ready'
+        course.brain_progress = 100
+        course.brain_stage = None
+        events.publish(db, course.owner_id, 'brain', events.brain_event(course))
+        db.commit()
+        return False
+
+    parent = Job(type='brain_build', status='waiting', payload={
         'course_id': course.id,
         'user_id': course.owner_id,
         'full': full,
-    }))
+    })
+    db.add(parent)
+    db.flush()
+    for item in items:
+        job_queue.enqueue(db, 'brain_build_item', {
+            'course_id': course.id,
+            'user_id': course.owner_id,
+            **item,
+        }, parent_id=parent.id)
+
     course.brain_status = 'queued'
     course.brain_stage = '대기 중'
     if full:
         course.brain_progress = 0
+    events.publish(db, course.owner_id, 'brain', events.brain_event(course))
     db.commit()
-    logger.info(f"brain build queued course={course.moodle_id} full={full}")
+    logger.info(f"brain build queued course={course.moodle_id} full={full} items={len(items)}")
     return True
 
 
-def build_single_item(client, db, course, ai_service, item_type: str, item_id: int) -> dict:
+def build_planned_item(client, db, course, ai_service, item: dict, *, can_transcribe=None,
+                       transcribe_backend: str | None = None) -> dict:
+    """
+    Do one item of a fanned-out build (see plan_brain_build).
+
+    Skips whatever a sibling, a manual learn or an earlier attempt already did, so a
+    retried child costs nothing. `can_transcribe()` is asked only for a lecture that still
+    needs transcribing; when it returns False nothing is done and the report's status is
+    'deferred', for the next build to pick up.
+    """
+    from database import VOD, VodTranscript
+
+    item_type = item['item_type']
+    if item_type == 'assignments':
+        summary = fetch_assignment_descriptions(client, db, course, ids=item['item_ids'])
+        return {'status': 'ok', **summary}
+
+    if item_type == 'vod':
+        vod = db.query(VOD).filter_by(id=item['item_id'], course_id=course.id).first()
+        if not vod:
+            return {'status': 'skipped', 'chars': 0, 'captioned': 0}
+        row = db.query(VodTranscript).filter_by(moodle_id=vod.moodle_id).first()
+        if not _needs_transcript(row):
+            return {'status': 'skipped', 'chars': len(row.transcript), 'captioned': 0}
+        if can_transcribe is not None and not can_transcribe():
+            return {'status': 'deferred', 'chars': 0, 'captioned': 0}
+
+    return build_single_item(client, db, course, ai_service, item_type, item['item_id'],
+                             transcribe_backend=transcribe_backend)
+
+
+def build_single_item(client, db, course, ai_service, item_type: str, item_id: int, *,
+                      transcribe_backend: str | None = None) -> dict:
     """
     Learn one item on demand.
 
@@ -878,8 +1556,9 @@ def build_single_item(client, db, course, ai_service, item_type: str, item_id: i
         row = db.query(FileResource).filter_by(id=item_id, course_id=course.id).first()
         if not row:
             raise ValueError(f"File {item_id} not in course {course.id}")
-        report = build_file(client.session, row, course.moodle_id,
-                            ai_service=ai_service, caption=True, force=False)
+        with FetchExecutor() as executor:
+            report = build_file(client.session, row, course.moodle_id, ai_service=ai_service,
+                                caption=True, force=False, executor=executor)
         db.commit()
         return report
 
@@ -891,7 +1570,7 @@ def build_single_item(client, db, course, ai_service, item_type: str, item_id: i
         m3u8 = stream if isinstance(stream, str) else (stream or {}).get('m3u8_url')
         if not m3u8:
             raise ValueError("No stream URL for this lecture")
-        transcript, _usage = ai_service.transcribe_vod(m3u8)
+        transcript, _usage = ai_service.transcribe_vod(m3u8, backend=transcribe_backend)
         row = db.query(VodTranscript).filter_by(moodle_id=vod.moodle_id).first()
         if not row:
             row = VodTranscript(moodle_id=vod.moodle_id)
@@ -920,16 +1599,14 @@ def build_single_item(client, db, course, ai_service, item_type: str, item_id: i
 
 def enqueue_item_learn(db, course, item_type: str, item_id: int) -> bool:
     """Queue one item unless the same item is already waiting or running."""
-    from database import Job
-
     if (item_type, item_id) in queued_items(db, course):
         return False
-    db.add(Job(type='brain_learn_item', payload={
+    job_queue.enqueue(db, 'brain_learn_item', {
         'course_id': course.id,
         'user_id': course.owner_id,
         'item_type': item_type,
         'item_id': item_id,
-    }))
+    })
     db.commit()
     logger.info(f"brain learn queued course={course.moodle_id} {item_type}:{item_id}")
     return True
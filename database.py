@@ -1,11 +1,12 @@
+import json
 import os
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint, JSON, Enum as SAEnum
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, Boolean, DateTime, Float, ForeignKey, Text, UniqueConstraint, JSON, Enum as SAEnum
 
 logger = logging.getLogger(__name__)
 
 
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.orm import Session, attributes, declarative_base, relationship, sessionmaker
 from datetime import datetime
 
 Base = declarative_base()
@@ -117,6 +118,10 @@ class Course(Base):
     brain_stage = Column(String, nullable=True)      # human label, e.g. "강의 4/12 변환 중"
     brain_error = Column(Text, nullable=True)
     brain_built_at = Column(DateTime, nullable=True)
+    # Bumped in the same flush as any change to what assemble_corpus reads (see
+    # _bump_corpus_versions), so an assembled corpus is current exactly while its
+    # version matches.
+    brain_corpus_version = Column(Integer, default=0, nullable=False)
 
     owner = relationship("User", back_populates="courses")
     
@@ -182,6 +187,9 @@ class VodTranscript(Base):
     status = Column(String, default='queued')  # queued | running | done | failed
     stage = Column(String, nullable=True)      # queued | extracting_audio | transcribing | finalizing | completed | failed
     progress_pct = Column(Integer, default=0)
+    # Exact length from the HLS playlist, written when a transcription starts; the
+    # scraped vods.duration is rounded and missing for some lectures.
+    media_duration_s = Column(Float, nullable=True)
     transcript = Column(Text, nullable=True)
     summary = Column(Text, nullable=True)
     error_message = Column(Text, nullable=True)
@@ -189,6 +197,33 @@ class VodTranscript(Base):
     completed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
+class TranscriptChunk(Base):
+    """
+    One transcribed chunk of a lecture still in progress — a checkpoint, so a retried
+    transcription re-extracts and re-bills only the chunks it does not have, and what the
+    transcript stream sends the app before the whole lecture is done.
+
+    Keyed by chunk length as well as index: chunk 3 of a 120 s split is not chunk 3 of a
+    60 s one, so a changed TRANSCRIBE_CHUNK_SECONDS simply starts over. Rows are deleted
+    once the full transcript is written to `vod_transcripts`. A chunk is never updated in
+    place: a re-cut replaces its row, so every write gets a higher id than the last.
+    """
+    __tablename__ = 'transcript_chunks'
+    __table_args__ = (
+        UniqueConstraint('vod_moodle_id', 'chunk_seconds', 'chunk_index', name='_transcript_chunk_uc'),
+        # Never reuse the id of a deleted row (SQLite otherwise does for the highest one).
+        {'sqlite_autoincrement': True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    vod_moodle_id = Column(Integer, index=True, nullable=False)
+    chunk_seconds = Column(Integer, nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    start_s = Column(Float, nullable=False)
+    end_s = Column(Float, nullable=False)
+    text = Column(Text, nullable=False, default='')
+    created_at = Column(DateTime, default=datetime.now)
+
 class FileResource(Base):
     __tablename__ = 'files'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -256,16 +291,78 @@ class Post(Base):
 class Job(Base):
     """Persistent job queue — processed by the worker container."""
     __tablename__ = 'jobs'
+    # Queue position: the active jobs of one type, in arrival order.
+    __table_args__ = (Index('ix_jobs_queue', 'type', 'status', 'created_at'),)
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     type = Column(String, nullable=False)           # 'transcribe' | 'watch_all' | 'watch_one'
     payload = Column(JSON, nullable=False)          # job-specific data
-    status = Column(String, default='pending')      # pending | processing | done | failed
+    status = Column(String, default='pending')      # pending | processing | done | failed | deferred | waiting
     created_at = Column(DateTime, default=datetime.now)
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error = Column(Text, nullable=True)
 
+    # Lease held by the worker running the job, refreshed by its heartbeat. A job whose
+    # lease has lapsed belongs to a worker that died, and is the only kind another worker
+    # may take back — resetting every 'processing' row at startup re-ran jobs that a
+    # second, live worker was still in the middle of.
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # Claims so far, and the earliest time a reclaimed job may be claimed again. Together
+    # they stop a job that kills its worker from looping forever.
+    attempts = Column(Integer, default=0)
+    run_after = Column(DateTime, nullable=True)
+
+    # Copied out of the payload on insert (see _job_keys_from_payload), so "this lecture's
+    # job", "this course's jobs" and fair share by user are index lookups instead of a
+    # scan that parses every queued payload.
+    vod_moodle_id = Column(Integer, index=True, nullable=True)
+    course_id = Column(Integer, index=True, nullable=True)
+    user_id = Column(Integer, index=True, nullable=True)
+
+    # A job that fans out (a brain build) stays 'waiting', which no worker claims, while
+    # its children run; each child points back here, and the last to finish settles it.
+    parent_id = Column(Integer, ForeignKey('jobs.id'), index=True, nullable=True)
+
+
+JOB_KEYS = ('vod_moodle_id', 'course_id', 'user_id')
+
+
+def job_keys(payload) -> dict:
+    """The indexed key columns for a job payload; absent or non-integer keys stay null."""
+    if not isinstance(payload, dict):
+        return {}
+    keys = {}
+    for key in JOB_KEYS:
+        value = payload.get(key)
+        if isinstance(value, int) and not isinstance(value, bool):
+            keys[key] = value
+    return keys
+
+
+@event.listens_for(Job, 'before_insert')
+def _job_keys_from_payload(mapper, connection, job):
+    for key, value in job_keys(job.payload).items():
+        if getattr(job, key) is None:
+            setattr(job, key, value)
+
+
+class CorpusCache(Base):
+    """
+    A course's last assembled brain corpus and its source list, so a chat about an
+    unchanged course (or the first one after an API restart) skips assembly. Valid only
+    while `version` equals the course's `brain_corpus_version`; see course_brain.cached_corpus.
+    """
+    __tablename__ = 'corpus_cache'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    course_id = Column(Integer, unique=True, index=True, nullable=False)
+    version = Column(Integer, nullable=False)
+    corpus = Column(Text, nullable=False)
+    sources = Column(JSON, nullable=False)
+    assembled_at = Column(DateTime, default=datetime.now)
+
 
 class AIUsageLog(Base):
     """Tracks OpenAI token usage per user per request for cost monitoring."""
@@ -308,6 +405,19 @@ class Flashcard(Base):
     deck = relationship("FlashcardDeck", back_populates="cards")
 
 
+class EtaModel(Base):
+    """
+    Coefficients the worker fits from its timing log (see eta_model.py), stored here so
+    the API, which cannot read the worker's disk, can use them. One row per model name.
+    """
+    __tablename__ = 'eta_models'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, unique=True, nullable=False)
+    coefficients = Column(JSON, nullable=False)
+    samples = Column(Integer, default=0)             # jobs the fit was made from
+    fitted_at = Column(DateTime, default=datetime.now)
+
 class LoginDebugReport(Base):
     __tablename__ = 'login_debug_reports'
 
@@ -316,6 +426,61 @@ class LoginDebugReport(Base):
     log_json = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
+# What assemble_corpus reads from each model. A new or deleted row with any of these set,
+# or a change to one of them, bumps the owning course's corpus version. Progress writes
+# to vod_transcripts and sync bookkeeping touch none of them, so they leave caches alone.
+_CORPUS_FIELDS = {
+    Course: ('name',),
+    FileResource: ('course_id', 'title', 'section', 'week', 'file_kind', 'content'),
+    VOD: ('course_id', 'moodle_id', 'title', 'section', 'week'),
+    VodTranscript: ('transcript',),
+    Assignment: ('course_id', 'title', 'section', 'week', 'due_date', 'description'),
+    Board: ('course_id', 'title', 'section', 'week'),
+    Post: ('board_id', 'title', 'writer', 'date', 'content'),
+}
+
+
+def _corpus_courses(session, obj, fields) -> set:
+    """Ids of the courses whose corpus includes `obj`, before and after this flush."""
+    def values(field):
+        history = attributes.get_history(obj, field)
+        return {v for v in (*history.added, *history.unchanged, *history.deleted) if v is not None}
+
+    if isinstance(obj, Course):
+        return {obj.id} if obj.id is not None else set()
+    if isinstance(obj, VodTranscript):
+        moodle_ids = values('moodle_id')
+        return {c for (c,) in session.query(VOD.course_id).filter(VOD.moodle_id.in_(moodle_ids))} if moodle_ids else set()
+    if isinstance(obj, Post):
+        board_ids = values('board_id') | ({obj.board.id} if obj.board is not None and obj.board.id else set())
+        return {c for (c,) in session.query(Board.course_id).filter(Board.id.in_(board_ids))} if board_ids else set()
+    return values('course_id')
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_corpus_versions(session, flush_context, instances):
+    touched = set()
+    with session.no_autoflush:
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            fields = _CORPUS_FIELDS.get(type(obj))
+            if not fields:
+                continue
+            if obj in session.dirty and not any(attributes.get_history(obj, f).has_changes() for f in fields):
+                continue
+            if obj in session.new and all(getattr(obj, f) is None for f in fields if f != 'course_id'):
+                continue
+            if isinstance(obj, Course) and obj in session.deleted:
+                session.query(CorpusCache).filter(CorpusCache.course_id == obj.id).delete(synchronize_session=False)
+                continue
+            touched |= _corpus_courses(session, obj, fields)
+        for course_id in touched:
+            course = session.get(Course, course_id)
+            if course is not None and course not in session.deleted:
+                # An SQL increment, not a read-modify-write: two writers bumping at once
+                # must leave the version changed twice, or a cache could outlive one of them.
+                course.brain_corpus_version = Course.brain_corpus_version + 1
+
+
 def init_db(db_url=None):
     if not db_url:
         db_url = os.getenv('DATABASE_URL', 'sqlite:///learnus.db')
@@ -401,6 +566,49 @@ def init_db(db_url=None):
         Job.__table__.create(engine)
         logger.info("Created jobs table")
 
+    # Migration: job leases. Existing rows get attempts=0 and no lease; a 'processing' row
+    # without a lease is treated as expired once it is older than a lease would be.
+    if 'jobs' in sa_inspect(engine).get_table_names():
+        for _col, _ddl in (
+            ('lease_owner',      "ALTER TABLE jobs ADD COLUMN lease_owner VARCHAR"),
+            ('lease_expires_at', "ALTER TABLE jobs ADD COLUMN lease_expires_at TIMESTAMP"),
+            ('attempts',         "ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0"),
+            ('run_after',        "ALTER TABLE jobs ADD COLUMN run_after TIMESTAMP"),
+        ):
+            _add_column_if_missing('jobs', _col, _ddl)
+
+    # Migration: parent jobs. Existing jobs have none.
+    if 'jobs' in sa_inspect(engine).get_table_names():
+        _add_column_if_missing('jobs', 'parent_id', "ALTER TABLE jobs ADD COLUMN parent_id INTEGER REFERENCES jobs(id)")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_parent_id ON jobs (parent_id)"))
+
+    # Migration: indexed job keys. Only jobs still queued or running are backfilled —
+    # finished ones are never looked up by key. Plain SQL rather than the Job model, which
+    # would select every column the model has grown since, present or not.
+    if 'jobs' in sa_inspect(engine).get_table_names():
+        added = [
+            _add_column_if_missing('jobs', _col, f"ALTER TABLE jobs ADD COLUMN {_col} INTEGER")
+            for _col in JOB_KEYS
+        ]
+        with engine.begin() as conn:
+            for _col in JOB_KEYS:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_jobs_{_col} ON jobs ({_col})"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_queue ON jobs (type, status, created_at)"))
+        if any(added):
+            with engine.begin() as conn:
+                active = conn.execute(text(
+                    "SELECT id, payload FROM jobs WHERE status IN ('pending', 'processing')"
+                )).all()
+                for job_id, payload in active:
+                    if isinstance(payload, str):
+                        payload = json.loads(payload)
+                    keys = job_keys(payload)
+                    if keys:
+                        assignments = ', '.join(f"{key} = :{key}" for key in keys)
+                        conn.execute(text(f"UPDATE jobs SET {assignments} WHERE id = :id"), {**keys, 'id': job_id})
+            logger.info(f"Backfilled job keys for {len(active)} active jobs")
+
     # Migration: add transcription rate limit columns to users
     if 'transcribe_count_today' not in existing_cols:
         with engine.connect() as conn:
@@ -451,6 +659,11 @@ def init_db(db_url=None):
     if 'vods' in refreshed_tables:
         _add_column_if_missing('vods', 'duration', "ALTER TABLE vods ADD COLUMN duration INTEGER")
 
+    # Migration: playlist-derived media duration on transcripts.
+    if 'vod_transcripts' in refreshed_tables:
+        _add_column_if_missing('vod_transcripts', 'media_duration_s',
+                               "ALTER TABLE vod_transcripts ADD COLUMN media_duration_s FLOAT")
+
     # Migration: course brain opt-in, separate from auto-watch.
     if 'users' in refreshed_tables:
         _add_column_if_missing('users', 'brain_enabled',
@@ -488,6 +701,7 @@ def init_db(db_url=None):
             ('brain_stage',    "ALTER TABLE courses ADD COLUMN brain_stage VARCHAR"),
             ('brain_error',    "ALTER TABLE courses ADD COLUMN brain_error TEXT"),
             ('brain_built_at', "ALTER TABLE courses ADD COLUMN brain_built_at TIMESTAMP"),
+            ('brain_corpus_version', "ALTER TABLE courses ADD COLUMN brain_corpus_version INTEGER NOT NULL DEFAULT 0"),
         ):
             _add_column_if_missing('courses', _col, _ddl)
 
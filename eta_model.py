@@ -0,0 +1,259 @@
+"""
+Transcription ETAs fitted from the worker's timing log rather than hand-tuned constants.
+
+Each finished transcription appends its lecture length and per-stage durations to
+TRANSCRIBE_TIMING_LOG_PATH. `fit` turns the recent ones into, per backend and per stage,
+a least-squares line `seconds = intercept + per_media_second * media_duration_s`, plus
+the spread of whole-job times around the fitted total, which becomes the low/high band.
+The worker refits every TRANSCRIBE_ETA_REFIT_MINUTES and stores the result in the
+`eta_models` table, because the log lives on the worker's disk and the status endpoint
+runs in the API. The API reads it back through `load`, cached for a minute.
+
+`estimate` covers a whole job: the wait for a slot, from how many transcriptions are
+ahead and how many the workers run at once, then the stages still to run, with the
+current one scaled by its progress. Until enough jobs have been logged there is no model
+and the status endpoint keeps `heuristic_eta`, which is also what the offline evaluation
+(scripts/eval_eta_model.py) scores the model against.
+"""
+import json
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+from database import EtaModel
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_MODEL_NAME = 'transcribe'
+STAGES = ('extracting_audio', 'transcribing', 'finalizing')
+# Jobs a backend needs in the log before its fit replaces the heuristic.
+MIN_SAMPLES = 8
+# Only the most recent jobs are fitted, so the model follows changes in chunking,
+# concurrency or provider speed instead of averaging them with months-old runs.
+MAX_SAMPLES = 2000
+# The band is the 10th-90th percentile of actual/predicted job time.
+BAND_QUANTILES = (0.1, 0.9)
+CACHE_SECONDS = 60
+
+_cache: tuple[float, dict | None] | None = None
+
+
+# ─── Heuristic ────────────────────────────────────────────────────────────────
+
+def heuristic_eta(
+    vod_duration: int | None,
+    queue_ahead: int,
+    stage: str | None,
+    progress_pct: int | None = None,
+    elapsed_seconds: int | None = None,
+) -> dict:
+    """The hand-tuned estimate, used until there is a fitted model."""
+    # Baseline for queued jobs; refined below with live progress when available.
+    base = 150 if not vod_duration else max(90, min(1500, int(vod_duration * 0.45)))
+    low = base
+    high = int(base * 1.5)
+
+    if queue_ahead > 0:
+        low += queue_ahead * 60
+        high += queue_ahead * 150
+
+    if stage == "transcribing":
+        low = max(20, int(low * 0.25))
+        high = max(60, int(high * 0.45))
+    elif stage == "finalizing":
+        low = 8
+        high = 35
+
+    # If we have live progress while running, extrapolate from it instead.
+    if elapsed_seconds and progress_pct and progress_pct > 4:
+        remaining = int(elapsed_seconds * (100 - progress_pct) / progress_pct)
+        remaining = max(5, min(3600, remaining))
+        low = max(8, int(remaining * 0.75))
+        high = max(low + 15, int(remaining * 1.35))
+        if stage == "finalizing":
+            low = min(low, 20)
+            high = min(high, 60)
+
+    return {"low": low, "high": high}
+
+
+# ─── Fitting ──────────────────────────────────────────────────────────────────
+
+def read_timing_log(path: str, limit: int = MAX_SAMPLES) -> list[dict]:
+    """The last `limit` successful transcriptions in the log that recorded a lecture length."""
+    rows: deque = deque(maxlen=limit)
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if (row.get("type") == "transcribe_timing" and row.get("status") == "done"
+                        and row.get("media_duration_s") and row.get("total_s")):
+                    rows.append(row)
+    except FileNotFoundError:
+        return []
+    return list(rows)
+
+
+def _line(xs: list[float], ys: list[float]) -> tuple[float, float]:
+    """Least-squares intercept and slope, neither allowed below zero."""
+    n = len(xs)
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x if var_x else 0.0
+    slope = max(0.0, slope)
+    intercept = mean_y - slope * mean_x
+    if intercept < 0:
+        # A line through the origin instead: no lecture takes negative time.
+        intercept = 0.0
+        slope = sum(x * y for x, y in zip(xs, ys)) / sum(x * x for x in xs)
+    return round(intercept, 3), round(slope, 5)
+
+
+def _quantile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _fit_backend(rows: list[dict]) -> dict:
+    durations = [float(r["media_duration_s"]) for r in rows]
+    stages = {}
+    for stage in STAGES:
+        # A job that never reached a stage spent no time in it.
+        stages[stage] = _line(durations, [float((r.get("stage_durations_s") or {}).get(stage, 0.0)) for r in rows])
+    total = _line(durations, [float(r["total_s"]) for r in rows])
+    ratios = [float(r["total_s"]) / max(1.0, total[0] + total[1] * d) for r, d in zip(rows, durations)]
+    low, high = (_quantile(ratios, q) for q in BAND_QUANTILES)
+    return {
+        "samples": len(rows),
+        "stages": stages,
+        "total": total,
+        "mean_total_s": round(sum(float(r["total_s"]) for r in rows) / len(rows), 1),
+        "band": [round(min(low, 1.0), 3), round(max(high, 1.0), 3)],
+    }
+
+
+def fit(rows: list[dict], *, slots_per_worker: int) -> dict | None:
+    """
+    Coefficients for every backend with at least MIN_SAMPLES jobs in `rows`, or None if
+    none has. `default` is the backend with the most jobs: the status endpoint cannot
+    tell which one a queued job will be routed to, so it assumes the usual one.
+    """
+    by_backend: dict[str, list[dict]] = {}
+    for row in rows:
+        by_backend.setdefault(row.get("backend") or "openai", []).append(row)
+    backends = {b: _fit_backend(rs) for b, rs in by_backend.items() if len(rs) >= MIN_SAMPLES}
+    if not backends:
+        return None
+    return {
+        "backends": backends,
+        "default": max(backends, key=lambda b: backends[b]["samples"]),
+        "slots_per_worker": max(1, slots_per_worker),
+    }
+
+
+def refit(SessionLocal, log_path: str, *, slots_per_worker: int) -> dict | None:
+    """Fit from the timing log and store the result. Keeps the stored model if too few jobs are logged."""
+    rows = read_timing_log(log_path)
+    coefficients = fit(rows, slots_per_worker=slots_per_worker)
+    if coefficients is None:
+        logger.info(f"ETA model not refitted: {len(rows)} usable jobs in {log_path}")
+        return None
+    db = SessionLocal()
+    try:
+        stored = db.query(EtaModel).filter(EtaModel.name == TRANSCRIBE_MODEL_NAME).first()
+        if not stored:
+            stored = EtaModel(name=TRANSCRIBE_MODEL_NAME)
+            db.add(stored)
+        stored.coefficients = coefficients
+        stored.samples = len(rows)
+        stored.fitted_at = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+    logger.info(
+        "ETA model refitted: " + ", ".join(
+            f"{b}(samples={m['samples']} total={m['total'][0]:.0f}s+{m['total'][1]:.3f}x band={m['band']})"
+            for b, m in coefficients["backends"].items()
+        )
+    )
+    return coefficients
+
+
+def load(db) -> dict | None:
+    """The stored coefficients, re-read at most every CACHE_SECONDS."""
+    global _cache
+    now = time.monotonic()
+    if _cache is None or now - _cache[0] >= CACHE_SECONDS:
+        stored = db.query(EtaModel).filter(EtaModel.name == TRANSCRIBE_MODEL_NAME).first()
+        _cache = (now, stored.coefficients if stored else None)
+    return _cache[1]
+
+
+def clear_cache() -> None:
+    global _cache
+    _cache = None
+
+
+# ─── Estimating ───────────────────────────────────────────────────────────────
+
+def _stage_fraction(stage: str, progress_pct: int | None) -> float:
+    """How far through `stage` a job is, from the overall percentage the worker writes."""
+    pct = progress_pct or 0
+    # The inverse of worker._to_overall_progress.
+    if stage == "extracting_audio":
+        return min(1.0, max(0.0, (pct - 5) / 5))
+    if stage == "transcribing":
+        return min(1.0, max(0.0, (pct - 10) / 85))
+    if stage == "finalizing":
+        return min(1.0, max(0.0, (pct - 95) / 4))
+    return 0.0
+
+
+def estimate(
+    coefficients: dict,
+    media_duration_s: float | None,
+    queue_ahead: int,
+    slots: int,
+    stage: str | None,
+    progress_pct: int | None = None,
+) -> dict | None:
+    """
+    Seconds until the job is done as {"low", "high"}, or None without a lecture length
+    (which the fit is a function of).
+
+    `queue_ahead` is how many active transcriptions are ahead of this one and `slots`
+    how many the workers run at once. The first `slots` of those are already running;
+    each one after that holds this job back by the average logged job time divided across
+    the slots.
+    """
+    if not media_duration_s:
+        return None
+    model = coefficients["backends"][coefficients["default"]]
+
+    def predicted(line) -> float:
+        return line[0] + line[1] * media_duration_s
+
+    if stage in STAGES:
+        remaining = 0.0
+        for name in STAGES[STAGES.index(stage):]:
+            seconds = predicted(model["stages"][name])
+            if name == stage:
+                seconds *= 1.0 - _stage_fraction(stage, progress_pct)
+            remaining += seconds
+        wait = 0.0
+    else:
+        remaining = predicted(model["total"])
+        waiting_for = max(0, queue_ahead - max(1, slots) + 1)
+        wait = waiting_for * model["mean_total_s"] / max(1, slots)
+
+    low_ratio, high_ratio = model["band"]
+    low = max(5, int(wait + remaining * low_ratio))
+    high = max(low + 10, int(math.ceil(wait + remaining * high_ratio)))
+    return {"low": low, "high": high}
@@ -0,0 +1,219 @@
+"""
+Progress events pushed to the app, one SSE stream per user, instead of the app polling a
+status endpoint per progress bar.
+
+Publishers call `publish` inside the transaction that writes the change, so a stream
+never shows progress that was rolled back. On PostgreSQL that is a NOTIFY on
+EVENTS_CHANNEL — delivered on commit, like the job wakeup in job_queue — and every API
+process keeps one LISTEN connection that fans events out to the streams it has open.
+SQLite has no NOTIFY, so there events go to this process's broker when the session
+commits: enough for tests and anything published by the API itself. The worker is a
+separate process, so on SQLite `/events` also re-reads the user's state every few seconds,
+the same polling trade job_queue makes for local development.
+
+Events carry state only — stage, percent, status — never transcript text.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+import job_queue
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'learnus_events'
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more. Events are a few hundred; one
+# that is somehow larger is dropped (logged) and the app catches up on its next snapshot.
+MAX_PAYLOAD_BYTES = 7500
+# Events buffered per open stream. A client that falls this far behind gets one resync
+# (a fresh snapshot) instead of the backlog.
+SUBSCRIBER_BACKLOG = 256
+# Open streams per user in one API process. Opening another closes the user's oldest,
+# which is usually one a dropped connection left behind.
+MAX_SUBSCRIBERS_PER_USER = 3
+MAX_ERROR_CHARS = 300
+
+RESYNC = 'resync'
+CLOSE = 'close'
+_PENDING = 'learnus_pending_events'
+
+
+# ─── Event shapes ─────────────────────────────────────────────────────────────
+# Built here rather than at each publisher, so the worker and the API's snapshot agree.
+
+def transcribe_event(row) -> dict:
+    """A `vod_transcripts` row: the fields that drive a transcription progress bar."""
+    return {
+        'vod_moodle_id': row.moodle_id,
+        'status': row.status,
+        'stage': row.stage,
+        'progress_pct': row.progress_pct or 0,
+        'error_message': (row.error_message or '')[:MAX_ERROR_CHARS] or None,
+    }
+
+
+def brain_event(course) -> dict:
+    """A course's brain build state, as the toggle row shows it."""
+    return {
+        'course_id': course.id,
+        'status': course.brain_status,
+        'progress': course.brain_progress or 0,
+        'stage': course.brain_stage,
+        'error': (course.brain_error or '')[:MAX_ERROR_CHARS] or None,
+    }
+
+
+def job_event(job) -> dict:
+    """A job that has finished, for the app to refresh whatever it changed."""
+    return {
+        'job_id': job.id,
+        'type': job.type,
+        'status': job.status,
+        'vod_moodle_id': job.vod_moodle_id,
+        'course_id': job.course_id,
+    }
+
+
+# ─── Publishing ───────────────────────────────────────────────────────────────
+
+def publish(db, user_ids, event: str, data: dict) -> None:
+    """
+    Send `event` to each of `user_ids` (one id, or several) once the session's transaction
+    commits. Does not commit; nothing is sent if the transaction rolls back.
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    users = sorted({int(u) for u in user_ids if u is not None})
+    if not users:
+        return
+    message = json.dumps({'users': users, 'event': event, 'data': data}, ensure_ascii=False, default=str)
+    if job_queue.is_postgres(db):
+        if len(message.encode()) > MAX_PAYLOAD_BYTES:
+            logger.warning(f"Dropped oversized {event} event ({len(message.encode())} bytes)")
+            return
+        job_queue.notify(db, EVENTS_CHANNEL, message)
+    else:
+        # Held until the transaction ends, which needs there to be one (publishers nearly
+        # always have written something already).
+        if not db.in_transaction():
+            db.begin()
+        db.info.setdefault(_PENDING, []).append(message)
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _deliver_on_commit(session):
+    for message in session.info.pop(_PENDING, ()):
+        broker.dispatch(message)
+
+
+@sa_event.listens_for(Session, 'after_soft_rollback')
+def _drop_on_rollback(session, previous_transaction):
+    # Fires for savepoints too; only the outermost rollback discards the transaction's events.
+    if not session.in_transaction():
+        session.info.pop(_PENDING, None)
+
+
+# ─── Fan-out ──────────────────────────────────────────────────────────────────
+
+class Subscription:
+    """One open stream's inbox. Filled from any thread, read on the stream's event loop."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+
+    def push(self, item) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            pass  # the stream's loop has closed; it is about to unsubscribe
+
+    def _put(self, item) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait((RESYNC, None))
+
+    async def get(self, timeout: float):
+        """The next (event, data), or None if `timeout` passes first."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    """
+    Routes events to the streams open in this process. `listen(engine)` adds the
+    PostgreSQL feed; until then (and always on SQLite) only same-process events arrive,
+    which is what `cross_process` tells the streams.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, list[Subscription]] = {}
+        self._listener = None
+        self.cross_process = False
+
+    def listen(self, engine) -> 'Broker':
+        with self._lock:
+            if self._listener is None and job_queue.is_postgres(engine):
+                self._listener = job_queue.PgListener(engine, EVENTS_CHANNEL, self._on_notify,
+                                                      name='events-listener').start()
+                self.cross_process = True
+        return self
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Call on the stream's event loop. Past MAX_SUBSCRIBERS_PER_USER, the user's oldest
+        streams are sent CLOSE and stop receiving events."""
+        sub = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            subs = self._subscribers.setdefault(user_id, [])
+            subs.append(sub)
+            evicted = subs[:-MAX_SUBSCRIBERS_PER_USER]
+            del subs[:-MAX_SUBSCRIBERS_PER_USER]
+        for old in evicted:
+            old.push((CLOSE, None))
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs and sub in subs:
+                subs.remove(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def dispatch(self, message: str) -> None:
+        try:
+            parsed = json.loads(message)
+            users, item = parsed['users'], (parsed['event'], parsed['data'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignored malformed progress event")
+            return
+        with self._lock:
+            targets = [sub for user in users for sub in self._subscribers.get(user, ())]
+        for sub in targets:
+            sub.push(item)
+
+    def _on_notify(self, payload: str | None) -> None:
+        if payload is not None:
+            self.dispatch(payload)
+            return
+        # (Re)connected: anything sent while the listener was down is lost, so every open
+        # stream re-reads its state.
+        with self._lock:
+            targets = [sub for subs in self._subscribers.values() for sub in subs]
+        for sub in targets:
+            sub.push((RESYNC, None))
+
+
+broker = Broker()
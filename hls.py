@@ -0,0 +1,327 @@
+"""
+Reading HLS playlists directly, instead of asking ffprobe.
+
+A lecture's media playlist already lists every segment with its exact length (#EXTINF),
+so the duration is one small GET away. ffprobe got the same number by opening the
+stream — another round trip to LearnUs's media server before every transcription — and
+gave nothing else. The parsed playlist also carries the segment list, which is what
+chunk planning and the transcription ETA want.
+
+Only the audio is ever used, so a master playlist is followed to its audio-only rendition
+when it has one, and otherwise to its smallest variant.
+"""
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import urljoin
+
+import requests
+import requests.adapters
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT_SECONDS = 15
+# A three-hour lecture in 10 s segments is ~100 KB of playlist.
+MAX_PLAYLIST_BYTES = 4 * 1024 * 1024
+FETCH_ATTEMPTS = 3
+
+# Segments fetched at once per lecture, how far ahead of ffmpeg they may get, and where
+# they are kept until ffmpeg has read them.
+DOWNLOAD_CONCURRENCY = max(1, int(os.getenv('HLS_DOWNLOAD_CONCURRENCY', '6')))
+PREFETCH_SEGMENTS = max(1, int(os.getenv('HLS_PREFETCH_SEGMENTS', '12')))
+CACHE_DIR = os.getenv('HLS_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'learnus_hls'))
+
+
+@dataclass
+class Segment:
+    uri: str          # absolute, resolved against the playlist's URL
+    duration: float
+    start: float      # offset from the start of the lecture
+
+
+@dataclass
+class Playlist:
+    url: str
+    segments: list[Segment] = field(default_factory=list)
+    target_duration: float | None = None
+    ended: bool = False   # #EXT-X-ENDLIST: a finished VOD, not a live window
+    map_uri: str | None = None   # #EXT-X-MAP: fMP4 init segment, prepended to the media
+    encrypted: bool = False      # #EXT-X-KEY: segments are only decryptable by ffmpeg itself
+
+    @property
+    def duration(self) -> float:
+        return sum(s.duration for s in self.segments)
+
+
+def parse_playlist(text: str, url: str) -> tuple[Playlist | None, str | None]:
+    """
+    Parse playlist text fetched from `url`.
+
+    Returns (playlist, None) for a media playlist, or (None, variant_url) for a master
+    playlist, naming the playlist to fetch next: an audio rendition (#EXT-X-MEDIA) or an
+    audio-only variant if there is one, since only the audio is used; otherwise the
+    lowest-bandwidth variant.
+    """
+    lines = [line.strip() for line in text.lstrip('\ufeff').splitlines() if line.strip()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise ValueError("not an HLS playlist")
+
+    variants: list[tuple[int, str]] = []
+    audio_variants: list[tuple[int, str]] = []
+    audio_renditions: list[tuple[bool, str]] = []
+    playlist = Playlist(url=url)
+    pending_duration: float | None = None
+    pending_bandwidth: int | None = None
+    pending_audio_only = False
+    offset = 0.0
+    for line in lines[1:]:
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending_bandwidth = _attribute_int(line, 'BANDWIDTH') or 0
+            codecs = [c.strip().split('.', 1)[0] for c in (_attribute_str(line, 'CODECS') or '').split(',')]
+            pending_audio_only = bool(codecs[0]) and all(c in _AUDIO_CODECS for c in codecs)
+        elif line.startswith('#EXT-X-MEDIA:'):
+            uri = _attribute_str(line, 'URI')
+            if _attribute_str(line, 'TYPE') == 'AUDIO' and uri:
+                audio_renditions.append((_attribute_str(line, 'DEFAULT') != 'YES', urljoin(url, uri)))
+        elif line.startswith('#EXTINF:'):
+            pending_duration = float(line[len('#EXTINF:'):].split(',', 1)[0])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line.split(':', 1)[1])
+        elif line == '#EXT-X-ENDLIST':
+            playlist.ended = True
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = _attribute_str(line, 'URI')
+            playlist.map_uri = urljoin(url, uri) if uri else None
+        elif line.startswith('#EXT-X-KEY:'):
+            playlist.encrypted = playlist.encrypted or _attribute_str(line, 'METHOD') != 'NONE'
+        elif line.startswith('#'):
+            continue
+        elif pending_bandwidth is not None:
+            (audio_variants if pending_audio_only else variants).append((pending_bandwidth, urljoin(url, line)))
+            pending_bandwidth = None
+        elif pending_duration is not None:
+            playlist.segments.append(Segment(uri=urljoin(url, line), duration=pending_duration, start=offset))
+            offset += pending_duration
+            pending_duration = None
+
+    if audio_renditions:
+        # The default rendition first; a video variant may carry no audio of its own.
+        return None, min(audio_renditions)[1]
+    if audio_variants or variants:
+        return None, min(audio_variants or variants)[1]
+    return playlist, None
+
+
+# RFC 6381 codec names (before the first dot) that carry only audio.
+_AUDIO_CODECS = {'mp4a', 'ac-3', 'ec-3', 'opus', 'flac', 'mp3'}
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def _attribute_str(line: str, name: str) -> str | None:
+    for key, value in _ATTRIBUTE.findall(line.split(':', 1)[1]):
+        if key == name:
+            return value.strip('"')
+    return None
+
+
+def _attribute_int(line: str, name: str) -> int | None:
+    try:
+        return int(_attribute_str(line, name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _read(url: str, session: requests.Session | None) -> str:
+    """
+    Playlist text at `url`. Anything that does not start like a playlist (a direct MP4
+    link pasted as a manual media URL) is rejected after the first block rather than
+    downloaded whole.
+    """
+    body = b''
+    if url.startswith(('http://', 'https://')):
+        with (session or requests).get(url, timeout=FETCH_TIMEOUT_SECONDS, stream=True) as response:
+            response.raise_for_status()
+            for block in response.iter_content(64 * 1024):
+                body += block
+                if not _could_be_playlist(body):
+                    raise ValueError("not an HLS playlist")
+    else:
+        with open(url, 'rb') as f:
+            body = f.read(MAX_PLAYLIST_BYTES + 1)
+    if not _could_be_playlist(body) or not body.lstrip(_LEADING).startswith(b'#EXTM3U'):
+        raise ValueError("not an HLS playlist")
+    return body.decode('utf-8-sig')
+
+
+_LEADING = b'\xef\xbb\xbf \t\r\n'
+
+
+def _could_be_playlist(head: bytes) -> bool:
+    stripped = head.lstrip(_LEADING)
+    return len(head) <= MAX_PLAYLIST_BYTES and b'#EXTM3U'.startswith(stripped[:7])
+
+
+def load_playlist(url: str, session: requests.Session | None = None) -> Playlist:
+    """Fetch and parse the media playlist at `url`, following one master-playlist hop."""
+    playlist, variant = parse_playlist(_read(url, session), url)
+    if playlist is None:
+        playlist, variant = parse_playlist(_read(variant, session), variant)
+        if playlist is None:
+            raise ValueError("master playlist points at another master playlist")
+    return playlist
+
+
+def try_load_playlist(url: str, session: requests.Session | None = None) -> Playlist | None:
+    """load_playlist, or None (logged) when the URL is not a readable VOD playlist."""
+    try:
+        playlist = load_playlist(url, session)
+    except Exception as e:
+        logger.info(f"HLS playlist unavailable for {url.split('?', 1)[0]}: {e}")
+        return None
+    if not playlist.segments:
+        return None
+    return playlist
+
+
+class SegmentCache:
+    """
+    Downloads a playlist's segments into `cache_dir` ahead of ffmpeg and hands them over
+    in order.
+
+    ffmpeg's own HLS reader fetches one segment at a time, so a slow CDN edge set the pace
+    of the whole extraction. Here up to `concurrency` segments are in flight over one
+    pooled session, and ffmpeg reads from local disk. No segment is fetched more than
+    `prefetch` ahead of the one ffmpeg is reading, and the owner releases segments once a
+    retry would no longer start before them (`release_before`), so the directory holds a
+    window of the lecture rather than all of it. Finished segments are renamed into place,
+    so a retried job finds that window already there; the owner deletes the directory
+    once the job is done or has failed for good.
+    """
+
+    def __init__(self, playlist: Playlist, cache_dir: str, *, concurrency: int | None = None,
+                 prefetch: int | None = None, session: requests.Session | None = None):
+        self.playlist = playlist
+        self.cache_dir = cache_dir
+        self.concurrency = max(1, concurrency or DOWNLOAD_CONCURRENCY)
+        self.prefetch = max(self.concurrency, prefetch or PREFETCH_SEGMENTS)
+        self.session = session or _pooled_session(self.concurrency)
+        self.reused = 0
+        self.downloaded = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._futures: dict[int, Future] = {}
+        self._init: Future | None = None
+        self._released = 0
+
+    def start(self, first_index: int = 0) -> 'SegmentCache':
+        """Queue the first `prefetch` segments from `first_index` on, earliest first."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='hls-segment')
+        if self.playlist.map_uri:
+            self._init = self._pool.submit(self._fetch, self.playlist.map_uri, os.path.join(self.cache_dir, 'init'))
+        for index in range(first_index, first_index + self.prefetch):
+            self._submit(index)
+        return self
+
+    def _submit(self, index: int):
+        if index < len(self.playlist.segments) and index not in self._futures:
+            path = os.path.join(self.cache_dir, f'seg_{index:05d}')
+            self._futures[index] = self._pool.submit(self._fetch, self.playlist.segments[index].uri, path)
+
+    def stop(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def segment_for(self, seconds: float) -> int:
+        """Index of the segment containing `seconds` into the lecture."""
+        index = 0
+        for i, segment in enumerate(self.playlist.segments):
+            if segment.start <= seconds:
+                index = i
+        return index
+
+    def files(self, first_index: int = 0):
+        """Local paths in playback order (init segment first), each yielded as soon as it
+        is complete. Asking for one queues the segment `prefetch` further on. Raises if a
+        segment could not be fetched."""
+        if self._init is not None:
+            yield self._init.result()
+        for index in range(first_index, len(self.playlist.segments)):
+            self._submit(index + self.prefetch)
+            yield self._futures.pop(index).result()
+
+    def release_before(self, seconds: float):
+        """Delete the segments that end by `seconds` into the lecture: ffmpeg has read them,
+        and a retry starting at `seconds` does not need them."""
+        with self._lock:
+            segments = self.playlist.segments
+            while self._released < len(segments) and (
+                    segments[self._released].start + segments[self._released].duration <= seconds):
+                _remove(os.path.join(self.cache_dir, f'seg_{self._released:05d}'))
+                self._released += 1
+
+    def _fetch(self, uri: str, path: str) -> str:
+        if os.path.exists(path):
+            with self._lock:
+                self.reused += 1
+            return path
+        # Unique per writer: a worker that took over an expired lease may fetch the same file.
+        partial = f'{path}.{os.getpid()}-{threading.get_ident()}.part'
+        for attempt in range(1, FETCH_ATTEMPTS + 1):
+            try:
+                if uri.startswith(('http://', 'https://')):
+                    with self.session.get(uri, timeout=FETCH_TIMEOUT_SECONDS, stream=True) as response:
+                        response.raise_for_status()
+                        with open(partial, 'wb') as f:
+                            for block in response.iter_content(256 * 1024):
+                                f.write(block)
+                else:
+                    shutil.copyfile(uri, partial)
+                break
+            except (requests.RequestException, OSError):
+                if attempt == FETCH_ATTEMPTS:
+                    raise
+                time.sleep(attempt)
+        size = os.path.getsize(partial)
+        os.replace(partial, path)
+        with self._lock:
+            self.downloaded += 1
+            self.bytes_downloaded += size
+        return path
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _pooled_session(concurrency: int) -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def prune_cache(root: str, max_age_seconds: float) -> int:
+    """Delete per-lecture cache directories untouched for `max_age_seconds` — left behind
+    by jobs that failed for good. Returns how many were removed."""
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
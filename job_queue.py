@@ -0,0 +1,167 @@
+"""
+Enqueueing jobs and waking the worker when one arrives.
+
+Shared by the API and the worker, like spend_limits: the side that writes a job and the
+side that waits for one have to agree on the channel name, so it lives in one place.
+
+The worker used to poll the jobs table once a second. That cost an idle worker a claim
+query per second forever, and still left every job waiting up to a second before it was
+seen. On PostgreSQL the enqueue now issues a NOTIFY in the same transaction as the
+insert, and the worker blocks on LISTEN until one arrives. SQLite has no equivalent, so
+there the worker keeps polling — which is fine for the local development it is used for.
+"""
+import logging
+import os
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel for new jobs. Payloads are the job type, for logging only — a wakeup
+# always re-reads the table, so a lost or coalesced notification costs nothing but latency.
+JOBS_CHANNEL = 'learnus_jobs'
+
+# How long an idle worker waits before polling anyway. On PostgreSQL this is only a
+# safety net for a job written without a NOTIFY (a manual INSERT, a listener reconnect),
+# so it can be long. On SQLite it is the polling interval itself.
+IDLE_POLL_SECONDS_PG = float(os.getenv('WORKER_IDLE_POLL_SECONDS', '30'))
+IDLE_POLL_SECONDS_SQLITE = float(os.getenv('WORKER_SQLITE_POLL_SECONDS', '1'))
+
+
+def is_postgres(bind) -> bool:
+    """Whether `bind` (an engine, connection or session) talks to PostgreSQL."""
+    if hasattr(bind, 'get_bind'):
+        bind = bind.get_bind()
+    return bind.dialect.name == 'postgresql'
+
+
+def notify(db, channel: str = JOBS_CHANNEL, payload: str = '') -> None:
+    """
+    Queue a NOTIFY on the session's transaction. No-op outside PostgreSQL.
+
+    NOTIFY is transactional: it is delivered on commit and dropped on rollback, so a
+    listener can never wake for a row it is not yet able to see.
+    """
+    if not is_postgres(db):
+        return
+    from sqlalchemy import text
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': channel, 'payload': payload})
+
+
+def enqueue(db, job_type: str, payload: dict, *, parent_id: int | None = None):
+    """
+    Add a job and signal the worker. Does not commit — the caller owns the transaction,
+    which is what keeps the job, its notification and any state written alongside it
+    (a transcript placeholder, a course's queued status) atomic.
+
+    `parent_id` makes it a child of a 'waiting' job that tracks it.
+    """
+    from database import Job
+
+    job = Job(type=job_type, payload=payload, parent_id=parent_id)
+    db.add(job)
+    notify(db, JOBS_CHANNEL, job_type)
+    return job
+
+
+class PgListener:
+    """
+    LISTEN on a channel from a background thread, calling `on_notify(payload)` per message.
+
+    Runs on its own raw connection in autocommit mode, outside the pool, because a
+    listening connection has to stay open and idle for the life of the process. A dropped
+    connection is reopened with backoff, and `on_notify(None)` is called after every
+    (re)connect so the owner can catch up on anything sent while it was not listening.
+    """
+
+    def __init__(self, engine, channel: str, on_notify, *, name: str | None = None):
+        self.engine = engine
+        self.channel = channel
+        self.on_notify = on_notify
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name or f"listen-{channel}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _connect(self):
+        import psycopg2
+
+        url = self.engine.url.set(drivername='postgresql')
+        conn = psycopg2.connect(url.render_as_string(hide_password=False))
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            # Channel names are identifiers, not parameters; ours are module constants.
+            cur.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                backoff = 1.0
+                self.on_notify(None)
+                while not self._stop.is_set():
+                    ready, _, _ = select.select([conn], [], [], 5.0)
+                    if not ready:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.on_notify(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"LISTEN {self.channel} connection lost, retrying in {backoff:.0f}s: {e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+class JobSignal:
+    """
+    What the worker's main loop sleeps on between claims.
+
+    `wait()` returns as soon as a job is enqueued (PostgreSQL), a slot frees up (`set()`
+    from a finishing job), or the idle poll interval passes — whichever comes first.
+    """
+
+    def __init__(self, engine):
+        self._event = threading.Event()
+        self._listener = None
+        self.postgres = is_postgres(engine)
+        self.idle_timeout = IDLE_POLL_SECONDS_PG if self.postgres else IDLE_POLL_SECONDS_SQLITE
+        if self.postgres:
+            self._listener = PgListener(engine, JOBS_CHANNEL, lambda _payload: self._event.set(),
+                                        name='job-listener')
+
+    def start(self):
+        if self._listener:
+            self._listener.start()
+        return self
+
+    def stop(self):
+        if self._listener:
+            self._listener.stop()
+        self._event.set()
+
+    def set(self):
+        self._event.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until signalled or `timeout` (default: the idle poll interval). True if signalled."""
+        signalled = self._event.wait(self.idle_timeout if timeout is None else timeout)
+        # Cleared before the caller claims, so a job enqueued during the claim sets it
+        # again and the next wait returns at once rather than sleeping through it.
+        if signalled:
+            self._event.clear()
+        return signalled
+
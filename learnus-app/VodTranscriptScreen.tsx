@@ -14,8 +14,10 @@ import {
     transcribeVod,
     getVodTranscript,
     getVodTranscribeStatus,
+    streamVodTranscript,
     summarizeVod,
     generateFlashcards,
+    type TranscriptChunk,
     type VodTranscribeStatus,
 } from './services/api';
 import AIChatModal from './AIChatModal';
@@ -49,6 +51,15 @@ const formatDuration = (seconds?: number | null) => {
     return `${mins}분`;
 };
 
+// Same form as the passage timestamps in a finished transcript.
+const formatTimestamp = (seconds: number) => {
+    const total = Math.floor(seconds);
+    const hours = Math.floor(total / 3600);
+    const minutes = String(Math.floor((total % 3600) / 60)).padStart(2, '0');
+    const secs = String(total % 60).padStart(2, '0');
+    return hours ? `${hours}:${minutes}:${secs}` : `${minutes}:${secs}`;
+};
+
 const getStageLabel = (status?: VodTranscribeStatus | null) => {
     if (!status) return '대기 중';
     if (status.status === 'queued') return '대기열에서 순서를 기다리는 중';
@@ -171,7 +182,9 @@ export default function VodTranscriptScreen() {
     const [generatingFlashcards, setGeneratingFlashcards] = useState(false);
     const [statusInfo, setStatusInfo] = useState<VodTranscribeStatus | null>(null);
     const [showTranscribeProgress, setShowTranscribeProgress] = useState(false);
+    const [partialChunks, setPartialChunks] = useState<Record<number, TranscriptChunk>>({});
     const pollRef = useRef<ReturnType<typeof setInterval> | null>(null);
+    const streamRef = useRef<(() => void) | null>(null);
 
     const stopPolling = useCallback(() => {
         if (pollRef.current) {
@@ -218,11 +231,59 @@ export default function VodTranscriptScreen() {
         }, 4000);
     }, [vodMoodleId, stopPolling, showSuccess]);
 
+    const stopStreaming = useCallback(() => {
+        if (streamRef.current) {
+            streamRef.current();
+            streamRef.current = null;
+        }
+    }, []);
+
+    // Shows each chunk as the worker finishes it; falls back to polling if the stream drops.
+    const startStreaming = useCallback(() => {
+        stopStreaming();
+        setPartialChunks({});
+        streamRef.current = streamVodTranscript(vodMoodleId, {
+            onStatus: setStatusInfo,
+            onChunk: (chunk) => setPartialChunks((prev) => ({ ...prev, [chunk.index]: chunk })),
+            onReset: () => setPartialChunks({}),
+            onDone: (text) => {
+                streamRef.current = null;
+                setTranscript(text);
+                setShowTranscribeProgress(false);
+                setLoading(false);
+                showSuccess('추출 완료', '강의 텍스트가 준비되었어요!');
+            },
+            onError: (message) => {
+                streamRef.current = null;
+                setError(true);
+                setErrorMessage(message || '텍스트 추출에 실패했어요. 다시 시도해주세요.');
+                setShowTranscribeProgress(false);
+                setLoading(false);
+            },
+            onDisconnect: () => {
+                streamRef.current = null;
+                startPolling();
+            },
+        });
+    }, [vodMoodleId, stopStreaming, startPolling, showSuccess]);
+
     useEffect(() => {
         load();
-        return () => stopPolling();
+        return () => {
+            stopStreaming();
+            stopPolling();
+        };
     }, []);
 
+    const partialText = useMemo(
+        () => Object.values(partialChunks)
+            .filter((chunk) => chunk.text)
+            .sort((a, b) => a.start_s - b.start_s)
+            .map((chunk) => `[${formatTimestamp(chunk.start_s)}] ${chunk.text}`)
+            .join('\n'),
+        [partialChunks],
+    );
+
     const load = async () => {
         setLoading(true);
         setError(false);
@@ -255,7 +316,7 @@ export default function VodTranscriptScreen() {
                     const status = await getVodTranscribeStatus(vodMoodleId);
                     setStatusInfo(status);
                 } catch {}
-                startPolling();
+                startStreaming();
                 return;
             }
 
@@ -270,7 +331,7 @@ export default function VodTranscriptScreen() {
                     const status = await getVodTranscribeStatus(vodMoodleId);
                     setStatusInfo(status);
                 } catch {}
-                startPolling();
+                startStreaming();
             }
         } catch (e) {
             const detail = (e as any)?.response?.data?.detail;
@@ -411,6 +472,15 @@ export default function VodTranscriptScreen() {
                                     </View>
                                 )}
                             </View>
+
+                            {partialText ? (
+                                <View style={styles.partialCard}>
+                                    <Text style={styles.partialLabel}>지금까지 변환된 내용</Text>
+                                    <ScrollView style={styles.partialScroll} nestedScrollEnabled>
+                                        <Text style={styles.transcriptText}>{partialText}</Text>
+                                    </ScrollView>
+                                </View>
+                            ) : null}
                         </View>
                     ) : (
                         <View style={styles.initialLoadingWrap}>
@@ -611,6 +681,12 @@ const createStyles = (colors: ColorScheme, typography: TypographyType, layout: L
         paddingHorizontal: Spacing.m,
         gap: Spacing.s,
     },
+    partialCard: {
+        marginTop: Spacing.m,
+        gap: Spacing.s,
+    },
+    partialLabel: { ...typography.caption, color: colors.textSecondary },
+    partialScroll: { maxHeight: 240 },
     loadingMetaRow: {
         flexDirection: 'row',
         alignItems: 'center',
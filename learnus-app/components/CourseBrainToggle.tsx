@@ -16,7 +16,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { Spacing } from '../constants/theme';
 import type { ColorScheme, TypographyType, LayoutType } from '../constants/theme';
 import { useTheme } from '../context/ThemeContext';
-import { getCourseBrainStatus, setCourseBrain } from '../services/api';
+import { getCourseBrainStatus, isProgressStreamOpen, setCourseBrain, subscribeProgress } from '../services/api';
 import type { BrainScope, CourseBrainState } from '../services/api';
 import { LEARNED_CONTENT } from '../constants/brainContent';
 
@@ -33,8 +33,9 @@ interface Props {
  *
  * Turning it on starts a sweep that transcribes every lecture and reads every file, so
  * the row says what that involves before the tap rather than after it. While a build
- * runs the row becomes its own progress display and polls; it stops polling the moment
- * the build settles, so an idle screen makes no requests.
+ * runs the row becomes its own progress display, fed by the shared progress stream —
+ * polling only while that stream is down — and it stops the moment the build settles,
+ * so an idle screen makes no requests.
  */
 export default function CourseBrainToggle({ courseId, onStateChange }: Props) {
     const { colors, typography, layout, isDark } = useTheme();
@@ -51,9 +52,11 @@ export default function CourseBrainToggle({ courseId, onStateChange }: Props) {
     // front rather than started and then turned off.
     const [draftScope, setDraftScope] = useState<BrainScope>({ vods: true, files: true, assignments: true });
     const timer = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const stateRef = useRef<CourseBrainState | null>(null);
     const barAnim = useRef(new Animated.Value(0)).current;
 
     const apply = useCallback((next: CourseBrainState) => {
+        stateRef.current = next;
         setState(next);
         onStateChange?.(next);
     }, [onStateChange]);
@@ -69,21 +72,42 @@ export default function CourseBrainToggle({ courseId, onStateChange }: Props) {
         }
     }, [courseId, apply]);
 
-    // Poll only while there is something to watch.
+    // Poll only while there is something to watch and the stream is not delivering it.
     useEffect(() => {
         let cancelled = false;
+        const isActive = () => stateRef.current?.status === 'building' || stateRef.current?.status === 'queued';
         const tick = async () => {
-            const data = await refresh();
+            if (!isProgressStreamOpen()) await refresh();
             if (cancelled) return;
-            const active = data?.status === 'building' || data?.status === 'queued';
-            if (active) timer.current = setTimeout(tick, POLL_MS);
+            if (isActive()) timer.current = setTimeout(tick, POLL_MS);
         };
-        tick();
+        refresh().then(() => {
+            if (!cancelled && isActive()) timer.current = setTimeout(tick, POLL_MS);
+        });
+        const unsubscribe = subscribeProgress((event) => {
+            if (event.type === 'job') {
+                // A lecture left for tomorrow's budget stays in `pending`, which only the
+                // status endpoint has.
+                if (event.data.course_id === courseId && event.data.status === 'deferred') refresh();
+                return;
+            }
+            if (event.type !== 'brain' || event.data.course_id !== courseId || !stateRef.current) return;
+            const { status, progress, stage, error } = event.data;
+            const wasActive = isActive();
+            apply({ ...stateRef.current, status, progress, stage, error });
+            if (status === 'ready' || status === 'error') {
+                // Settled: pick up what only the status endpoint has (pending, built_at).
+                refresh();
+            } else if (!wasActive && !timer.current) {
+                timer.current = setTimeout(tick, POLL_MS);
+            }
+        });
         return () => {
             cancelled = true;
+            unsubscribe();
             if (timer.current) clearTimeout(timer.current);
         };
-    }, [refresh]);
+    }, [refresh, apply, courseId]);
 
     const progress = state?.progress ?? 0;
     useEffect(() => {
@@ -261,6 +261,65 @@ export const getVodTranscribeStatus = async (vodMoodleId: number): Promise<VodTr
     return response.data;
 };
 
+export interface TranscriptChunk {
+    index: number;
+    start_s: number;
+    end_s: number;
+    text: string;
+}
+
+export interface TranscriptStreamCallbacks {
+    onStatus: (status: VodTranscribeStatus) => void;
+    /** May arrive out of order, and again for the same index if a retry re-cut it. */
+    onChunk: (chunk: TranscriptChunk) => void;
+    /** The job restarted with a different chunk length; chunks received so far are void. */
+    onReset: () => void;
+    onDone: (transcript: string) => void;
+    onError: (error: string) => void;
+    /** The connection dropped without a result; the caller can fall back to polling. */
+    onDisconnect: () => void;
+}
+
+/** Follows a running transcription, chunk by chunk. Returns a cancel function. */
+export const streamVodTranscript = (
+    vodMoodleId: number,
+    callbacks: TranscriptStreamCallbacks,
+): (() => void) => {
+    const es = new EventSource<'status' | 'chunk' | 'reset' | 'done' | 'error'>(
+        `${API_URL}/vods/${vodMoodleId}/transcript/stream`,
+        { headers: authToken ? { 'X-API-Token': authToken } : {} },
+    );
+    const parse = (event: any) => {
+        try {
+            return event.data ? JSON.parse(event.data) : null;
+        } catch {
+            return null;
+        }
+    };
+
+    es.addEventListener('status', (event: any) => {
+        const data = parse(event);
+        if (data) callbacks.onStatus(data);
+    });
+    es.addEventListener('chunk', (event: any) => {
+        const data = parse(event);
+        if (data) callbacks.onChunk(data);
+    });
+    es.addEventListener('reset', () => callbacks.onReset());
+    es.addEventListener('done', (event: any) => {
+        callbacks.onDone(parse(event)?.transcript || '');
+        es.close();
+    });
+    es.addEventListener('error', (event: any) => {
+        const data = parse(event);
+        es.close();
+        if (data?.error) callbacks.onError(data.error);
+        else callbacks.onDisconnect();
+    });
+
+    return () => es.close();
+};
+
 export const summarizeVod = async (vodMoodleId: number) => {
     const response = await api.post(`/vods/${vodMoodleId}/summarize`);
     return response.data;
@@ -600,7 +659,60 @@ export const rebuildCourseBrain = async (courseId: number): Promise<CourseBrainS
     return response.data;
 };
 
-/** Polled while a build runs. `pending` is what the brain has not learned yet. */
+export type ProgressEvent =
+    | { type: 'transcribe'; data: { vod_moodle_id: number; status: VodTranscribeStatus['status']; stage: string | null; progress_pct: number; error_message: string | null } }
+    | { type: 'brain'; data: { course_id: number; status: CourseBrainState['status']; progress: number; stage: string | null; error: string | null } }
+    // 'deferred': a brain build item put off until the daily transcription budget resets.
+    | { type: 'job'; data: { job_id: number; type: string; status: 'done' | 'failed' | 'deferred'; vod_moodle_id: number | null; course_id: number | null } };
+
+type ProgressListener = (event: ProgressEvent) => void;
+
+const progressListeners = new Set<ProgressListener>();
+let progressSource: EventSource<'transcribe' | 'brain' | 'job'> | null = null;
+let progressOpen = false;
+
+/** Whether the shared progress stream is connected; while it is not, callers poll. */
+export const isProgressStreamOpen = () => progressOpen;
+
+/**
+ * Every progress bar's updates over one connection per app, opened with the first
+ * listener and closed with the last. Each event is the latest state, not a delta, and the
+ * server re-sends everything on reconnect. Returns the unsubscribe function.
+ */
+export const subscribeProgress = (listener: ProgressListener): (() => void) => {
+    progressListeners.add(listener);
+    if (!progressSource) {
+        const es = new EventSource<'transcribe' | 'brain' | 'job'>(`${API_URL}/events`, {
+            headers: authToken ? { 'X-API-Token': authToken } : {},
+        });
+        const forward = (type: ProgressEvent['type']) => (event: any) => {
+            progressOpen = true;
+            if (!event.data) return;
+            try {
+                const data = JSON.parse(event.data);
+                progressListeners.forEach((l) => l({ type, data } as ProgressEvent));
+            } catch {}
+        };
+        es.addEventListener('open', () => { progressOpen = true; });
+        es.addEventListener('transcribe', forward('transcribe'));
+        es.addEventListener('brain', forward('brain'));
+        es.addEventListener('job', forward('job'));
+        // The library reconnects on its own; until it does, listeners fall back to polling.
+        es.addEventListener('error', () => { progressOpen = false; });
+        progressSource = es;
+    }
+    return () => {
+        progressListeners.delete(listener);
+        if (!progressListeners.size && progressSource) {
+            progressSource.close();
+            progressSource = null;
+            progressOpen = false;
+        }
+    };
+};
+
+/** Fetched when a build settles, and polled while the progress stream is down. `pending`
+ * is what the brain has not learned yet. */
 export const getCourseBrainStatus = async (
     courseId: number,
 ): Promise<CourseBrainState & { pending: { files: number; vods: number; assignments: number; total: number } }> => {
@@ -668,11 +780,18 @@ export interface BrainStreamCallbacks {
     onError: (error: string) => void;
 }
 
+/**
+ * How much of the course a brain answer is grounded in: `full` sends the whole course,
+ * `retrieval` only the passages matching the question. Omitted, the server's default applies.
+ */
+export type BrainChatMode = 'full' | 'retrieval';
+
 /** Streamed, course-grounded answer. Returns a cancel function. */
 export const chatWithCourseBrain = (
     courseId: number,
     messages: ChatMessage[],
     callbacks: BrainStreamCallbacks,
+    mode?: BrainChatMode,
 ): (() => void) => {
     const es = new EventSource<'message' | 'done' | 'error'>(
         `${API_URL}/courses/${courseId}/brain/chat`,
@@ -682,7 +801,7 @@ export const chatWithCourseBrain = (
                 'Content-Type': 'application/json',
                 ...(authToken ? { 'X-API-Token': authToken } : {}),
             },
-            body: JSON.stringify({ messages }),
+            body: JSON.stringify(mode ? { messages, mode } : { messages }),
         },
     );
 
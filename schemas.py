@@ -1,6 +1,6 @@
 """Pydantic request and response contracts for the HTTP API."""
 
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel
 
@@ -79,6 +79,9 @@ class ChatRequest(BaseModel):
 
 class BrainChatRequest(BaseModel):
     messages: list
+    # full: the whole course corpus; retrieval: only the passages matching the question.
+    # Unset uses the server's BRAIN_CHAT_MODE.
+    mode: Optional[Literal['full', 'retrieval']] = None
 
 
 class ManualTranscribeRequest(BaseModel):
@@ -0,0 +1,114 @@
+"""
+Wall time of the brain build's assignment and file stages, one request at a time against
+the concurrent FetchExecutor, on a synthetic course served with LearnUs-like latency.
+
+Starts a local HTTP server that answers every request after --latency-ms, serving
+--assignments assignment pages and --files text files. Builds both stages into a
+throwaway SQLite database once with every limit at 1 (the old serial build) and once
+with the configured limits, and reports each run's wall time. Captions are not timed:
+they need the OpenAI API, and on the serial path they add one call per dense slide.
+
+    python scripts/bench_brain_fetch.py --files 40 --assignments 12 --latency-ms 300
+"""
+import argparse
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("TESTING", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import course_brain  # noqa: E402
+from database import Assignment, Base, Course, FileResource, User  # noqa: E402
+
+
+def _server(latency_s: float) -> http.server.ThreadingHTTPServer:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_s)
+            if self.path.startswith("/assign"):
+                body = f'<div id="intro"><p>{self.path} 과제 설명</p></div></div>'.encode()
+            else:
+                body = ("강의 자료 본문 " * 400).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _course(db, base: str, files: int, assignments: int) -> Course:
+    user = User(username="bench", api_token="bench")
+    db.add(user)
+    db.commit()
+    course = Course(moodle_id=1, owner_id=user.id, name="벤치마크 과목", brain_enabled=True)
+    db.add(course)
+    db.commit()
+    for i in range(files):
+        db.add(FileResource(course_id=course.id, moodle_id=i, title=f"자료 {i}", url=f"{base}/file{i}.txt"))
+    for i in range(assignments):
+        db.add(Assignment(course_id=course.id, moodle_id=i, title=f"과제 {i}", url=f"{base}/assign{i}"))
+    db.commit()
+    return course
+
+
+class _Client:
+    """The slice of MoodleClient the two stages use, over a plain session."""
+
+    def __init__(self):
+        from moodle_client import MoodleClient
+
+        self.session = requests.Session()
+        self.get_assignment_detail = lambda url: MoodleClient.get_assignment_detail(self, url)
+
+
+def _run(label: str, base: str, args, limits: dict, per_host: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        course_brain.FILES_ROOT = os.path.join(tmp, "files")
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        course = _course(db, base, args.files, args.assignments)
+        client = _Client()
+
+        started = time.perf_counter()
+        with course_brain.FetchExecutor(limits=limits, per_host=per_host) as executor:
+            assignments = course_brain.fetch_assignment_descriptions(client, db, course, executor=executor)
+            files = course_brain.build_course_files(client.session, db, course, executor=executor)
+        wall = time.perf_counter() - started
+
+        print(f"{label:<10} wall_s={wall:6.2f} assignments_fetched={assignments['fetched']} files_ok={files['ok']}")
+        return wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--assignments", type=int, default=12)
+    parser.add_argument("--latency-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    server = _server(args.latency_ms / 1000)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    serial = _run("serial", base, args, {stage: 1 for stage in course_brain.BUILD_CONCURRENCY}, 1)
+    concurrent = _run("executor", base, args, {}, course_brain.BUILD_HOST_CONCURRENCY)
+    print(f"limits={course_brain.BUILD_CONCURRENCY} per_host={course_brain.BUILD_HOST_CONCURRENCY} "
+          f"speedup={serial / concurrent:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Prompt size, latency and recall of brain chat's retrieval mode against the full corpus,
+on a synthetic course.
+
+Builds a course in a throwaway SQLite database: WEEKS weeks, each with a slide deck, a
+timestamped lecture transcript and a few board posts, all filler Korean text. Into it
+go --facts made-up terms, each defined in one random passage. Every fact then becomes a
+question, answered once from the full corpus and once from retrieval, and the script
+reports the characters each mode sends, how long building and querying the index take,
+how long an incremental update takes after one post changes, and how often the passage
+defining the fact is among the retrieved ones (recall@k).
+
+With --live each mode also answers a few questions through the real API (needs
+OPENAI_API_KEY; billed), reporting time to first token and prompt tokens.
+
+    python scripts/bench_brain_retrieval.py --weeks 15 --facts 40 --top-k 12
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("TESTING", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import course_brain  # noqa: E402
+from database import Base, Board, Course, FileResource, Post, User, VOD, VodTranscript  # noqa: E402
+
+SYLLABLES = "가나다라마바사아자차카타파하거너더러머버서어저처커터퍼허고노도로모보소오조초코토포호구누두루무부수우주추쿠투푸후"
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(_word(rng) for _ in range(rng.randint(6, 12))) + "."
+
+
+def _passage(rng: random.Random, chars: int) -> str:
+    out = []
+    while sum(len(s) + 1 for s in out) < chars:
+        out.append(_sentence(rng))
+    return " ".join(out)
+
+
+def build_course(db, rng: random.Random, weeks: int, facts: int) -> tuple[Course, list[tuple[str, str]]]:
+    user = User(username="bench", api_token="bench")
+    db.add(user)
+    db.commit()
+    course = Course(moodle_id=1, owner_id=user.id, name="벤치마크 과목", brain_enabled=True)
+    db.add(course)
+    db.commit()
+
+    units = []   # (kind, week, index) of every passage a fact could be planted in
+    slides, lectures, boards = {}, {}, {}
+    for week in range(1, weeks + 1):
+        slides[week] = [f"[p.{p}]\n{_passage(rng, 600)}" for p in range(1, 31)]
+        lectures[week] = [f"[{m}:00] {_passage(rng, 900)}" for m in range(0, 76, 2)]
+        boards[week] = [_passage(rng, 400) for _ in range(5)]
+        units += [("slide", week, i) for i in range(len(slides[week]))]
+        units += [("lecture", week, i) for i in range(len(lectures[week]))]
+
+    planted = []
+    for n, (kind, week, i) in enumerate(rng.sample(units, facts)):
+        term = f"{_word(rng)}{_word(rng)}정리"
+        definition = f"{term}란 {_sentence(rng)}"
+        target = slides if kind == "slide" else lectures
+        target[week][i] += " " + definition
+        planted.append((term, definition))
+
+    for week in range(1, weeks + 1):
+        label = f"{week}주차"
+        db.add(FileResource(course_id=course.id, moodle_id=week, title=f"{label} 슬라이드",
+                            content="\n\n".join(slides[week]), section=week, week=label, file_kind="pdf"))
+        db.add(VOD(moodle_id=week, course_id=course.id, title=f"{label} 강의", url="x", section=week, week=label))
+        db.add(VodTranscript(moodle_id=week, transcript="\n".join(lectures[week])))
+        board = Board(moodle_id=week, course_id=course.id, title=f"{label} 게시판", section=week, week=label)
+        db.add(board)
+        db.flush()
+        for i, body in enumerate(boards[week]):
+            db.add(Post(board_id=board.id, title=f"글 {i}", content=f"<p>{body}</p>"))
+    db.commit()
+    return course, planted
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}"
+
+
+def _live(db, course, planted, top_k: int, questions: int):
+    from ai_service import AIService
+
+    service = AIService()
+    for mode in ("full", "retrieval"):
+        ttfts, prompt_tokens = [], []
+        for term, _ in planted[:questions]:
+            question = f"{term}가 뭐예요?"
+            if mode == "retrieval":
+                corpus, _ = course_brain.retrieve_corpus(db, course, question, k=top_k)
+            else:
+                corpus, _ = course_brain.cached_corpus(db, course)
+            started = time.perf_counter()
+            first = None
+            for event, data in service.chat_about_course_stream(
+                corpus, course.name, [{"role": "user", "content": question}], excerpts=mode == "retrieval",
+            ):
+                if event == "token" and first is None:
+                    first = time.perf_counter() - started
+                elif event == "usage":
+                    prompt_tokens.append(data["prompt_tokens"])
+            ttfts.append(first or 0.0)
+        print(f"live mode={mode:<9} ttft_s={statistics.median(ttfts):5.2f} "
+              f"prompt_tokens={statistics.median(prompt_tokens):8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--weeks", type=int, default=15)
+    parser.add_argument("--facts", type=int, default=40)
+    parser.add_argument("--top-k", type=int, default=course_brain.RETRIEVAL_TOP_K)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--live", type=int, default=0, metavar="N", help="answer N questions per mode through the API")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        course, planted = build_course(db, rng, args.weeks, args.facts)
+
+        started = time.perf_counter()
+        full, _ = course_brain.assemble_corpus(db, course)
+        assemble_s = time.perf_counter() - started
+        started = time.perf_counter()
+        course_brain.retrieve_corpus(db, course, "준비", k=args.top_k)
+        build_s = time.perf_counter() - started
+        index = course_brain._indexes[course.id]
+
+        query_s, sizes, hits = [], [], 0
+        for term, definition in planted:
+            started = time.perf_counter()
+            excerpt, _ = course_brain.retrieve_corpus(db, course, f"{term}가 뭐예요?", k=args.top_k)
+            query_s.append(time.perf_counter() - started)
+            sizes.append(len(excerpt))
+            hits += definition in excerpt
+
+        db.query(Post).first().content = f"<p>{_passage(rng, 400)}</p>"
+        db.commit()
+        db.expire(course)
+        started = time.perf_counter()
+        reindexed = index.update(course_brain._corpus_items(db, course), course.brain_corpus_version)
+        update_s = time.perf_counter() - started
+
+        print(f"course  chars={len(full)} chunks={len(index._chunks)} terms={len(index._postings)}")
+        print(f"full      prompt_chars={len(full):>8}  assemble_ms={_ms(assemble_s)}")
+        print(f"retrieval prompt_chars={statistics.median(sizes):>8.0f}  (median, top_k={args.top_k}) "
+              f"query_ms={_ms(statistics.median(query_s))} p95_query_ms={_ms(sorted(query_s)[int(len(query_s) * 0.95)])}")
+        print(f"index     cold_build_ms={_ms(build_s)} one_post_update_ms={_ms(update_s)} items_reindexed={reindexed}")
+        print(f"recall@{args.top_k}={hits / len(planted):.1%} ({hits}/{len(planted)} fact passages retrieved)")
+
+        if args.live:
+            _live(db, course, planted, args.top_k, args.live)
+
+
+if __name__ == "__main__":
+    main()
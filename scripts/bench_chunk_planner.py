@@ -0,0 +1,102 @@
+"""
+Wall time of AIService.transcribe_vod with fixed vs. planned chunk lengths, across lecture
+lengths.
+
+Stands up a stub of the OpenAI transcriptions endpoint on localhost whose latency follows
+the shape of the real one: a fixed per-request overhead plus time proportional to the audio
+in the chunk (read off the upload size, since the mp3 profile is constant bitrate). For each
+lecture length it generates a synthetic lecture with ffmpeg — a tone broken by a short pause
+every PAUSE_EVERY seconds, so cuts have silences to snap to — and runs the real pipeline
+once with TRANSCRIBE_CHUNK_SECONDS for every lecture and once with plan_chunk_seconds.
+
+    python scripts/bench_chunk_planner.py --minutes 5,30,90,180 --overhead 1.5 --per-audio-second 0.03
+"""
+import argparse
+import http.server
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI  # noqa: E402
+
+import ai_service  # noqa: E402
+
+PAUSE_EVERY = 23
+PAUSE_SECONDS = 1.5
+
+
+def _stub_server(overhead: float, per_audio_second: float, bytes_per_second: float, requests: list):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            audio_s = len(body) / bytes_per_second
+            requests.append(audio_s)
+            time.sleep(overhead + per_audio_second * audio_s)
+            reply = b"text"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _lecture(path: str, minutes: float):
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i",
+         f"sine=frequency=220:sample_rate=16000:duration={minutes * 60},"
+         f"volume=enable='lt(mod(t,{PAUSE_EVERY}),{PAUSE_SECONDS})':volume=0",
+         "-ac", "1", "-b:a", "32k", path],
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minutes", default="5,30,90,180")
+    parser.add_argument("--overhead", type=float, default=1.5, help="seconds per request regardless of length")
+    parser.add_argument("--per-audio-second", type=float, default=0.03, help="seconds per second of audio sent")
+    parser.add_argument("--concurrency", type=int, default=ai_service.TRANSCRIBE_CONCURRENCY)
+    args = parser.parse_args()
+
+    ai_service.TRANSCRIBE_AUDIO_PROFILE = "mp3"
+    bytes_per_second = 24_000 / 8
+    requests: list[float] = []
+    server = _stub_server(args.overhead, args.per_audio_second, bytes_per_second, requests)
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in (float(m) for m in args.minutes.split(",")):
+            path = os.path.join(tmp, f"lecture_{minutes:g}.mp3")
+            _lecture(path, minutes)
+            walls = {}
+            for mode in ("fixed", "planned"):
+                ai_service.TRANSCRIBE_ADAPTIVE_CHUNKS = mode == "planned"
+                requests.clear()
+                started = time.perf_counter()
+                _, usage = service.transcribe_vod(path, concurrency=args.concurrency, duration_s=minutes * 60)
+                walls[mode] = time.perf_counter() - started
+                print(
+                    f"minutes={minutes:<5g} {mode:<7} chunk_s={usage['chunk_seconds']:<4} "
+                    f"requests={len(requests):<3} wall_s={walls[mode]:6.1f}"
+                )
+            print(f"minutes={minutes:<5g} planned/fixed={walls['planned'] / walls['fixed']:.2f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
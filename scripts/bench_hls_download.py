@@ -0,0 +1,110 @@
+"""
+Extraction wall time with ffmpeg fetching HLS segments itself vs. hls.SegmentCache.
+
+Builds a synthetic lecture by looping the sample video in tests/, cuts it into an HLS
+stream, and serves that from a local HTTP stand-in for the media server that holds each
+response for an injected latency (roughly one CDN round trip plus transfer). Then runs
+AIService.transcribe_vod over it both ways, with a stub transcription client that answers
+instantly, so the difference is the download path alone.
+
+    python scripts/bench_hls_download.py --minutes 30 --latency 0.3 --concurrency 6
+
+The local ffmpeg build may not demux MPEG-TS; pass --segment-type fmp4 to serve
+fragmented MP4 segments instead.
+"""
+import argparse
+import http.server
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ai_service  # noqa: E402
+import hls  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "tests", "KakaoTalk_20260323_154022777.mp4")
+
+
+class _InstantTranscriptions:
+    def create(self, model, file, response_format):
+        return f"text of {os.path.basename(file.name)}"
+
+
+def _make_stream(out_dir: str, minutes: float, segment_seconds: int, segment_type: str) -> str:
+    playlist = os.path.join(out_dir, "index.m3u8")
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-stream_loop", "-1", "-i", SAMPLE, "-t", str(minutes * 60),
+         "-map", "0", "-c", "copy",
+         "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+         "-hls_segment_type", segment_type, playlist],
+        check=True,
+    )
+    return playlist
+
+
+def _serve(root: str, latency: float):
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if not self.path.endswith(".m3u8"):
+                time.sleep(latency)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds held per segment request")
+    parser.add_argument("--segment-seconds", type=int, default=6)
+    parser.add_argument("--segment-type", choices=("mpegts", "fmp4"), default="mpegts")
+    parser.add_argument("--concurrency", type=int, default=hls.DOWNLOAD_CONCURRENCY)
+    args = parser.parse_args()
+
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.client = type("Client", (), {"audio": type("Audio", (), {"transcriptions": _InstantTranscriptions()})})()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stream_dir = os.path.join(tmp, "stream")
+        os.makedirs(stream_dir)
+        _make_stream(stream_dir, args.minutes, args.segment_seconds, args.segment_type)
+        server = _serve(stream_dir, args.latency)
+        url = f"http://127.0.0.1:{server.server_port}/index.m3u8"
+        playlist = hls.load_playlist(url)
+        print(f"segments={len(playlist.segments)} duration_s={playlist.duration:.0f} latency_s={args.latency}")
+
+        transcripts = set()
+        started = time.perf_counter()
+        transcript, _ = service.transcribe_vod(url, duration_s=playlist.duration)
+        transcripts.add(transcript)
+        print(f"ffmpeg direct        wall_s={time.perf_counter() - started:.1f}")
+
+        cache_dir = os.path.join(tmp, "cache")
+        cache = hls.SegmentCache(playlist, cache_dir, concurrency=args.concurrency)
+        started = time.perf_counter()
+        transcript, _ = service.transcribe_vod(url, duration_s=playlist.duration, segments=cache)
+        transcripts.add(transcript)
+        print(
+            f"{'segment cache':<20} wall_s={time.perf_counter() - started:.1f} "
+            f"downloaded={cache.downloaded} concurrency={cache.concurrency} prefetch={cache.prefetch}"
+        )
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        server.shutdown()
+    print("transcripts identical:", len(transcripts) == 1)
+
+
+if __name__ == "__main__":
+    main()
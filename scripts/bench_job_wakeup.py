@@ -0,0 +1,138 @@
+"""
+Enqueue-to-start latency and idle query rate of the worker loop, polling versus NOTIFY.
+
+Runs a stripped-down copy of the worker's claim loop against a real database in two
+modes — `poll`, the old fixed one-second sleep, and `notify`, the job_queue.JobSignal the
+worker now uses — then enqueues jobs at random intervals and records how long each sat
+before it was claimed. Claim queries are counted separately over an idle window.
+
+NOTIFY needs PostgreSQL; against SQLite the `notify` mode falls back to polling and the
+two numbers should match. Only claims its own `bench_noop` rows, so it is safe next to a
+running worker, and deletes them afterwards.
+
+    DATABASE_URL=postgresql://user:pw@localhost:5432/learnus python scripts/bench_job_wakeup.py
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import event  # noqa: E402
+
+import job_queue  # noqa: E402
+from database import init_db, Job  # noqa: E402
+
+BENCH_TYPE = 'bench_noop'
+
+
+def _claim(db):
+    """worker._claim_job, restricted to benchmark rows."""
+    job = (
+        db.query(Job)
+        .filter(Job.status == 'pending', Job.type == BENCH_TYPE)
+        .order_by(Job.created_at)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        return None
+    job.status = 'done'
+    job.started_at = datetime.now()
+    db.commit()
+    return {"id": job.id}
+
+
+def _run_loop(SessionLocal, mode: str, stop: threading.Event, started: dict):
+    signal = job_queue.JobSignal(SessionLocal.kw['bind']).start() if mode == 'notify' else None
+    try:
+        while not stop.is_set():
+            db = SessionLocal()
+            try:
+                job = _claim(db)
+            finally:
+                db.close()
+            if job:
+                started[job['id']] = time.perf_counter()
+                continue
+            if signal:
+                signal.wait()
+            else:
+                time.sleep(1)
+    finally:
+        if signal:
+            signal.stop()
+
+
+def bench(SessionLocal, mode: str, jobs: int, idle_s: float) -> dict:
+    engine = SessionLocal.kw['bind']
+    claims = {'n': 0}
+
+    def _count(conn, cursor, statement, params, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM jobs' in statement:
+            claims['n'] += 1
+
+    event.listen(engine, 'before_cursor_execute', _count)
+    stop = threading.Event()
+    started: dict[int, float] = {}
+    loop = threading.Thread(target=_run_loop, args=(SessionLocal, mode, stop, started), daemon=True)
+    loop.start()
+    time.sleep(0.5)  # let the listener connect
+
+    claims['n'] = 0
+    time.sleep(idle_s)
+    idle_rate = claims['n'] / idle_s
+
+    enqueued: dict[int, float] = {}
+    for _ in range(jobs):
+        time.sleep(random.uniform(0.2, 1.5))
+        db = SessionLocal()
+        try:
+            job = job_queue.enqueue(db, BENCH_TYPE, {'bench': True})
+            db.commit()
+            enqueued[job.id] = time.perf_counter()
+        finally:
+            db.close()
+
+    deadline = time.perf_counter() + 40
+    while len(started) < len(enqueued) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    loop.join(timeout=35)
+    event.remove(engine, 'before_cursor_execute', _count)
+
+    latencies = [(started[i] - t) * 1000 for i, t in enqueued.items() if i in started]
+    return {
+        'mode': mode,
+        'claimed': f"{len(latencies)}/{len(enqueued)}",
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'max_ms': round(max(latencies), 1) if latencies else None,
+        'idle_queries_per_min': round(idle_rate * 60, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--idle-seconds', type=float, default=30.0)
+    parser.add_argument('--db', default=os.getenv('DATABASE_URL', 'sqlite:///bench_jobs.db'))
+    args = parser.parse_args()
+
+    SessionLocal = init_db(args.db)
+    try:
+        for mode in ('poll', 'notify'):
+            print(bench(SessionLocal, mode, args.jobs, args.idle_seconds))
+    finally:
+        db = SessionLocal()
+        db.query(Job).filter(Job.type == BENCH_TYPE).delete()
+        db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Wall time of AIService.transcribe_vod at different chunk concurrency levels.
+
+Stands up a stub of the OpenAI transcriptions endpoint on localhost that answers each
+chunk after an injected latency (a fixed base plus random jitter, roughly what the real
+endpoint takes for a 120 s chunk), generates a synthetic lecture with ffmpeg, and runs the
+real pipeline — ffmpeg segmenting, chunk upload, reassembly — against it once per level.
+Checks every run produced the same transcript, in order.
+
+    python scripts/bench_transcribe_concurrency.py --minutes 75 --latency 6 --jitter 3
+"""
+import argparse
+import http.server
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openai import OpenAI  # noqa: E402
+
+import ai_service  # noqa: E402
+
+
+def _stub_server(latency: float, jitter: float):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            # The multipart body carries the chunk's file name; echo it back as the text.
+            name = body.split(b'filename="', 1)[1].split(b'"', 1)[0].decode()
+            time.sleep(latency + random.uniform(0, jitter))
+            reply = f"text of {name}".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minutes", type=float, default=75)
+    parser.add_argument("--latency", type=float, default=6.0, help="base seconds per chunk request")
+    parser.add_argument("--jitter", type=float, default=3.0, help="extra random seconds per request")
+    parser.add_argument("--levels", default="1,2,4,8")
+    args = parser.parse_args()
+
+    server = _stub_server(args.latency, args.jitter)
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.client = OpenAI(api_key="bench", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        lecture = os.path.join(tmp, "lecture.mp3")
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency=220:duration={args.minutes * 60}",
+             "-ac", "1", "-b:a", "32k", lecture],
+            check=True,
+        )
+        transcripts = set()
+        for level in (int(n) for n in args.levels.split(",")):
+            started = time.perf_counter()
+            transcript, _ = service.transcribe_vod(lecture, concurrency=level)
+            wall = time.perf_counter() - started
+            transcripts.add(transcript)
+            chunks = transcript.count("text of ")
+            print(f"concurrency={level:<2} chunks={chunks} wall_s={wall:.1f} per_chunk_s={wall / max(1, chunks):.2f}")
+    server.shutdown()
+    print("transcripts identical across levels:", len(transcripts) == 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+How far the fitted transcription ETA is off, next to the hand-tuned one, on a timing log.
+
+Splits the log's successful jobs by time: the model is fitted on the earlier part, as the
+worker would have fitted it, and both estimators are scored on the later part at three
+points in each job — when it starts, when transcription starts, and halfway through
+transcription (assuming the chunks progress evenly). The heuristic sees what the status
+endpoint gives it, including the time already waited in the queue. Reports the mean
+absolute error of each band's midpoint and how often the actual time fell inside the band.
+
+The log does not record how many jobs were queued ahead, so the queue wait is not scored.
+
+    python scripts/eval_eta_model.py error_log/transcribe_timing.jsonl --train-fraction 0.7
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import eta_model  # noqa: E402
+
+
+def _points(row: dict):
+    """(stage, overall progress, seconds already counted by the status endpoint, actual seconds left)."""
+    stages = row.get("stage_durations_s") or {}
+    extract = stages.get("extracting_audio", 0.0)
+    transcribe = stages.get("transcribing", 0.0)
+    finalize = stages.get("finalizing", 0.0)
+    waited = row.get("queue_wait_s") or 0.0
+    yield "start", "extracting_audio", 5, waited, row["total_s"]
+    yield "transcribing", "transcribing", 10, waited + extract, transcribe + finalize
+    yield "halfway", "transcribing", 52, waited + extract + transcribe / 2, transcribe / 2 + finalize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("log", nargs="?", default=os.getenv("TRANSCRIBE_TIMING_LOG_PATH", "error_log/transcribe_timing.jsonl"))
+    parser.add_argument("--train-fraction", type=float, default=0.7)
+    parser.add_argument("--slots", type=int, default=4, help="transcriptions the workers run at once")
+    args = parser.parse_args()
+
+    rows = sorted(eta_model.read_timing_log(args.log, limit=10**9), key=lambda r: r.get("logged_at", ""))
+    split = int(len(rows) * args.train_fraction)
+    train, test = rows[:split], rows[split:]
+    coefficients = eta_model.fit(train, slots_per_worker=args.slots)
+    if coefficients is None or not test:
+        sys.exit(f"Not enough jobs: {len(train)} to fit (need {eta_model.MIN_SAMPLES} on one backend), {len(test)} to score")
+    print(f"fitted on {len(train)} jobs, scoring {len(test)}")
+
+    scores: dict[tuple[str, str], list[tuple[float, bool]]] = {}
+    for row in test:
+        duration = row["media_duration_s"]
+        for point, stage, pct, elapsed, actual in _points(row):
+            estimates = {
+                "heuristic": eta_model.heuristic_eta(int(duration), 0, stage, pct, int(elapsed)),
+                "model": eta_model.estimate(coefficients, duration, 0, args.slots, stage, pct),
+            }
+            for name, eta in estimates.items():
+                error = abs((eta["low"] + eta["high"]) / 2 - actual)
+                scores.setdefault((point, name), []).append((error, eta["low"] <= actual <= eta["high"]))
+
+    for (point, name), results in scores.items():
+        mae = sum(e for e, _ in results) / len(results)
+        covered = sum(c for _, c in results) / len(results)
+        print(f"point={point:<13} estimator={name:<10} mae_s={mae:7.1f} in_band={covered:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
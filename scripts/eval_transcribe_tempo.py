@@ -0,0 +1,80 @@
+"""
+How much transcript quality TRANSCRIBE_TEMPO costs, on a local recording.
+
+Transcribes the same file at each tempo through the real pipeline and API (needs
+OPENAI_API_KEY; every run is billed) and compares each transcript with the 1.0x one:
+word error rate over whitespace-separated words, which for Korean are eojeol, plus the
+billed audio seconds. The 1.0x transcript is the reference, not ground truth — pass
+--reference with a hand-checked transcript to score against that instead.
+
+    python scripts/eval_transcribe_tempo.py lecture.m4a --tempos 1.0,1.25,1.5,1.75
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ai_service  # noqa: E402
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), "..", "tests", "KakaoTalk_20260323_154022777.mp4")
+
+
+def _words(transcript: str) -> list[str]:
+    return re.sub(r"^\[\d+:\d{2}(:\d{2})?\] ", "", transcript, flags=re.M).split()
+
+
+def word_error_rate(reference: list[str], hypothesis: list[str]) -> float:
+    """Levenshtein distance over words, divided by the reference length."""
+    if not reference:
+        return float(bool(hypothesis))
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("media", nargs="?", default=DEFAULT_SAMPLE, help="local audio/video file or HLS playlist")
+    parser.add_argument("--tempos", default="1.0,1.25,1.5,1.75")
+    parser.add_argument("--reference", help="text file to score against instead of the 1.0x transcript")
+    parser.add_argument("--show", action="store_true", help="print each transcript")
+    args = parser.parse_args()
+
+    tempos = [float(t) for t in args.tempos.split(",")]
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = _words(f.read())
+    elif 1.0 not in tempos:
+        tempos.insert(0, 1.0)
+        reference = None
+    else:
+        reference = None
+
+    service = ai_service.AIService()
+    results = []
+    for tempo in sorted(tempos):
+        started = time.perf_counter()
+        transcript, usage = service.transcribe_vod(args.media, tempo=tempo)
+        results.append((tempo, transcript, usage, time.perf_counter() - started))
+        if reference is None and tempo == 1.0:
+            reference = _words(transcript)
+
+    for tempo, transcript, usage, wall_s in results:
+        wer = word_error_rate(reference, _words(transcript))
+        print(
+            f"tempo={tempo:<5} billed_audio_s={usage['billed_audio_s']:<7} wall_s={wall_s:5.1f} "
+            f"words={len(_words(transcript)):<6} wer={wer:.3f}"
+        )
+        if args.show:
+            print(transcript, end="\n\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -45,15 +45,25 @@ def claim_transcription(db, user) -> bool:
     Rolls the counter over at the date boundary and commits, so concurrent workers see
     each other's claims. Callers that get False should defer rather than fail: brain
     builds are resumable, so a course simply continues tomorrow.
+
+    Ends the caller's transaction either way: it commits on both paths, which is what
+    releases the row lock taken on `user`. Pending changes are flushed before `user` is
+    re-read, so they are committed with the claim rather than lost.
     """
     if is_transcribe_limit_bypassed(user):
         return True
 
+    # The lectures of one build are separate jobs, possibly on several workers at once.
+    # Re-read the counter under a row lock so two claims on the last unit cannot both
+    # see it free. (SQLite has no row locks, and one writer anyway.)
+    db.flush()
+    db.refresh(user, with_for_update=True)
     today = date.today().isoformat()
     if user.transcribe_count_date != today:
         user.transcribe_count_today = 0
         user.transcribe_count_date = today
     if (user.transcribe_count_today or 0) >= DAILY_TRANSCRIBE_LIMIT:
+        db.commit()
         return False
     user.transcribe_count_today = (user.transcribe_count_today or 0) + 1
     db.commit()
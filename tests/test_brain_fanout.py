@@ -0,0 +1,157 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import course_brain
+import scheduler
+import spend_limits
+import worker
+from database import Assignment, Course, FileResource, Job, VOD, VodTranscript
+
+
+@pytest.fixture()
+def course(db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(course_brain, "FILES_ROOT", str(tmp_path))
+    course = Course(moodle_id=100, owner_id=test_user.id, name="자료구조", is_active=True, brain_enabled=True)
+    db.add(course)
+    db.commit()
+    db.add(Assignment(course_id=course.id, moodle_id=1, title="과제 1", url="https://ys.learnus.org/a1"))
+    db.add(Assignment(course_id=course.id, moodle_id=2, title="과제 2", url="https://ys.learnus.org/a2",
+                      description="이미 있음"))
+    for i in range(3):
+        db.add(VOD(moodle_id=600 + i, course_id=course.id, title=f"{i + 1}강", url=f"https://ys.learnus.org/v{i}"))
+    db.add(VodTranscript(moodle_id=600, transcript="[0:00] 이미 변환됨", status="done"))
+    db.add(FileResource(course_id=course.id, moodle_id=1, title="1주차", url="https://ys.learnus.org/f1.txt"))
+    db.add(FileResource(course_id=course.id, moodle_id=2, title="2주차", url="https://ys.learnus.org/f2.txt",
+                        content="이미 추출됨"))
+    db.commit()
+    return course
+
+
+def _children(db, parent):
+    return db.query(Job).filter(Job.parent_id == parent.id).order_by(Job.id).all()
+
+
+def test_build_is_planned_into_items_under_a_waiting_parent(db, course):
+    assert course_brain.enqueue_brain_build(db, course, full=True)
+    assert not course_brain.enqueue_brain_build(db, course)
+
+    parent = db.query(Job).filter_by(type="brain_build").one()
+    assert parent.status == "waiting" and parent.course_id == course.id
+    plan = [(c.type, c.payload["item_type"], c.payload.get("item_id")) for c in _children(db, parent)]
+    vods = {v.moodle_id: v.id for v in db.query(VOD)}
+    new_file = db.query(FileResource).filter_by(moodle_id=1).one().id
+    # Lectures and files alternate; the finished lecture and file are not planned at all.
+    assert plan == [
+        ("brain_build_item", "assignments", None),
+        ("brain_build_item", "vod", vods[601]),
+        ("brain_build_item", "file", new_file),
+        ("brain_build_item", "vod", vods[602]),
+    ]
+    assert course.brain_status == "queued"
+    assert ("file", new_file) in course_brain.queued_items(db, course)
+
+    # The parent is never handed to a worker; its children are, in the bulk lane.
+    bulk = next(lane for lane in worker.LANES if lane.name == "bulk")
+    claimed = worker._claim_jobs(db, bulk, 10)
+    assert {job["type"] for job in claimed} == {"brain_build_item"} and len(claimed) == 4
+
+
+class _Session:
+    def get(self, url, **kwargs):
+        class Response:
+            content, headers = "새 자료".encode(), {"Content-Type": "text/plain"}
+
+            def raise_for_status(self):
+                pass
+        response = Response()
+        response.url = url
+        return response
+
+
+class _Client:
+    session = _Session()
+
+    def get_assignment_detail(self, url):
+        return {"description": f"{url} 설명", "attachments": []}
+
+    def get_vod_stream_url(self, vod_moodle_id, viewer_url=None):
+        return f"https://cdn.example/{vod_moodle_id}.m3u8"
+
+
+class _FakeAI:
+    def transcribe_vod(self, m3u8, backend=None):
+        return f"[0:00] {m3u8}", {}
+
+
+@pytest.fixture()
+def fakes(db, monkeypatch):
+    monkeypatch.setattr(worker, "SessionLocal", sessionmaker(bind=db.get_bind()))
+    monkeypatch.setattr(worker, "AIService", _FakeAI)
+    monkeypatch.setattr(scheduler, "get_client", lambda user: _Client())
+
+
+def test_children_settle_the_parent_and_keep_the_budget_gate(db, course, test_user, fakes):
+    # One lecture's worth of budget left today.
+    test_user.transcribe_count_today = spend_limits.DAILY_TRANSCRIBE_LIMIT - 1
+    test_user.transcribe_count_date = date.today().isoformat()
+    db.commit()
+
+    course_brain.enqueue_brain_build(db, course, full=True)
+    parent = db.query(Job).filter_by(type="brain_build").one()
+    bulk = next(lane for lane in worker.LANES if lane.name == "bulk")
+    progress = []
+    while job := worker._claim_job(db, bulk):
+        worker._process_job(job["id"])
+        db.expire_all()
+        progress.append(course.brain_progress)
+
+    assert [c.status for c in _children(db, parent)] == ["done", "done", "done", "deferred"]
+    assert parent.status == "done"
+    assert progress == sorted(progress) and progress[-1] == 100
+    assert course.brain_status == "ready" and course.brain_error is None
+    assert course.brain_stage == "강의 1개는 내일 이어서 학습해요"
+    assert db.query(VodTranscript).filter_by(moodle_id=601).one().status == "done"
+    assert db.query(VodTranscript).filter_by(moodle_id=602).first() is None
+    assert db.query(Assignment).filter_by(moodle_id=1).one().description == "https://ys.learnus.org/a1 설명"
+    assert db.query(FileResource).filter_by(moodle_id=1).one().content == "새 자료"
+
+    # A re-run plans only what was deferred.
+    assert course_brain.enqueue_brain_build(db, course)
+    rerun = db.query(Job).filter_by(type="brain_build", status="waiting").one()
+    assert [c.payload["item_type"] for c in _children(db, rerun)] == ["vod"]
+
+
+def test_a_parent_left_waiting_by_a_dead_worker_is_settled_by_the_sweep(db, course, fakes, monkeypatch):
+    course_brain.enqueue_brain_build(db, course, full=True)
+    parent = db.query(Job).filter_by(type="brain_build").one()
+    bulk = next(lane for lane in worker.LANES if lane.name == "bulk")
+    claimed = worker._claim_jobs(db, bulk, 10)
+    for job in claimed[:-1]:
+        worker._process_job(job["id"])
+
+    # The last child's result is committed, then the worker dies before settling the parent.
+    settle = worker._settle_parent
+    monkeypatch.setattr(worker, "_settle_parent", lambda db, parent_id: None)
+    worker._process_job(claimed[-1]["id"])
+    monkeypatch.setattr(worker, "_settle_parent", settle)
+    db.expire_all()
+    assert all(c.status == "done" for c in _children(db, parent))
+    assert parent.status == "waiting" and course.brain_status != "ready"
+
+    worker._reclaim_expired_jobs(db)
+    db.expire_all()
+    assert parent.status == "done"
+    assert course.brain_status == "ready" and course.brain_progress == 100
+
+
+def test_a_spent_budget_claim_ends_the_transaction_and_keeps_pending_changes(db, test_user):
+    test_user.transcribe_count_today = spend_limits.DAILY_TRANSCRIBE_LIMIT
+    test_user.transcribe_count_date = date.today().isoformat()
+    db.commit()
+
+    test_user.push_token = "ExponentPushToken[fresh]"
+    assert not spend_limits.claim_transcription(db, test_user)
+    assert not db.in_transaction()   # the row lock is released
+    assert test_user.push_token == "ExponentPushToken[fresh]"
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+
+import course_brain
+from database import Assignment, Course, FileResource, VOD, VodTranscript
+
+
+class _Gauge:
+    """Counts calls in flight, overall and per key, and keeps the peaks."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now, self.peak = {}, {}
+
+    def __call__(self, *keys):
+        gauge = self
+
+        class _In:
+            def __enter__(self):
+                with gauge.lock:
+                    for key in keys:
+                        gauge.now[key] = gauge.now.get(key, 0) + 1
+                        gauge.peak[key] = max(gauge.peak.get(key, 0), gauge.now[key])
+
+            def __exit__(self, *exc):
+                with gauge.lock:
+                    for key in keys:
+                        gauge.now[key] -= 1
+
+        return _In()
+
+
+class _Response:
+    def __init__(self, url, content):
+        self.url, self.content, self.headers = url, content, {"Content-Type": "text/plain"}
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture()
+def course(db, test_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(course_brain, "FILES_ROOT", str(tmp_path))
+    course = Course(moodle_id=100, owner_id=test_user.id, name="자료구조", is_active=True, brain_enabled=True)
+    db.add(course)
+    db.commit()
+    return course
+
+
+@pytest.fixture()
+def flush_threads(db):
+    threads = set()
+    listener = lambda session, context, instances: threads.add(threading.current_thread().name)  # noqa: E731
+    event.listen(db, "before_flush", listener)
+    yield threads
+    event.remove(db, "before_flush", listener)
+
+
+def test_map_bounds_a_stage_and_yields_failures():
+    gauge = _Gauge()
+
+    def work(n):
+        with gauge("all"):
+            time.sleep(0.02)
+        if n == 3:
+            raise ValueError("bad item")
+        return n * 10
+
+    with course_brain.FetchExecutor(limits={"captions": 2}) as executor:
+        results = {item: (result, error) for item, result, error in executor.map("captions", work, range(8))}
+
+    assert gauge.peak["all"] == 2
+    assert results[5] == (50, None)
+    assert results[3][0] is None and isinstance(results[3][1], ValueError)
+
+
+def test_files_download_concurrently_and_are_written_on_the_calling_thread(db, course, flush_threads):
+    hosts = ["https://ys.learnus.org", "https://cdn.example"]
+    for i in range(8):
+        db.add(FileResource(course_id=course.id, moodle_id=i, title=f"자료 {i}", url=f"{hosts[i % 2]}/f{i}.txt"))
+    db.commit()
+    flush_threads.clear()
+    gauge = _Gauge()
+
+    class Session:
+        def get(self, url, **kwargs):
+            with gauge("all", url.split("/")[2]):
+                time.sleep(0.05)
+            if url.endswith("f5.txt"):
+                raise ConnectionError("reset by peer")
+            return _Response(url, f"본문 {url}".encode())
+
+    executor = course_brain.FetchExecutor(limits={"downloads": 6}, per_host=2)
+    progress = []
+    with executor:
+        summary = course_brain.build_course_files(
+            Session(), db, course, on_progress=lambda done, total, _: progress.append(done), executor=executor,
+        )
+
+    assert gauge.peak["all"] == 4   # two hosts, two slots each
+    assert gauge.peak["ys.learnus.org"] == 2 and gauge.peak["cdn.example"] == 2
+    assert summary["ok"] == 7 and summary["error"] == 1
+    assert progress == list(range(1, 9))
+    assert flush_threads == {threading.current_thread().name}
+
+    failed = db.query(FileResource).filter_by(moodle_id=5).one()
+    assert failed.extract_status == "error" and "reset by peer" in failed.extract_error
+    assert db.query(FileResource).filter_by(moodle_id=2).one().content == "본문 https://ys.learnus.org/f2.txt"
+
+
+def test_assignment_failures_are_counted_without_ending_the_stage(db, course, flush_threads):
+    for i in range(6):
+        db.add(Assignment(course_id=course.id, moodle_id=i, title=f"과제 {i}", url=f"https://ys.learnus.org/a{i}"))
+    db.add(Assignment(course_id=course.id, moodle_id=9, title="완료", url="https://ys.learnus.org/a9",
+                      description="이미 있음"))
+    db.commit()
+    flush_threads.clear()
+    gauge = _Gauge()
+
+    class Client:
+        def get_assignment_detail(self, url):
+            with gauge("all"):
+                time.sleep(0.03)
+            if url.endswith("a1"):
+                raise TimeoutError("read timed out")
+            return {"description": None if url.endswith("a2") else f"{url} 설명", "attachments": []}
+
+    executor = course_brain.FetchExecutor(limits={"assignments": 3})
+    with executor:
+        summary = course_brain.fetch_assignment_descriptions(Client(), db, course, executor=executor)
+
+    assert summary == {"total": 7, "fetched": 4, "skipped": 1, "empty": 1, "failed": 1}
+    assert gauge.peak["all"] == 3
+    assert flush_threads == {threading.current_thread().name}
+    assert db.query(Assignment).filter_by(moodle_id=4).one().description == "https://ys.learnus.org/a4 설명"
+    assert db.query(Assignment).filter_by(moodle_id=1).one().description_fetched_at is None
+
+
+def test_files_are_built_while_lectures_transcribe(db, course, flush_threads):
+    for i in range(4):
+        db.add(FileResource(course_id=course.id, moodle_id=i, title=f"자료 {i}", url=f"https://ys.learnus.org/f{i}.txt"))
+    for i in range(3):
+        db.add(VOD(moodle_id=600 + i, course_id=course.id, title=f"{i + 1}강", url=f"https://ys.learnus.org/v{i}"))
+    db.commit()
+    flush_threads.clear()
+    files_fetched = threading.Event()
+    fetched = []
+
+    class Session:
+        def get(self, url, **kwargs):
+            fetched.append(url)
+            if len(fetched) == 4:
+                files_fetched.set()
+            return _Response(url, f"본문 {url}".encode())
+
+    class Client:
+        base_url = "https://ys.learnus.org"
+        session = Session()
+
+        def get_assignment_detail(self, url):
+            return {"description": None, "attachments": []}
+
+        def get_vod_stream_url(self, vod_moodle_id, viewer_url=None):
+            return f"https://cdn.example/{vod_moodle_id}.m3u8"
+
+    class AI:
+        def transcribe_vod(self, m3u8, backend=None):
+            # A sequential build would not reach the files until this returned.
+            assert files_fetched.wait(timeout=5)
+            return f"[0:00] {m3u8} 강의", {}
+
+    budget = iter([True, True, False])
+    stages = []
+    summary = course_brain.build_course_brain(
+        Client(), db, course, AI(), on_stage=lambda *args: stages.append(args),
+        can_transcribe=lambda: next(budget),
+    )
+
+    assert summary["vods"] == {"total": 3, "ok": 2, "skipped": 0, "failed": 0, "deferred": 1}
+    assert summary["files"]["ok"] == 4 and not summary["errors"]
+    assert db.query(VodTranscript).filter_by(moodle_id=601).one().status == "done"
+    assert db.query(VodTranscript).filter_by(moodle_id=602).first() is None
+    assert flush_threads == {threading.current_thread().name}
+
+    # Each stage's own count only moves forward, however the two interleave.
+    for name in ("vods", "files"):
+        done = [d for stage, d, _ in stages if stage == name]
+        assert done == sorted(done)
+    assert stages[-1] == ("vods", 3, 3)
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import api
+import course_brain
+from database import Board, Course, FileResource, Post, VOD, VodTranscript
+
+
+@pytest.fixture(autouse=True)
+def _empty_indexes():
+    course_brain._indexes.clear()
+    yield
+    course_brain._indexes.clear()
+
+
+@pytest.fixture()
+def course(db, test_user):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="자료구조", is_active=True, brain_enabled=True)
+    db.add(course)
+    db.commit()
+    slides = "\n\n".join([
+        "[p.1]\n스택은 후입선출 구조입니다.",
+        "[p.2]\n" + "큐는 선입선출 구조입니다. " * 60,
+        "[p.3]\n우선순위 큐는 힙으로 구현합니다. Heap insert is O(log n).",
+    ])
+    db.add(FileResource(course_id=course.id, moodle_id=1, title="2주차 슬라이드", content=slides, section=2, week="2주차"))
+    db.add(VOD(moodle_id=550, course_id=course.id, title="1강", url="http://example.com/v", section=1, week="1주차"))
+    db.add(VodTranscript(moodle_id=550, transcript="[0:00] 오늘은 연결 리스트를 배웁니다\n[2:00] 노드는 다음 노드를 가리킵니다"))
+    board = Board(moodle_id=7, course_id=course.id, title="공지", section=0, week="공지")
+    db.add(board)
+    db.commit()
+    db.add(Post(board_id=board.id, title="중간고사", content="<p>중간고사는 10월 20일입니다</p>"))
+    db.commit()
+    return course
+
+
+def test_hangul_is_indexed_as_bigrams_and_latin_as_words():
+    assert course_brain.tokenize("스택을 Push") == ["push", "스택", "택을"]
+    assert course_brain.tokenize("큐") == ["큐"]
+
+
+def test_retrieval_sends_matching_passages_under_the_full_corpus_refs(db, course):
+    _, full_sources = course_brain.assemble_corpus(db, course)
+    excerpt, sources = course_brain.retrieve_corpus(db, course, "힙으로 구현하는 우선순위 큐의 삽입", k=1)
+
+    assert sources == full_sources
+    slides = next(s for s in sources if s["type"] == "file")
+    assert f"### [{slides['ref']}] 강의자료: 2주차 슬라이드" in excerpt
+    # The page chunk starts mid-document, so it carries its page marker for slide embeds.
+    assert "[p.3]\n우선순위 큐는 힙으로 구현합니다." in excerpt
+    assert "연결 리스트" not in excerpt and "중간고사" not in excerpt
+    assert course_brain.retrieve_corpus(db, course, "안녕하세요") is None
+
+
+def test_index_reindexes_only_the_items_that_changed(db, course):
+    course_brain.retrieve_corpus(db, course, "스택")
+    index = course_brain._indexes[course.id]
+    assert index.update(course_brain._corpus_items(db, course), index.version) == 0
+
+    db.query(Post).first().content = "<p>중간고사는 10월 27일로 연기되었습니다</p>"
+    db.commit()
+    db.expire(course)
+    assert index.update(course_brain._corpus_items(db, course), course.brain_corpus_version) == 1
+    excerpt, _ = course_brain.retrieve_corpus(db, course, "중간고사 연기", k=1)
+    assert "27일로 연기" in excerpt
+
+
+def test_brain_chat_in_retrieval_mode_sends_excerpts(client, db, auth_headers, test_user, course, monkeypatch):
+    test_user.labs_unlocked = True
+    test_user.brain_enabled = True
+    db.commit()
+    sent = {}
+
+    class FakeAI:
+        def chat_about_course_stream(self, corpus, course_name, messages, excerpts=False):
+            sent.update(corpus=corpus, excerpts=excerpts)
+            yield "token", "스택은 후입선출이에요 [S3]"
+            yield "usage", {"model": "test", "prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+
+    monkeypatch.setattr(api, "AIService", FakeAI)
+    monkeypatch.setattr(api, "SessionLocal", sessionmaker(bind=db.get_bind()))   # usage logging
+    resp = client.post(
+        f"/courses/{course.id}/brain/chat",
+        json={"messages": [{"role": "user", "content": "스택이 뭐예요?"}], "mode": "retrieval"},
+        headers=auth_headers,
+    )
+
+    assert resp.status_code == 200
+    assert sent["excerpts"] is True
+    assert "후입선출" in sent["corpus"] and "연결 리스트" not in sent["corpus"]
+    done = json.loads(resp.text.split("event: done\ndata: ")[1].split("\n")[0])
+    assert [c["type"] for c in done["citations"]] == ["file"]
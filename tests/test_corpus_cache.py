@@ -0,0 +1,93 @@
+import pytest
+
+import course_brain
+from database import Board, Course, CorpusCache, FileResource, Post, VOD, VodTranscript
+
+
+@pytest.fixture(autouse=True)
+def _empty_lru():
+    course_brain._corpus_cache.clear()
+    yield
+    course_brain._corpus_cache.clear()
+
+
+@pytest.fixture()
+def course(db, test_user):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="자료구조", is_active=True, brain_enabled=True)
+    db.add(course)
+    db.commit()
+    db.add(FileResource(course_id=course.id, moodle_id=1, title="1주차", content="스택과 큐", section=1, week="1주차"))
+    db.add(VOD(moodle_id=540, course_id=course.id, title="1강", url="http://example.com/v", section=1, week="1주차"))
+    board = Board(moodle_id=7, course_id=course.id, title="공지")
+    db.add(board)
+    db.commit()
+    db.add(Post(board_id=board.id, title="휴강", content="<p>다음 주 휴강</p>"))
+    db.commit()
+    return course
+
+
+def _version(db, course):
+    db.expire(course)
+    return course.brain_corpus_version
+
+
+def test_corpus_version_follows_content_not_progress(db, course):
+    start = _version(db, course)
+
+    transcript = VodTranscript(moodle_id=540, status="running", stage="transcribing", progress_pct=40)
+    db.add(transcript)
+    db.commit()
+    transcript.progress_pct = 80
+    db.commit()
+    assert _version(db, course) == start
+
+    transcript.transcript = "[0:00] 오늘은 스택을 배웁니다"
+    db.commit()
+    assert _version(db, course) == start + 1
+
+    db.query(Post).first().content = "<p>휴강 취소</p>"
+    db.commit()
+    assert _version(db, course) == start + 2
+
+    db.query(FileResource).first().is_completed = True   # not part of the corpus
+    db.commit()
+    assert _version(db, course) == start + 2
+
+
+def test_chat_corpus_is_assembled_once_per_version(db, course, monkeypatch):
+    calls = []
+    real = course_brain.assemble_corpus
+    monkeypatch.setattr(course_brain, "assemble_corpus", lambda db, c: calls.append(c.id) or real(db, c))
+
+    corpus, sources = course_brain.cached_corpus(db, course)
+    assert "스택과 큐" in corpus and "다음 주 휴강" in corpus
+    assert course_brain.cached_corpus(db, course) == (corpus, sources)
+    assert len(calls) == 1
+
+    # A restarted API process has no LRU but finds the stored copy.
+    course_brain._corpus_cache.clear()
+    assert course_brain.cached_corpus(db, course) == (corpus, sources)
+    assert len(calls) == 1
+    assert db.query(CorpusCache).filter_by(course_id=course.id).one().version == course.brain_corpus_version
+
+    db.query(FileResource).first().content = "힙과 우선순위 큐"
+    db.commit()
+    corpus, _ = course_brain.cached_corpus(db, course)
+    assert "힙과 우선순위 큐" in corpus and "스택과 큐" not in corpus
+    assert len(calls) == 2
+
+
+def test_lru_keeps_the_most_recent_courses(db, test_user, monkeypatch):
+    monkeypatch.setattr(course_brain, "CORPUS_CACHE_ENTRIES", 2)
+    courses = []
+    for i in range(3):
+        course = Course(moodle_id=200 + i, owner_id=test_user.id, name=f"과목 {i}", is_active=True)
+        db.add(course)
+        db.commit()
+        db.add(FileResource(course_id=course.id, moodle_id=i, title="자료", content=f"내용 {i}"))
+        db.commit()
+        courses.append(course)
+
+    for course in (courses[0], courses[1], courses[0], courses[2]):
+        course_brain.cached_corpus(db, course)
+    assert list(course_brain._corpus_cache) == [courses[0].id, courses[2].id]
@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import eta_model
+from database import Course, EtaModel, Job, VOD, VodTranscript
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    eta_model.clear_cache()
+    yield
+    eta_model.clear_cache()
+
+
+def _timing_rows(n=20, backend="openai"):
+    # Transcription at 0.1 s per lecture second plus 20 s, extraction a flat 10 s.
+    for i in range(n):
+        duration = 600 + 300 * i
+        transcribing = 20 + 0.1 * duration
+        yield {
+            "type": "transcribe_timing", "status": "done", "backend": backend,
+            "media_duration_s": duration, "total_s": 10 + transcribing + 2,
+            "stage_durations_s": {"extracting_audio": 10, "transcribing": transcribing, "finalizing": 2},
+        }
+
+
+def test_fit_recovers_per_stage_throughput_from_the_log(tmp_path):
+    log = tmp_path / "timing.jsonl"
+    lines = [json.dumps(row) for row in _timing_rows()]
+    lines += [json.dumps({"type": "transcribe_timing", "status": "failed", "total_s": 4}), "not json"]
+    log.write_text("\n".join(lines) + "\n")
+
+    rows = eta_model.read_timing_log(str(log))
+    assert len(rows) == 20
+    model = eta_model.fit(rows, slots_per_worker=4)
+    fitted = model["backends"]["openai"]
+    assert fitted["stages"]["transcribing"] == (20.0, 0.1)
+    assert fitted["stages"]["extracting_audio"] == (10.0, 0.0)
+    assert model["default"] == "openai"
+    assert eta_model.fit(rows[:eta_model.MIN_SAMPLES - 1], slots_per_worker=4) is None
+
+
+def test_estimate_counts_the_queue_against_worker_slots():
+    model = eta_model.fit(list(_timing_rows()), slots_per_worker=2)
+    lecture = 3000
+    alone = eta_model.estimate(model, lecture, 0, 2, "queued")
+    # One ahead still runs alongside on the second slot; three ahead means waiting for two.
+    assert eta_model.estimate(model, lecture, 1, 2, "queued") == alone
+    assert eta_model.estimate(model, lecture, 3, 2, "queued")["low"] > alone["low"]
+    assert eta_model.estimate(model, lecture, 3, 4, "queued") == alone
+
+    halfway = eta_model.estimate(model, lecture, 0, 2, "transcribing", 52)
+    assert halfway["high"] < eta_model.estimate(model, lecture, 0, 2, "transcribing", 10)["high"]
+    assert eta_model.estimate(model, None, 0, 2, "queued") is None
+
+
+def test_transcribe_status_uses_the_stored_model(client, test_user, auth_headers, db):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True)
+    db.add(course)
+    db.commit()
+    db.add(VOD(moodle_id=530, course_id=course.id, title="Lecture", url="http://example.com/v"))
+    db.add(VodTranscript(moodle_id=530, is_processing=True, status="queued", stage="queued", media_duration_s=3000.0))
+    lease = datetime.now() + timedelta(minutes=2)
+    for i in range(3):
+        db.add(Job(type="transcribe", status="processing", payload={"vod_moodle_id": 900 + i},
+                   lease_owner="worker-a", lease_expires_at=lease))
+    db.add(Job(type="transcribe", status="pending", payload={"vod_moodle_id": 530, "user_id": test_user.id}))
+    db.commit()
+
+    coefficients = eta_model.fit(list(_timing_rows()), slots_per_worker=2)
+    db.add(EtaModel(name=eta_model.TRANSCRIBE_MODEL_NAME, coefficients=coefficients, samples=20))
+    db.commit()
+
+    eta = client.get("/vods/530/transcribe/status", headers=auth_headers).json()["eta_seconds"]
+    assert eta == eta_model.estimate(coefficients, 3000.0, 3, 2, "queued")
+
+    # A second live worker doubles the slots, so the three ahead no longer hold this one up.
+    db.add(Job(type="transcribe", status="processing", payload={"vod_moodle_id": 910},
+               lease_owner="worker-b", lease_expires_at=lease))
+    db.commit()
+    eta_model.clear_cache()
+    sooner = client.get("/vods/530/transcribe/status", headers=auth_headers).json()["eta_seconds"]
+    assert sooner == eta_model.estimate(coefficients, 3000.0, 3, 4, "queued")
+    assert sooner["low"] < eta["low"]
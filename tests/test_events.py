@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+
+import api
+import events
+import worker
+from database import Course, Job, VOD, VodTranscript
+
+
+def _drain(sub, timeout=0.05):
+    async def _collect():
+        items = []
+        while (item := await sub.get(timeout)) is not None:
+            items.append(item)
+        return items
+    return _collect()
+
+
+def test_events_are_delivered_on_commit_and_dropped_on_rollback(db):
+    async def scenario():
+        sub = events.broker.subscribe(7)
+        other = events.broker.subscribe(9)
+        try:
+            events.publish(db, 7, "brain", {"course_id": 1, "status": "building"})
+            db.rollback()
+            events.publish(db, [7, 8], "job", {"job_id": 3, "status": "done"})
+            assert await sub.get(0.05) is None   # not before the commit
+            db.commit()
+            assert await _drain(sub) == [("job", {"job_id": 3, "status": "done"})]
+            assert await _drain(other) == []
+        finally:
+            events.broker.unsubscribe(sub)
+            events.broker.unsubscribe(other)
+    asyncio.run(scenario())
+
+
+def test_a_stream_that_falls_behind_gets_one_resync(db, monkeypatch):
+    monkeypatch.setattr(events, "SUBSCRIBER_BACKLOG", 3)
+
+    async def scenario():
+        sub = events.broker.subscribe(7)
+        try:
+            for i in range(5):
+                events.publish(db, 7, "brain", {"progress": i})
+            db.commit()
+            # The fourth overflowed: the backlog is replaced by a resync, then delivery goes on.
+            assert await _drain(sub) == [(events.RESYNC, None), ("brain", {"progress": 4})]
+        finally:
+            events.broker.unsubscribe(sub)
+    asyncio.run(scenario())
+
+
+def test_opening_too_many_streams_closes_the_oldest(db, monkeypatch):
+    monkeypatch.setattr(events, "MAX_SUBSCRIBERS_PER_USER", 2)
+
+    async def scenario():
+        subs = [events.broker.subscribe(7) for _ in range(3)]
+        try:
+            events.publish(db, 7, "brain", {"progress": 1})
+            db.commit()
+            assert await _drain(subs[0]) == [(events.CLOSE, None)]
+            for sub in subs[1:]:
+                assert await _drain(sub) == [("brain", {"progress": 1})]
+        finally:
+            for sub in subs:
+                events.broker.unsubscribe(sub)
+    asyncio.run(scenario())
+
+
+def test_worker_transcript_writes_reach_every_owner_of_the_lecture(db, test_user):
+    from database import User
+
+    other = User(username="other", api_token="other-token")
+    db.add(other)
+    db.commit()
+    for owner, course_moodle_id in ((test_user, 100), (other, 101)):
+        course = Course(moodle_id=course_moodle_id, owner_id=owner.id, name="Shared", is_active=True)
+        db.add(course)
+        db.commit()
+        db.add(VOD(moodle_id=520, course_id=course.id, title="Shared lecture", url="http://example.com/v"))
+    db.commit()
+
+    async def scenario():
+        subs = [events.broker.subscribe(test_user.id), events.broker.subscribe(other.id)]
+        try:
+            worker._set_transcript_status(db, 520, status="running", stage="transcribing", progress_pct=40)
+            for sub in subs:
+                (event, data), = await _drain(sub)
+                assert event == "transcribe"
+                assert data["vod_moodle_id"] == 520 and data["stage"] == "transcribing" and data["progress_pct"] == 40
+        finally:
+            for sub in subs:
+                events.broker.unsubscribe(sub)
+    asyncio.run(scenario())
+
+
+def _frames(lines):
+    """(event, data) pairs from SSE lines, skipping keep-alive comments."""
+    event = None
+    for line in lines:
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+
+def test_progress_stream_opens_with_state_then_follows_events(client, test_user, auth_headers, db, monkeypatch):
+    monkeypatch.setattr(api, "EVENTS_SNAPSHOT_SECONDS", 60)
+    monkeypatch.setattr(api, "EVENTS_STREAM_MAX_SECONDS", 1)
+    course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True,
+                    brain_enabled=True, brain_status="building", brain_progress=30, brain_stage="강의 변환 중")
+    db.add(course)
+    db.commit()
+    db.add(VOD(moodle_id=521, course_id=course.id, title="Lecture", url="http://example.com/v"))
+    db.add(VodTranscript(moodle_id=521, is_processing=True, status="running", stage="transcribing", progress_pct=20))
+    db.add(Job(type="transcribe", status="processing", payload={"vod_moodle_id": 521, "user_id": test_user.id}))
+    db.add(Job(type="transcribe", status="processing", payload={"vod_moodle_id": 999, "user_id": test_user.id + 1}))
+    db.commit()
+    building = {"course_id": course.id, "status": "building", "progress": 30, "stage": "강의 변환 중", "error": None}
+
+    def _publish():
+        events.publish(db, test_user.id, "brain", {**building, "progress": 55})
+        db.commit()
+
+    # The test client hands the body over when the stream ends, so publish while it runs.
+    threading.Timer(0.3, _publish).start()
+    resp = client.get("/events", headers=auth_headers)
+
+    assert resp.status_code == 200
+    frames = list(_frames(resp.text.splitlines()))
+    snapshot = dict(frames[:2])
+    assert snapshot["transcribe"]["vod_moodle_id"] == 521
+    assert snapshot["transcribe"]["progress_pct"] == 20
+    assert snapshot["brain"] == building
+    assert frames[2:] == [("brain", {**building, "progress": 55})]
+
+
+def test_progress_stream_requires_auth(client):
+    assert client.get("/events").status_code in (401, 403)
@@ -0,0 +1,190 @@
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+import hls
+
+MEDIA = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:11
+#EXT-X-MEDIA-SEQUENCE:0
+#EXTINF:10.010,
+seg0.ts
+#EXTINF:10.010,
+seg1.ts
+#EXTINF:4.5,
+https://cdn.example/other/seg2.ts
+#EXT-X-ENDLIST
+"""
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=2400000,RESOLUTION=1280x720
+720p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+360p/index.m3u8
+"""
+
+MASTER_AUDIO_RENDITION = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="ko",DEFAULT=YES,URI="audio/ko.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=800000,CODECS="avc1.4d401e",AUDIO="aud"
+360p/index.m3u8
+"""
+
+MASTER_AUDIO_VARIANT = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,CODECS="avc1.4d401e,mp4a.40.2"
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=96000,CODECS="mp4a.40.2"
+audio/index.m3u8
+"""
+
+FMP4_ENCRYPTED = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-MAP:URI="init.mp4"
+#EXT-X-KEY:METHOD=AES-128,URI="https://keys.example/k",IV=0x1
+#EXTINF:6.0,
+seg0.m4s
+#EXT-X-ENDLIST
+"""
+
+
+def test_media_playlist_gives_exact_duration_and_segment_offsets():
+    playlist, variant = hls.parse_playlist(MEDIA, "https://vod.example/lec/42/index.m3u8?token=abc")
+    assert variant is None
+    assert playlist.ended
+    assert playlist.target_duration == 11
+    assert playlist.duration == pytest.approx(24.52)
+    assert [s.uri for s in playlist.segments] == [
+        "https://vod.example/lec/42/seg0.ts",
+        "https://vod.example/lec/42/seg1.ts",
+        "https://cdn.example/other/seg2.ts",
+    ]
+    assert [s.start for s in playlist.segments] == pytest.approx([0, 10.01, 20.02])
+
+
+def test_master_playlist_points_at_the_smallest_variant():
+    playlist, variant = hls.parse_playlist(MASTER, "https://vod.example/lec/42/master.m3u8")
+    assert playlist is None
+    assert variant == "https://vod.example/lec/42/360p/index.m3u8"
+
+
+def test_master_playlist_prefers_audio_only_renditions():
+    url = "https://vod.example/lec/42/master.m3u8"
+    assert hls.parse_playlist(MASTER_AUDIO_RENDITION, url)[1] == "https://vod.example/lec/42/audio/ko.m3u8"
+    assert hls.parse_playlist(MASTER_AUDIO_VARIANT, url)[1] == "https://vod.example/lec/42/audio/index.m3u8"
+
+
+def test_load_follows_the_master_playlist(tmp_path):
+    (tmp_path / "360p").mkdir()
+    (tmp_path / "master.m3u8").write_text(MASTER)
+    (tmp_path / "360p" / "index.m3u8").write_text(MEDIA)
+    playlist = hls.load_playlist(str(tmp_path / "master.m3u8"))
+    assert len(playlist.segments) == 3
+    assert playlist.segments[0].uri == str(tmp_path / "360p" / "seg0.ts")
+
+
+def test_non_playlists_are_rejected_without_reading_them_whole(tmp_path):
+    video = tmp_path / "lecture.mp4"
+    video.write_bytes(b"\x00\x00\x00\x20ftypisom" + b"\x00" * 1000)
+    assert hls.try_load_playlist(str(video)) is None
+    with pytest.raises(ValueError):
+        hls.parse_playlist("<html>login</html>", "https://ys.learnus.org/")
+
+
+def test_init_segment_and_encryption_are_recorded():
+    playlist, _ = hls.parse_playlist(FMP4_ENCRYPTED, "https://vod.example/lec/42/index.m3u8")
+    assert playlist.map_uri == "https://vod.example/lec/42/init.mp4"
+    assert playlist.encrypted
+    assert not hls.parse_playlist(MEDIA, "https://vod.example/x.m3u8")[0].encrypted
+
+
+@pytest.fixture()
+def segment_server():
+    """Serves /seg<n> slowly, counting requests and the most served at once."""
+    stats = {"requests": 0, "in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            with lock:
+                stats["requests"] += 1
+                stats["in_flight"] += 1
+                stats["peak"] = max(stats["peak"], stats["in_flight"])
+            time.sleep(0.05)
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with lock:
+                stats["in_flight"] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", stats
+    server.shutdown()
+
+
+def _playlist(base, count):
+    return hls.Playlist(
+        url=f"{base}/index.m3u8",
+        segments=[hls.Segment(uri=f"{base}/seg{i}", duration=2.0, start=2.0 * i) for i in range(count)],
+        ended=True,
+    )
+
+
+def test_segments_download_concurrently_and_come_back_in_order(tmp_path, segment_server):
+    base, stats = segment_server
+    cache = hls.SegmentCache(_playlist(base, 12), str(tmp_path), concurrency=4).start()
+    try:
+        bodies = [open(path, "rb").read() for path in cache.files()]
+    finally:
+        cache.stop()
+    assert bodies == [f"/seg{i}".encode() for i in range(12)]
+    assert stats["peak"] > 1
+    assert cache.downloaded == 12 and cache.reused == 0
+
+
+def test_downloads_stay_a_window_ahead_of_the_reader(tmp_path, segment_server):
+    base, stats = segment_server
+    cache = hls.SegmentCache(_playlist(base, 12), str(tmp_path), concurrency=2, prefetch=3).start()
+    try:
+        for read, path in enumerate(cache.files(), start=1):
+            time.sleep(0.1)   # a slow ffmpeg
+            assert stats["requests"] <= read + 3
+            # As if a chunk ending with the previous segment had been checkpointed.
+            cache.release_before(2.0 * (read - 1))
+            assert len(os.listdir(tmp_path)) <= 1 + 3 + 2   # read, the window, partial files
+    finally:
+        cache.stop()
+    assert stats["requests"] == 12
+    assert sorted(os.listdir(tmp_path)) == ["seg_00011"]
+
+
+def test_a_retry_reuses_segments_a_killed_worker_left(tmp_path, segment_server):
+    base, stats = segment_server
+    for i in range(2, 6):
+        (tmp_path / f"seg_{i:05d}").write_bytes(f"/seg{i}".encode())
+
+    retry = hls.SegmentCache(_playlist(base, 6), str(tmp_path), concurrency=2).start(first_index=2)
+    assert len(list(retry.files(2))) == 4
+    retry.stop()
+    assert stats["requests"] == 0
+    assert retry.reused == 4 and retry.downloaded == 0
+    assert retry.segment_for(5.0) == 2
+
+
+def test_prune_removes_only_stale_caches(tmp_path):
+    stale, fresh = tmp_path / "1", tmp_path / "2"
+    stale.mkdir()
+    fresh.mkdir()
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+    assert hls.prune_cache(str(tmp_path), 3600) == 1
+    assert not stale.exists() and fresh.exists()
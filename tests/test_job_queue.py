@@ -0,0 +1,62 @@
+import threading
+import time
+
+import job_queue
+from database import Job
+
+
+def test_enqueue_adds_pending_job_without_committing(db):
+    job = job_queue.enqueue(db, "watch_all", {"user_id": 7})
+    db.rollback()
+    assert db.query(Job).count() == 0
+
+    job = job_queue.enqueue(db, "watch_all", {"user_id": 7})
+    db.commit()
+    stored = db.query(Job).one()
+    assert stored.id == job.id
+    assert stored.status == "pending"
+    assert stored.payload == {"user_id": 7}
+
+
+
+def test_enqueue_copies_payload_keys_into_indexed_columns(db):
+    job_queue.enqueue(db, "transcribe", {"vod_moodle_id": 501, "user_id": 7, "m3u8_url": "https://x/y.m3u8"})
+    job_queue.enqueue(db, "brain_build", {"course_id": 3, "user_id": 7, "full": True})
+    job_queue.enqueue(db, "watch_all", {"user_id": "7"})
+    db.commit()
+
+    keys = [(j.type, j.vod_moodle_id, j.course_id, j.user_id) for j in db.query(Job).order_by(Job.id)]
+    assert keys == [
+        ("transcribe", 501, None, 7),
+        ("brain_build", None, 3, 7),
+        ("watch_all", None, None, None),   # not an integer: left out rather than guessed
+    ]
+
+def test_notify_is_a_noop_on_sqlite(db):
+    """SQLite has no NOTIFY; enqueueing must still work there for local development."""
+    assert not job_queue.is_postgres(db)
+    job_queue.notify(db)  # must not raise or emit SQL SQLite cannot parse
+    db.commit()
+
+
+def test_job_signal_wakes_on_set_and_times_out_otherwise(db):
+    signal = job_queue.JobSignal(db.get_bind())
+    assert not signal.postgres
+
+    started = time.perf_counter()
+    assert signal.wait(0.05) is False
+    assert time.perf_counter() - started >= 0.04
+
+    threading.Timer(0.02, signal.set).start()
+    started = time.perf_counter()
+    assert signal.wait(5) is True
+    assert time.perf_counter() - started < 1
+
+
+def test_job_signal_keeps_a_set_that_lands_after_a_timeout(db):
+    """A job enqueued between a timed-out wait and the next one must not be slept through."""
+    signal = job_queue.JobSignal(db.get_bind())
+    assert signal.wait(0.01) is False
+    signal.set()
+    assert signal.wait(0) is True
+    assert signal.wait(0) is False
@@ -0,0 +1,368 @@
+import http.server
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import ai_service
+import hls
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+
+
+@pytest.fixture(autouse=True)
+def fixed_chunk_length(monkeypatch):
+    """Most tests here pin TRANSCRIBE_CHUNK_SECONDS; planning from the duration would override it."""
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_ADAPTIVE_CHUNKS", False)
+
+
+class _FakeTranscriptions:
+    """Stands in for the OpenAI transcriptions endpoint; records what it was sent, and when."""
+
+    def __init__(self, on_call=None):
+        self.calls = []
+        self.on_call = on_call
+
+    def create(self, model, file, response_format):
+        name = file.name.rsplit("/", 1)[-1]
+        self.calls.append(name)
+        if self.on_call:
+            self.on_call(len(self.calls))
+        return f"passage {int(name[6:10]) + 1}"
+
+
+def _service(transcriptions):
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.client = type("Client", (), {"audio": type("Audio", (), {"transcriptions": transcriptions})})()
+    service._probe_duration_seconds = lambda _url: None
+    return service
+
+
+@pytest.fixture()
+def lecture(tmp_path):
+    path = tmp_path / "lecture.m4a"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "sine=frequency=440:duration=7",
+         "-c:a", "aac", str(path)],
+        check=True,
+    )
+    return str(path)
+
+
+def test_chunks_are_transcribed_in_order_with_their_start_times(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    transcriptions = _FakeTranscriptions()
+    stages = []
+
+    transcript, usage = _service(transcriptions).transcribe_vod(lecture, on_stage=stages.append, concurrency=1)
+
+    assert transcriptions.calls == ["chunk_0000.mp3", "chunk_0001.mp3", "chunk_0002.mp3", "chunk_0003.mp3"]
+    assert transcript.split("\n\n") == [
+        "[00:00] passage 1", "[00:02] passage 2", "[00:04] passage 3", "[00:06] passage 4",
+    ]
+    assert stages == ["extracting_audio", "transcribing", "finalizing"]
+    assert usage["model"] == ai_service.TRANSCRIBE_MODEL
+
+
+def test_first_chunk_is_sent_before_extraction_finishes(tmp_path, monkeypatch):
+    """The point of the pipeline: transcription starts while ffmpeg is still downloading."""
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    audio = tmp_path / "lecture.mp3"
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "sine=duration=8", str(audio)], check=True)
+    body = audio.read_bytes()
+    served = threading.Event()
+
+    class SlowHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/mpeg")
+            self.end_headers()
+            step = len(body) // 20
+            for i in range(0, len(body), step):
+                self.wfile.write(body[i:i + step])
+                self.wfile.flush()
+                time.sleep(0.1)
+            served.set()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sent_while_downloading = []
+    transcriptions = _FakeTranscriptions(on_call=lambda n: sent_while_downloading.append(not served.is_set()))
+    try:
+        _service(transcriptions).transcribe_vod(f"http://127.0.0.1:{server.server_port}/lecture.mp3")
+    finally:
+        server.shutdown()
+
+    assert len(transcriptions.calls) == 4
+    assert sent_while_downloading[0] is True
+
+
+def test_parallel_chunks_are_reassembled_in_lecture_order(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    monkeypatch.setattr(ai_service.AIService, "_probe_duration_seconds", lambda self, url: 7.0)
+    in_flight = []
+    peak = [0]
+    lock = threading.Lock()
+
+    class SlowFirst(_FakeTranscriptions):
+        def create(self, model, file, response_format):
+            with lock:
+                in_flight.append(1)
+                peak[0] = max(peak[0], len(in_flight))
+            # Earlier chunks take longer, so they finish last.
+            time.sleep(0.4 - 0.1 * int(file.name[-8:-4]))
+            with lock:
+                in_flight.pop()
+            return super().create(model, file, response_format)
+
+    service = _service(SlowFirst())
+    del service._probe_duration_seconds
+    progress = []
+    transcript, _ = service.transcribe_vod(
+        lecture, concurrency=4, on_progress=lambda stage, pct, msg: progress.append((stage, pct, msg)),
+    )
+
+    assert transcript.split("\n\n") == [
+        "[00:00] passage 1", "[00:02] passage 2", "[00:04] passage 3", "[00:06] passage 4",
+    ]
+    assert peak[0] > 1
+    transcribing = [(pct, msg) for stage, pct, msg in progress if stage == "transcribing"]
+    assert [msg for _, msg in transcribing] == ["0/4", "1/4", "2/4", "3/4", "4/4"]
+    assert [pct for pct, _ in transcribing] == sorted(pct for pct, _ in transcribing)
+    assert transcribing[-1][0] == 100
+
+
+def test_resume_sends_only_missing_chunks(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    transcriptions = _FakeTranscriptions()
+    reported = []
+
+    transcript, _ = _service(transcriptions).transcribe_vod(
+        lecture,
+        concurrency=1,
+        # Chunk 3 finished ahead of chunk 2 before the last attempt died.
+        done_chunks={0: (0.0, 2.0, "saved 1"), 1: (2.0, 4.0, "saved 2"), 3: (6.0, 7.0, "saved 4")},
+        on_chunk=lambda *chunk: reported.append(chunk),
+    )
+
+    assert transcriptions.calls == ["chunk_0002.mp3"]
+    assert [chunk[:2] for chunk in reported] == [(2, 4.0)]
+    assert transcript.split("\n\n") == [
+        "[00:00] saved 1", "[00:02] saved 2", "[00:04] passage 3", "[00:06] saved 4",
+    ]
+
+
+def test_cached_segments_are_fed_to_ffmpeg_from_a_resume_point(tmp_path, monkeypatch):
+    """Resuming 4 s in lands inside the second 3 s segment: feeding starts there and the
+    first second is trimmed, so chunk times still line up with the lecture."""
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    stream = tmp_path / "stream"
+    stream.mkdir()
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "sine=frequency=440:duration=9", "-c:a", "aac",
+         "-f", "hls", "-hls_time", "3", "-hls_segment_type", "fmp4", "-hls_playlist_type", "vod",
+         str(stream / "index.m3u8")],
+        check=True,
+    )
+    playlist = hls.load_playlist(str(stream / "index.m3u8"))
+    cache = hls.SegmentCache(playlist, str(tmp_path / "cache"), concurrency=2)
+    transcriptions = _FakeTranscriptions()
+
+    transcript, _ = _service(transcriptions).transcribe_vod(
+        "unused://direct-url",
+        concurrency=1,
+        segments=cache,
+        done_chunks={0: (0.0, 2.0, "saved 1"), 1: (2.0, 4.0, "saved 2")},
+    )
+
+    assert transcriptions.calls == ["chunk_0002.mp3", "chunk_0003.mp3", "chunk_0004.mp3"]
+    assert transcript.split("\n\n") == [
+        "[00:00] saved 1", "[00:02] saved 2", "[00:04] passage 3", "[00:06] passage 4", "[00:08] passage 5",
+    ]
+    # Only the segments from the resume point on were fetched.
+    assert cache.downloaded == len(playlist.segments) - 1 + (1 if playlist.map_uri else 0)
+
+
+def test_stop_finishes_in_flight_chunks_and_raises(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    transcriptions = _FakeTranscriptions()
+    reported = []
+
+    with pytest.raises(ai_service.TranscriptionInterrupted):
+        _service(transcriptions).transcribe_vod(
+            lecture,
+            concurrency=1,
+            on_chunk=lambda *chunk: reported.append(chunk),
+            should_stop=lambda: bool(reported),
+        )
+
+    assert transcriptions.calls == ["chunk_0000.mp3"]
+    assert [(index, text) for index, _start, _end, text in reported] == [(0, "passage 1")]
+
+
+def test_audio_profiles_shrink_uploads_and_bytes_are_counted(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 4)
+    uploaded = {}
+    for profile in ("legacy", "mp3", "opus"):
+        monkeypatch.setattr(ai_service, "TRANSCRIBE_AUDIO_PROFILE", profile)
+        transcriptions = _FakeTranscriptions()
+        _, usage = _service(transcriptions).transcribe_vod(lecture, concurrency=1)
+        extension = ai_service.AUDIO_PROFILES[profile][0]
+        assert transcriptions.calls == [f"chunk_0000.{extension}", f"chunk_0001.{extension}"]
+        assert usage["audio_profile"] == profile
+        uploaded[profile] = usage["uploaded_bytes"]
+
+    assert uploaded["opus"] < uploaded["mp3"] < uploaded["legacy"]
+
+
+def test_tempo_shortens_billed_audio_but_keeps_lecture_timestamps(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    transcriptions = _FakeTranscriptions()
+    reported = []
+
+    transcript, usage = _service(transcriptions).transcribe_vod(
+        lecture, concurrency=1, tempo=1.5, on_chunk=lambda *chunk: reported.append(chunk),
+    )
+
+    assert transcript.split("\n\n") == [
+        "[00:00] passage 1", "[00:02] passage 2", "[00:04] passage 3", "[00:06] passage 4",
+    ]
+    # Chunk boundaries land where they would at normal speed, so checkpoints stay compatible.
+    assert [round(start) for _i, start, _end, _text in reported] == [0, 2, 4, 6]
+    assert reported[-1][2] == pytest.approx(7.0, abs=0.2)
+    assert usage["billed_audio_s"] == pytest.approx(7.0 / 1.5, abs=0.2)
+
+
+def test_local_backend_runs_chunks_one_at_a_time_and_names_its_model(lecture, monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    sent = []
+
+    class FakeLocal:
+        model = "faster-whisper-small-int8"
+
+        def transcribe(self, path):
+            sent.append(path.rsplit("/", 1)[-1])
+            return f"local {len(sent)}"
+
+    monkeypatch.setattr(ai_service.LocalTranscriber, "shared", classmethod(lambda cls: FakeLocal()))
+    api = _FakeTranscriptions()
+
+    transcript, usage = _service(api).transcribe_vod(lecture, backend="local", concurrency=4)
+
+    assert api.calls == []
+    assert sent == ["chunk_0000.mp3", "chunk_0001.mp3", "chunk_0002.mp3", "chunk_0003.mp3"]
+    assert transcript.startswith("[00:00] local 1")
+    assert usage["model"] == "faster-whisper-small-int8" and usage["backend"] == "local"
+    assert usage["uploaded_bytes"] == 0 and usage["billed_audio_s"] == 0
+
+
+def test_local_backend_without_faster_whisper_fails_before_extracting(lecture, monkeypatch):
+    monkeypatch.setitem(sys.modules, "faster_whisper", None)
+    monkeypatch.setattr(ai_service.LocalTranscriber, "_shared", None)
+    with pytest.raises(RuntimeError, match="faster-whisper"):
+        _service(_FakeTranscriptions()).transcribe_vod(lecture, backend="local")
+
+
+def test_chunk_length_is_planned_from_duration_and_parallelism(monkeypatch):
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_ADAPTIVE_CHUNKS", True)
+    assert ai_service.plan_chunk_seconds(None, 4) == ai_service.TRANSCRIBE_CHUNK_SECONDS
+    assert ai_service.plan_chunk_seconds(60, 4) == ai_service.ADAPTIVE_CHUNK_MIN_SECONDS
+    # One round of four chunks, not three chunks and an idle slot.
+    assert ai_service.plan_chunk_seconds(5 * 60, 4) == 75
+    # 150 s chunks would take fourteen requests, four rounds with half the last idle.
+    assert ai_service.plan_chunk_seconds(35 * 60, 4) == 135
+    assert ai_service.plan_chunk_seconds(35 * 60, 1) == 150
+    assert ai_service.plan_chunk_seconds(3 * 3600, 4) == ai_service.ADAPTIVE_CHUNK_MAX_SECONDS
+
+
+def test_cut_prefers_a_silence_near_the_target():
+    ends = [float(e) for e in range(5, 80, 5)]   # 5 s slices up to 75 s
+    # No silence known: the slice end nearest the target.
+    assert ai_service._choose_cut(0.0, ends, 60, []) == 12
+    # A pause over 50 s is within reach of a 60 s target; cut there.
+    assert ai_service._choose_cut(0.0, ends, 60, [(49.0, 50.5)]) == 10
+    # Otherwise the end closest to a pause, here the one at 65 s.
+    assert ai_service._choose_cut(0.0, ends, 60, [(66.0, 67.5)]) == 13
+    # Not enough slices yet to see the whole window.
+    assert ai_service._choose_cut(0.0, ends[:13], 60, []) is None
+    # The rest of the lecture fits in one chunk: wait for it, then take it all.
+    assert ai_service._choose_cut(0.0, ends[:14], 60, [], total=70.0) is None
+    assert ai_service._choose_cut(0.0, ends[:14], 60, [], total=70.0, final=True) == 14
+
+
+def test_long_chunks_are_cut_at_silences_with_exact_timestamps(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_service, "CHUNK_SLICE_SECONDS", 1)
+    lecture = tmp_path / "pauses.m4a"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i",
+         "aevalsrc='0.5*sin(2*PI*300*t)*not(between(t,4.2,5.6)+between(t,11.6,13))':s=16000:d=15",
+         "-c:a", "aac", str(lecture)],
+        check=True,
+    )
+    transcriptions = _FakeTranscriptions()
+    reported = []
+
+    transcript, usage = _service(transcriptions).transcribe_vod(
+        str(lecture), concurrency=1, chunk_seconds=6, on_chunk=lambda *chunk: reported.append(chunk),
+    )
+
+    # Planned at 6 s, cut instead at the pauses around 5 s and 12 s.
+    assert [(round(start), round(end)) for _i, start, end, _t in reported] == [(0, 5), (5, 12), (12, 15)]
+    assert transcript.split("\n\n") == ["[00:00] passage 1", "[00:05] passage 2", "[00:12] passage 3"]
+    assert usage["chunk_seconds"] == 6
+
+
+def test_silence_intervals_are_parsed_and_subtracted():
+    metadata = (
+        "frame:43   pts:176128  pts_time:3.99\n"
+        "lavfi.silence_start=3.0\n"
+        "frame:75   pts:307200  pts_time:6.96\n"
+        "lavfi.silence_end=7.0\n"
+        "lavfi.silence_duration=4.0\n"
+        "lavfi.silence_start=10.0\n"
+    )
+    silences = ai_service._parse_silences(metadata, offset=100.0)
+    assert silences == [(103.0, 107.0), (110.0, None)]
+    assert ai_service._speech_seconds(silences, 100.0, 110.0) == pytest.approx(6.0)
+    # A silence still open covers the rest of the chunk.
+    assert ai_service._speech_seconds(silences, 110.0, 120.0) == 0.0
+
+
+def test_silent_chunks_are_skipped_with_their_offsets_kept(tmp_path, monkeypatch):
+    """Tone, six seconds of dead air, tone: only the chunks with speech are sent, and the
+    second passage keeps its place on the lecture's timeline."""
+    monkeypatch.setattr(ai_service, "TRANSCRIBE_CHUNK_SECONDS", 2)
+    lecture = tmp_path / "gap.m4a"
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y",
+         "-f", "lavfi", "-i", "sine=frequency=300:duration=2",
+         "-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono:d=6",
+         "-f", "lavfi", "-i", "sine=frequency=300:duration=2",
+         "-filter_complex", "[0]aformat=channel_layouts=mono[a];[2]aformat=channel_layouts=mono[c];"
+                            "[a][1][c]concat=n=3:v=0:a=1",
+         "-c:a", "aac", str(lecture)],
+        check=True,
+    )
+    transcriptions = _FakeTranscriptions()
+    reported = []
+
+    transcript, usage = _service(transcriptions).transcribe_vod(
+        str(lecture), concurrency=1, on_chunk=lambda *chunk: reported.append(chunk),
+    )
+
+    assert transcriptions.calls == ["chunk_0000.mp3", "chunk_0004.mp3"]
+    assert transcript.split("\n\n") == ["[00:00] passage 1", "[00:08] passage 5"]
+    assert usage["silence_skipped_s"] == pytest.approx(6, abs=0.2)
+    # Skipped chunks are checkpointed as done, with no text.
+    assert [(index, text) for index, _s, _e, text in reported if not text] == [(1, ""), (2, ""), (3, "")]
+
+
+def test_ffmpeg_failure_is_raised(tmp_path):
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        _service(_FakeTranscriptions()).transcribe_vod(str(tmp_path / "missing.m3u8"))
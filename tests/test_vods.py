@@ -1,4 +1,9 @@
-from database import Course, VOD, VodTranscript, Job
+import json
+import types
+from datetime import datetime, timedelta
+
+import api
+from database import Course, VOD, VodTranscript, Job, TranscriptChunk
 
 
 def test_get_transcript_not_found(client, test_user, auth_headers, db):
@@ -86,6 +91,24 @@ def test_get_transcribe_status_queued_with_queue_position(client, test_user, aut
     assert data["queue_ahead"] == 1
 
 
+def test_transcribe_status_eta_uses_playlist_duration(client, test_user, auth_headers, db):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True)
+    db.add(course)
+    db.commit()
+    db.refresh(course)
+    db.add(VOD(moodle_id=503, course_id=course.id, title="Long", is_completed=False, has_tracking=True,
+               url="http://example.com/v", duration=None))
+    db.add(VodTranscript(moodle_id=503, is_processing=True, status="queued", stage="queued"))
+    db.add(Job(type="transcribe", status="pending", payload={"vod_moodle_id": 503}))
+    db.commit()
+
+    unknown = client.get("/vods/503/transcribe/status", headers=auth_headers).json()["eta_seconds"]
+    db.query(VodTranscript).filter_by(moodle_id=503).update({"media_duration_s": 4500.0})
+    db.commit()
+    known = client.get("/vods/503/transcribe/status", headers=auth_headers).json()["eta_seconds"]
+    assert known["low"] > unknown["low"]
+
+
 def test_get_transcribe_status_failed(client, test_user, auth_headers, db):
     course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True)
     db.add(course)
@@ -192,3 +215,86 @@ def test_get_transcript_wrong_user(client, test_user, auth_headers, db):
 
     resp = client.get("/vods/777/transcript", headers=auth_headers)
     assert resp.status_code == 404
+
+
+def _sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_transcript_stream_sends_chunks_as_they_land(client, test_user, auth_headers, db, monkeypatch):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True)
+    db.add(course)
+    db.commit()
+    db.add(VOD(
+        moodle_id=510, course_id=course.id, title="Streaming",
+        is_completed=False, has_tracking=True, url="http://example.com/v",
+    ))
+    db.add(VodTranscript(moodle_id=510, is_processing=True, status="running", stage="transcribing", progress_pct=40))
+    earlier = datetime.now() - timedelta(minutes=5)
+    # Left by an earlier attempt at another chunk length, then the current run's chunks.
+    db.add(TranscriptChunk(vod_moodle_id=510, chunk_seconds=120, chunk_index=0, start_s=0, end_s=120,
+                           text="stale", created_at=earlier))
+    db.add(TranscriptChunk(vod_moodle_id=510, chunk_seconds=75, chunk_index=1, start_s=75, end_s=150, text="second"))
+    db.add(TranscriptChunk(vod_moodle_id=510, chunk_seconds=75, chunk_index=0, start_s=0, end_s=75, text="first"))
+    db.commit()
+
+    polls = []
+
+    async def _next_poll(seconds):
+        # Stands in for the worker between polls: one more chunk and a re-cut one, then the
+        # finished transcript.
+        polls.append(seconds)
+        if len(polls) == 1:
+            db.add(TranscriptChunk(vod_moodle_id=510, chunk_seconds=75, chunk_index=2, start_s=150, end_s=200,
+                                   text="third"))
+            db.delete(db.query(TranscriptChunk).filter_by(vod_moodle_id=510, chunk_index=1).one())
+            db.flush()
+            db.add(TranscriptChunk(vod_moodle_id=510, chunk_seconds=75, chunk_index=1, start_s=74, end_s=150,
+                                   text="second, re-cut"))
+        else:
+            db.query(TranscriptChunk).filter(TranscriptChunk.vod_moodle_id == 510).delete()
+            row = db.query(VodTranscript).filter(VodTranscript.moodle_id == 510).one()
+            row.is_processing, row.status, row.transcript = False, "done", "[0:00] first"
+        db.commit()
+
+    monkeypatch.setattr(api, "asyncio", types.SimpleNamespace(sleep=_next_poll))
+    resp = client.get("/vods/510/transcript/stream", headers=auth_headers)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(resp.text)
+    assert events[0][0] == "status" and events[0][1]["stage"] == "transcribing"
+    assert [(e, d["index"], d["text"]) for e, d in events if e == "chunk"] == [
+        ("chunk", 0, "first"), ("chunk", 1, "second"), ("chunk", 1, "second, re-cut"), ("chunk", 2, "third"),
+    ]
+    assert events[-1] == ("done", {"transcript": "[0:00] first"})
+    assert len(polls) == 2
+
+
+def test_opening_too_many_transcript_streams_closes_the_oldest(monkeypatch):
+    monkeypatch.setattr(api, "TRANSCRIPT_STREAM_MAX_PER_USER", 2)
+    streams = [api._open_transcript_stream(7) for _ in range(3)]
+    try:
+        assert [closed.is_set() for closed in streams] == [True, False, False]
+    finally:
+        for closed in streams:
+            api._close_transcript_stream(7, closed)
+    assert 7 not in api._transcript_streams
+
+
+def test_transcript_stream_requires_a_started_job(client, test_user, auth_headers, db):
+    course = Course(moodle_id=100, owner_id=test_user.id, name="Test", is_active=True)
+    db.add(course)
+    db.commit()
+    db.add(VOD(
+        moodle_id=511, course_id=course.id, title="Not started",
+        is_completed=False, has_tracking=True, url="http://example.com/v",
+    ))
+    db.commit()
+
+    assert client.get("/vods/511/transcript/stream", headers=auth_headers).status_code == 404
+    assert client.get("/vods/512/transcript/stream", headers=auth_headers).status_code == 404
@@ -0,0 +1,352 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import worker
+from database import Job, TranscriptChunk, VodTranscript
+
+
+def _lane(name):
+    return next(lane for lane in worker.LANES if lane.name == name)
+
+
+def _job(db, job_type, *, minutes_ago=0, **payload):
+    job = Job(type=job_type, payload=payload, created_at=datetime.now() - timedelta(minutes=minutes_ago))
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_job_types_map_to_lanes():
+    assert _lane("interactive") is worker._lane_for_type("transcribe")
+    assert _lane("interactive") is worker._lane_for_type("brain_learn_item")
+    assert _lane("bulk") is worker._lane_for_type("brain_build")
+    assert _lane("bulk") is worker._lane_for_type("brain_build_item")
+    assert _lane("background") is worker._lane_for_type("watch_all")
+    # A type nobody named still runs somewhere rather than sitting pending forever.
+    assert _lane("background") is worker._lane_for_type("something_new")
+
+
+def test_bulk_lane_cannot_take_the_reserved_interactive_slot():
+    """A full brain build must leave room for a single on-demand transcription."""
+    interactive, bulk = _lane("interactive"), _lane("bulk")
+    assert interactive.reserved >= 1
+
+    running = {"interactive": 0, "bulk": 0, "background": 0}
+    while worker._free_slots(bulk, running) > 0:
+        running["bulk"] += 1
+    assert sum(running.values()) < worker.MAX_JOB_CONCURRENCY
+    assert worker._free_slots(interactive, running) >= 1
+
+
+def test_claim_is_restricted_to_the_lane(db):
+    _job(db, "brain_build", minutes_ago=10, course_id=1)
+    transcribe = _job(db, "transcribe", minutes_ago=1, vod_moodle_id=5)
+
+    claimed = worker._claim_job(db, _lane("interactive"))
+    assert claimed["id"] == transcribe.id
+    assert db.get(Job, transcribe.id).status == "processing"
+
+    assert worker._claim_job(db, _lane("interactive")) is None
+    assert worker._claim_job(db, _lane("bulk"))["type"] == "brain_build"
+
+
+def test_lane_report_counts_queue_depth_per_lane(db):
+    _job(db, "transcribe", minutes_ago=3)
+    _job(db, "brain_build", minutes_ago=1)
+    _job(db, "brain_build")
+
+    report = worker._lane_report(db, {"interactive": 1, "bulk": 0, "background": 0},
+                                 {"interactive": [2.0, 4.0]})
+    assert "interactive: running=1/" in report
+    assert "queued=1 oldest=180s" in report
+    assert "bulk: running=0/" in report and "queued=2" in report
+    assert "wait avg=3.0s max=4.0s" in report
+
+
+def test_claim_takes_a_lease_and_skips_jobs_backing_off(db):
+    later = _job(db, "watch_all", minutes_ago=5, user_id=1)
+    later.run_after = datetime.now() + timedelta(minutes=1)
+    ready = _job(db, "watch_all", minutes_ago=1, user_id=2)
+    db.commit()
+
+    claimed = worker._claim_job(db, _lane("background"))
+    assert claimed["id"] == ready.id
+    job = db.get(Job, ready.id)
+    assert job.lease_owner == worker.WORKER_ID
+    assert job.lease_expires_at > datetime.now()
+    assert job.attempts == 1
+    assert worker._claim_job(db, _lane("background")) is None
+
+
+def _processing(db, job_type, *, lease_expires_in, owner="other-host:1", attempts=1, **payload):
+    job = _job(db, job_type, minutes_ago=10, **payload)
+    job.status = "processing"
+    job.started_at = datetime.now() - timedelta(minutes=5)
+    job.lease_owner = owner
+    job.lease_expires_at = datetime.now() + timedelta(seconds=lease_expires_in)
+    job.attempts = attempts
+    db.commit()
+    return job
+
+
+def test_reclaim_only_takes_expired_leases(db):
+    """A second replica starting up must not pull running jobs out from under the first."""
+    live = _processing(db, "watch_all", lease_expires_in=60, user_id=1)
+    dead = _processing(db, "transcribe", lease_expires_in=-1, vod_moodle_id=42)
+    db.add(VodTranscript(moodle_id=42, status="processing", stage="transcribing",
+                         progress_pct=70, is_processing=True))
+    db.commit()
+
+    assert worker._reclaim_expired_jobs(db) == {"requeued": 1, "failed": 0}
+    db.expire_all()
+    assert db.get(Job, live.id).status == "processing"
+    requeued = db.get(Job, dead.id)
+    assert requeued.status == "pending" and requeued.lease_owner is None
+    assert requeued.run_after > datetime.now()
+    row = db.query(VodTranscript).filter_by(moodle_id=42).one()
+    assert (row.status, row.stage, row.progress_pct) == ("queued", "queued", 0)
+    # Backing off, so not claimable yet.
+    assert worker._claim_job(db, _lane("interactive")) is None
+
+
+def test_job_that_keeps_losing_its_worker_is_failed(db):
+    poison = _processing(db, "transcribe", lease_expires_in=-1,
+                         attempts=worker.JOB_MAX_ATTEMPTS, vod_moodle_id=7)
+    db.add(VodTranscript(moodle_id=7, status="processing", is_processing=True))
+    db.commit()
+
+    assert worker._reclaim_expired_jobs(db) == {"requeued": 0, "failed": 1}
+    db.expire_all()
+    job = db.get(Job, poison.id)
+    assert job.status == "failed" and "giving up" in job.error
+    row = db.query(VodTranscript).filter_by(moodle_id=7).one()
+    assert row.status == "failed" and not row.is_processing
+
+
+def test_retry_delay_grows_and_is_capped():
+    delays = [worker._retry_delay_seconds(n) for n in range(1, 10)]
+    assert delays[:3] == [30, 60, 120]
+    assert delays == sorted(delays)
+    assert max(delays) == worker.JOB_RETRY_MAX_SECONDS
+
+
+def test_renew_only_extends_this_workers_leases(db):
+    mine = _processing(db, "watch_all", lease_expires_in=5, owner=worker.WORKER_ID, user_id=1)
+    stolen = _processing(db, "watch_all", lease_expires_in=5, owner="other-host:1", user_id=2)
+
+    assert worker._renew_leases(db, [mine.id, stolen.id]) == 1
+    db.expire_all()
+    assert db.get(Job, mine.id).lease_expires_at > datetime.now() + timedelta(seconds=60)
+    assert db.get(Job, stolen.id).lease_owner == "other-host:1"
+
+
+def test_batch_claim_takes_up_to_limit_in_queue_order(db):
+    jobs = [_job(db, "watch_all", minutes_ago=10 - i, user_id=i) for i in range(5)]
+    _job(db, "transcribe", vod_moodle_id=1)
+
+    claimed = worker._claim_jobs(db, _lane("background"), 3)
+    assert [j["id"] for j in claimed] == [j.id for j in jobs[:3]]
+    db.expire_all()
+    for job in jobs[:3]:
+        row = db.get(Job, job.id)
+        assert row.status == "processing" and row.lease_owner == worker.WORKER_ID and row.attempts == 1
+
+    rest = worker._claim_jobs(db, _lane("background"), 10)
+    assert [j["id"] for j in rest] == [j.id for j in jobs[3:]]
+    assert worker._claim_jobs(db, _lane("background"), 10) == []
+    assert worker._claim_jobs(db, _lane("interactive"), 0) == []
+
+
+def _drain(db, lane, *, slots, ticks):
+    """Claim into `slots` for `ticks` rounds, finishing everything claimed the round before.
+    Returns the round in which each job id started."""
+    started = {}
+    for tick in range(ticks):
+        db.query(Job).filter(Job.status == "processing").update({"status": "done"})
+        db.commit()
+        for job in worker._claim_jobs(db, lane, slots):
+            started[job["id"]] = tick
+    return started
+
+
+def test_light_user_is_not_starved_behind_a_heavy_user(db):
+    """
+    One user turns the brain on for eight courses (40 jobs); a minute later another queues
+    a single job. With two slots, strict FIFO would start it after the whole backlog (round
+    20). Fair share starts it in the first round a slot is free, however deep the backlog.
+    """
+    bulk = _lane("bulk")
+    for i in range(40):
+        _job(db, "brain_build", minutes_ago=2, course_id=i, user_id=1)
+    light = _job(db, "brain_build", minutes_ago=1, course_id=99, user_id=2)
+
+    started = _drain(db, bulk, slots=2, ticks=25)
+    assert started[light.id] == 0
+    # The heavy user's backlog still drains in order at full throughput.
+    assert len(started) == 41
+    heavy = sorted((job_id, tick) for job_id, tick in started.items() if job_id != light.id)
+    assert [tick for _, tick in heavy] == sorted(tick for _, tick in heavy)
+
+
+def test_fair_share_counts_jobs_already_running(db):
+    """A user who already holds a slot goes behind one who holds none, even if older."""
+    _processing(db, "brain_build", lease_expires_in=60, user_id=1)
+    heavy = _job(db, "brain_build", minutes_ago=5, course_id=1, user_id=1)
+    light = _job(db, "brain_build", minutes_ago=1, course_id=2, user_id=2)
+
+    assert worker._claim_job(db, _lane("bulk"))["id"] == light.id
+    assert worker._claim_job(db, _lane("bulk"))["id"] == heavy.id
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _replay_one_hour_lecture(writer, clock):
+    """Feed the writer the callbacks transcribe_vod makes for a one-hour lecture: ffmpeg
+    reports each percent of a 90 s extraction, then 30 chunks of ~8 s report before and
+    after. Returns how many callbacks there were, each of which used to be a write."""
+    callbacks = 0
+    last_stage = None
+
+    def emit(stage, pct):
+        nonlocal callbacks, last_stage
+        if stage != last_stage:
+            last_stage = stage
+            callbacks += 1
+            writer.progress(stage, worker._to_overall_progress(stage, 0))
+        callbacks += 1
+        writer.progress(stage, worker._to_overall_progress(stage, pct))
+
+    for pct in range(101):
+        emit("extracting_audio", pct)
+        clock.now += 0.9
+    for idx in range(1, 31):
+        emit("transcribing", int((idx - 1) / 30 * 100))
+        clock.now += 8
+        emit("transcribing", int(idx / 30 * 100))
+    emit("finalizing", 100)
+    return callbacks
+
+
+def test_progress_writer_coalesces_a_lecture_into_few_writes(db):
+    clock = _FakeClock()
+    writer = worker._ProgressWriter(db, 42, interval=3, clock=clock)
+    writer.write(status="running", stage="extracting_audio", is_processing=True, progress_pct=5)
+
+    callbacks = _replay_one_hour_lecture(writer, clock)
+    assert callbacks > 160
+    # One write per 3 s of extraction, one per chunk, one per stage change.
+    assert writer.writes < 70
+
+    row = db.query(VodTranscript).filter_by(moodle_id=42).one()
+    assert row.stage == "finalizing"
+
+
+def test_progress_writer_looks_up_who_to_notify_once(db):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    try:
+        writer = worker._ProgressWriter(db, 42, interval=0, clock=_FakeClock())
+        for pct in (5, 6, 7):
+            writer.progress("extracting_audio", pct)
+        writer.write(status="done", stage="completed", is_processing=False, progress_pct=100)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    assert writer.writes == 4
+    assert sum("courses.owner_id" in statement for statement in statements) == 1
+
+
+def test_progress_writer_always_writes_stage_changes_and_final_states(db):
+    clock = _FakeClock()
+    writer = worker._ProgressWriter(db, 42, interval=60, clock=clock)
+    writer.progress("extracting_audio", 5)
+    writer.progress("extracting_audio", 30)  # throttled
+    assert db.query(VodTranscript).filter_by(moodle_id=42).one().progress_pct == 5
+
+    writer.progress("transcribing", 45)
+    writer.write(status="done", stage="completed", is_processing=False, progress_pct=100)
+    row = db.query(VodTranscript).filter_by(moodle_id=42).one()
+    assert (row.status, row.stage, row.progress_pct) == ("done", "completed", 100)
+    assert writer.writes == 3
+
+
+def test_interrupted_job_goes_back_to_pending_without_using_an_attempt(db):
+    job = _processing(db, "transcribe", lease_expires_in=60, owner=worker.WORKER_ID, vod_moodle_id=3)
+
+    worker._release_job(db, job)
+    db.expire_all()
+    job = db.get(Job, job.id)
+    assert (job.status, job.lease_owner, job.attempts, job.run_after) == ("pending", None, 0, None)
+    assert worker._claim_job(db, _lane("interactive"))["id"] == job.id
+
+
+def test_transcribe_checkpoints_chunks_and_resumes_from_them(db, monkeypatch, tmp_path):
+    seen_done = []
+
+    class FakeAI:
+        fail = True
+
+        def transcribe_vod(self, url, done_chunks=None, on_chunk=None, **callbacks):
+            seen_done.append(dict(done_chunks))
+            if FakeAI.fail:
+                on_chunk(0, 0.0, 120.0, "first")
+                raise worker.TranscriptionInterrupted("stopped")
+            on_chunk(1, 120.0, 200.0, "second")
+            return "[00:00] first\n\n[02:00] second", {"model": "fake"}
+
+    monkeypatch.setattr(worker, "AIService", FakeAI)
+    monkeypatch.setattr(worker, "_append_transcribe_timing_log", lambda record: None)
+    monkeypatch.setattr(worker.hls, "try_load_playlist", lambda url: None)
+    monkeypatch.setattr(worker.hls, "CACHE_DIR", str(tmp_path))
+    (tmp_path / "9").mkdir()
+    (tmp_path / "9" / "seg_00003").write_bytes(b"segment")
+    payload = {"vod_moodle_id": 9, "m3u8_url": "http://example/a.m3u8", "cookies": ""}
+
+    with pytest.raises(worker.JobInterrupted):
+        worker._run_transcribe(payload, db, job_id=1)
+    assert db.query(TranscriptChunk).filter_by(vod_moodle_id=9).count() == 1
+    assert db.query(VodTranscript).filter_by(moodle_id=9).one().status == "queued"
+    # The retry reads the segments this attempt downloaded.
+    assert (tmp_path / "9" / "seg_00003").exists()
+
+    FakeAI.fail = False
+    worker._run_transcribe(payload, db, job_id=1)
+    assert seen_done[1] == {0: (0.0, 120.0, "first")}
+    assert db.query(TranscriptChunk).filter_by(vod_moodle_id=9).count() == 0
+    assert db.query(VodTranscript).filter_by(moodle_id=9).one().status == "done"
+    assert not (tmp_path / "9").exists()
+
+
+def test_transcribe_routes_send_matching_jobs_to_the_local_engine(monkeypatch):
+    monkeypatch.setattr(worker, "TRANSCRIBE_LOCAL_ROUTES", {"backfill", "offpeak"})
+    monkeypatch.setattr(worker, "TRANSCRIBE_OFFPEAK_HOURS", "23-5")
+    monkeypatch.setattr(worker, "_local_engine_installed", lambda: True)
+    noon, night = datetime(2026, 3, 2, 12), datetime(2026, 3, 2, 2)
+
+    assert worker._choose_transcribe_backend("transcribe", None, noon) == ("openai", "default")
+    assert worker._choose_transcribe_backend("backfill", None, noon) == ("local", "backfill")
+    assert worker._choose_transcribe_backend("transcribe", None, night) == ("local", "offpeak")
+    assert worker._hours("23-5") == {23, 0, 1, 2, 3, 4}
+
+    # A route never fails jobs because the optional engine is missing.
+    monkeypatch.setattr(worker, "_local_engine_installed", lambda: False)
+    assert worker._choose_transcribe_backend("backfill", None, noon) == ("openai", "backfill-unavailable")
+
+
+def test_bypass_users_route_to_the_local_engine(monkeypatch):
+    monkeypatch.setattr(worker, "TRANSCRIBE_LOCAL_ROUTES", {"bypass"})
+    monkeypatch.setattr(worker, "_local_engine_installed", lambda: True)
+    monkeypatch.setenv("TRANSCRIBE_BYPASS_USERS", "ops")
+    ops = type("User", (), {"username": "ops"})()
+    student = type("User", (), {"username": "student"})()
+
+    assert worker._choose_transcribe_backend("transcribe", ops, datetime.now())[0] == "local"
+    assert worker._choose_transcribe_backend("transcribe", student, datetime.now())[0] == "openai"
@@ -1,20 +1,35 @@
 """
 Worker process — runs in a separate container.
-- Polls the jobs table and processes transcription and VOD watch jobs.
+- Claims jobs from the jobs table and processes transcription and VOD watch jobs. Idle
+  workers block until the API signals a new job (see job_queue) rather than polling.
 - Runs the APScheduler jobs (notices every 5min, dashboard sync every 60min).
 - Handles SIGTERM gracefully: finishes the current job before exiting.
 """
 import signal
+import socket
 import time
 import json
 import logging
+import importlib.util
 import os
+import shutil
 import threading
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
-
-from database import init_db, Job, VodTranscript, User, VOD, Course
-from ai_service import AIService, TRANSCRIBE_MODEL
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+import eta_model
+import events
+import hls
+import job_queue
+from database import init_db, Job, TranscriptChunk, VodTranscript, User, VOD, Course
+from ai_service import (
+    AIService, TranscriptionInterrupted, plan_chunk_seconds,
+    TRANSCRIBE_BACKEND, TRANSCRIBE_CONCURRENCY, TRANSCRIBE_MODEL,
+)
+import spend_limits
 from moodle_client import MoodleClient
 from parsing import parse_cookie_string as _parse_cookie_string
 from scheduler import check_notices_job, sync_dashboard_job, check_session_health_job, watch_vods_for_user
@@ -24,10 +39,27 @@ from exponent_server_sdk import PushClient, PushMessage
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [worker] %(levelname)s %(message)s')
 logger = logging.getLogger("worker")
 
-SessionLocal = init_db()
+SessionLocal = None if os.getenv("TESTING") else init_db()
 MAX_JOB_CONCURRENCY = max(1, int(os.getenv("WORKER_MAX_CONCURRENCY", "4")))
+LANE_REPORT_SECONDS = float(os.getenv("WORKER_LANE_REPORT_SECONDS", "60"))
+
+# Identifies this process on the leases it holds. Hostname is the container id under
+# Compose, and the pid separates two workers started in the same container.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+JOB_LEASE_SECONDS = max(30, int(os.getenv("JOB_LEASE_SECONDS", "120")))
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 3
+JOB_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+JOB_RETRY_BASE_SECONDS = 30
+JOB_RETRY_MAX_SECONDS = 15 * 60
 TRANSCRIBE_TIMING_LOG_PATH = os.getenv("TRANSCRIBE_TIMING_LOG_PATH", "/app/error_log/transcribe_timing.jsonl")
+# Progress bar updates are held in memory and written at most this often; stage changes
+# and final states are written at once.
+TRANSCRIBE_PROGRESS_FLUSH_SECONDS = float(os.getenv("TRANSCRIBE_PROGRESS_FLUSH_SECONDS", "3"))
+# Segment caches of lectures whose job failed for good are swept at startup after this long.
+HLS_CACHE_MAX_AGE_SECONDS = 24 * 3600
 TRANSCRIBE_TIMING_LOG_ENABLED = os.getenv("TRANSCRIBE_TIMING_LOG_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+# How often the status endpoint's ETA model is refitted from the timing log (0: never).
+TRANSCRIBE_ETA_REFIT_MINUTES = float(os.getenv("TRANSCRIBE_ETA_REFIT_MINUTES", "60"))
 _timing_log_lock = threading.Lock()
 
 # ─── Graceful Shutdown ────────────────────────────────────────────────────────
@@ -38,9 +70,11 @@ def _handle_signal(sig, frame):
     global _shutdown
     logger.info("Shutdown signal received — finishing in-flight jobs before exit...")
     _shutdown = True
+    if _job_signal:
+        _job_signal.set()
 
-signal.signal(signal.SIGTERM, _handle_signal)
-signal.signal(signal.SIGINT, _handle_signal)
+# Set in main(). Module scope so the signal handler and finishing jobs can wake the loop.
+_job_signal: job_queue.JobSignal | None = None
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
@@ -60,21 +94,322 @@ def _append_transcribe_timing_log(row: dict):
     except Exception as e:
         logger.error(f"Failed to write transcribe timing log: {e}")
 
-def _claim_job(db):
-    """Atomically claim one pending job. Uses SELECT FOR UPDATE SKIP LOCKED (PostgreSQL)."""
-    job = (
+def _refit_eta_model():
+    try:
+        eta_model.refit(
+            SessionLocal, TRANSCRIBE_TIMING_LOG_PATH,
+            slots_per_worker=_lane_for_type('transcribe').concurrency,
+        )
+    except Exception as e:
+        logger.error(f"ETA model refit failed: {e}")
+
+# ─── Lanes ────────────────────────────────────────────────────────────────────
+#
+# One FIFO over every job type let a single brain build — dozens of lectures, an hour or
+# more — take every slot, and a student who tapped "transcribe" on one lecture waited
+# behind all of it. Jobs are now split into lanes, each with its own cap, filled in
+# priority order. The interactive lane also holds reserved slots that no other lane may
+# take, so an on-demand job always has somewhere to run however busy the bulk lanes are.
+
+class Lane:
+    def __init__(self, name: str, types: tuple[str, ...] | None, *, concurrency: int,
+                 priority: int, reserved: int = 0):
+        self.name = name
+        self.types = types            # None: every type no other lane names
+        self.concurrency = max(1, concurrency)
+        self.priority = priority
+        self.reserved = max(0, min(reserved, self.concurrency))
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        logger.warning(f"{name} is not an integer, using {default}")
+        return default
+
+
+def _build_lanes() -> list[Lane]:
+    lanes = [
+        Lane('interactive', ('transcribe', 'brain_learn_item', 'watch_one'),
+             concurrency=_env_int("WORKER_INTERACTIVE_CONCURRENCY", MAX_JOB_CONCURRENCY),
+             priority=0,
+             reserved=_env_int("WORKER_INTERACTIVE_RESERVED", 1)),
+        Lane('bulk', ('brain_build', 'brain_build_item'),
+             concurrency=_env_int("WORKER_BULK_CONCURRENCY", max(1, MAX_JOB_CONCURRENCY - 1)),
+             priority=1),
+        Lane('background', None,
+             concurrency=_env_int("WORKER_BACKGROUND_CONCURRENCY", 1),
+             priority=2),
+    ]
+    # A reservation the pool cannot honour would starve every other lane outright: with
+    # one slot in total, reserving it for interactive work means no build ever runs.
+    reservable = MAX_JOB_CONCURRENCY - 1
+    for lane in sorted(lanes, key=lambda l: l.priority):
+        if lane.reserved > reservable:
+            logger.warning(
+                f"lane {lane.name}: reserved={lane.reserved} exceeds what "
+                f"max concurrency {MAX_JOB_CONCURRENCY} allows, using {max(0, reservable)}"
+            )
+            lane.reserved = max(0, reservable)
+        reservable -= lane.reserved
+    return sorted(lanes, key=lambda l: l.priority)
+
+
+LANES = _build_lanes()
+_NAMED_TYPES = tuple(t for lane in LANES if lane.types for t in lane.types)
+
+
+def _lane_for_type(job_type: str) -> Lane:
+    for lane in LANES:
+        if lane.types is not None and job_type in lane.types:
+            return lane
+    return next(lane for lane in LANES if lane.types is None)
+
+
+def _lane_filter(lane: Lane):
+    if lane.types is None:
+        return Job.type.notin_(_NAMED_TYPES)
+    return Job.type.in_(lane.types)
+
+
+def _free_slots(lane: Lane, running: dict[str, int]) -> int:
+    """
+    How many more jobs `lane` may start now: its own headroom, less whatever other lanes
+    still have reserved and not yet in use.
+    """
+    total_free = MAX_JOB_CONCURRENCY - sum(running.values())
+    held = sum(max(0, other.reserved - running.get(other.name, 0))
+               for other in LANES if other is not lane)
+    return max(0, min(lane.concurrency - running.get(lane.name, 0), total_free - held))
+
+
+def _claim_jobs(db, lane: Lane | None = None, limit: int = 1) -> list[dict]:
+    """
+    Atomically claim up to `limit` pending jobs in one statement:
+
+        UPDATE jobs SET ... WHERE id IN (SELECT id ... FOR UPDATE SKIP LOCKED LIMIT n) RETURNING ...
+
+    Jobs are taken in fair-share order across users, see below. SKIP LOCKED keeps two
+    workers claiming at once from blocking on, or double-taking, the same rows. SQLite
+    ignores the locking clause (it has one writer anyway) and runs the same statement;
+    versions before RETURNING (3.35) select the ids first instead.
+    """
+    if limit <= 0:
+        return []
+    now = datetime.now()
+
+    # Fair share: each user's pending jobs are numbered oldest-first, and that number is
+    # offset by how many of theirs are already running. Ordering by the sum takes one job
+    # per user per round, so a light user's single transcription overtakes a heavy user's
+    # backlog of brain builds instead of waiting behind all of it. Ties (and jobs from the
+    # same user) still go oldest first.
+    pending = (
+        select(
+            Job.id.label('id'),
+            Job.created_at.label('created_at'),
+            Job.user_id.label('user_id'),
+            func.row_number().over(partition_by=Job.user_id, order_by=(Job.created_at, Job.id)).label('user_rank'),
+        )
+        .where(Job.status == 'pending', (Job.run_after.is_(None)) | (Job.run_after <= now))
+    )
+    if lane is not None:
+        pending = pending.where(_lane_filter(lane))
+    pending = pending.subquery('pending')
+    running = (
+        select(Job.user_id.label('user_id'), func.count(Job.id).label('running'))
+        .where(Job.status == 'processing')
+        .group_by(Job.user_id)
+        .subquery('running')
+    )
+    # The window and the aggregate sit in subqueries so the lock applies to plain jobs rows.
+    candidates = (
+        select(Job.id)
+        .join(pending, pending.c.id == Job.id)
+        .outerjoin(running, running.c.user_id == pending.c.user_id)
+        .order_by(pending.c.user_rank + func.coalesce(running.c.running, 0), pending.c.created_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=Job)
+    )
+    claim = (
+        update(Job)
+        .where(Job.status == 'pending')
+        .values(
+            status='processing',
+            started_at=now,
+            lease_owner=WORKER_ID,
+            lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            attempts=func.coalesce(Job.attempts, 0) + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    returning = (Job.id, Job.type, Job.created_at, Job.started_at)
+    if db.get_bind().dialect.update_returning:
+        # Materialized, so the planner runs the LIMIT once: as a plain IN subquery joined
+        # against the ranking it can be re-run per row and claim far more than `limit`.
+        picked = candidates.cte('picked').prefix_with('MATERIALIZED')
+        rows = db.execute(claim.where(Job.id.in_(select(picked.c.id))).returning(*returning)).all()
+    else:
+        ids = list(db.scalars(candidates))
+        rows = []
+        if ids:
+            db.execute(claim.where(Job.id.in_(ids)))
+            rows = db.execute(select(*returning).where(Job.id.in_(ids))).all()
+    db.commit()
+    # RETURNING order is unspecified; hand jobs to the pool in queue order.
+    rows = sorted(rows, key=lambda r: (r.created_at or now, r.id))
+    return [{"id": r.id, "type": r.type, "created_at": r.created_at, "started_at": r.started_at} for r in rows]
+
+
+def _claim_job(db, lane: Lane | None = None):
+    """Claim the single oldest pending job, or None."""
+    jobs = _claim_jobs(db, lane, 1)
+    return jobs[0] if jobs else None
+
+
+def _renew_leases(db, job_ids: list[int]) -> int:
+    """
+    Heartbeat: push out the lease on every job this worker is running. Returns how many
+    were renewed; fewer than asked means another worker judged one dead and took it.
+    """
+    if not job_ids:
+        return 0
+    renewed = (
         db.query(Job)
-        .filter(Job.status == 'pending')
-        .order_by(Job.created_at)
+        .filter(Job.id.in_(job_ids), Job.status == 'processing', Job.lease_owner == WORKER_ID)
+        .update({'lease_expires_at': datetime.now() + timedelta(seconds=JOB_LEASE_SECONDS)},
+                synchronize_session=False)
+    )
+    db.commit()
+    return renewed
+
+
+def _retry_delay_seconds(attempts: int) -> int:
+    return min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def _reclaim_expired_jobs(db) -> dict:
+    """
+    Take back jobs whose worker stopped heartbeating.
+
+    Each goes back to pending behind a capped exponential delay, or — past
+    JOB_MAX_ATTEMPTS — is failed outright: a job that keeps killing its worker (an
+    out-of-memory lecture, a hung ffmpeg) would otherwise take every replica down in turn.
+    A 'processing' row with no lease at all predates leases, and counts as expired once
+    it is older than a lease would be.
+
+    Also settles any 'waiting' parent with no child left to run. Only a child settles its
+    parent, so one whose last child finished on a worker that died before settling it (or
+    whose last settle failed) would otherwise wait forever, and block the course's next
+    build.
+    """
+    now = datetime.now()
+    legacy_cutoff = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    expired = (
+        db.query(Job)
+        .filter(
+            Job.status == 'processing',
+            (Job.lease_expires_at < now)
+            | (Job.lease_expires_at.is_(None) & ((Job.started_at.is_(None)) | (Job.started_at < legacy_cutoff))),
+        )
         .with_for_update(skip_locked=True)
-        .first()
+        .all()
     )
-    if not job:
-        return None
-    job.status = 'processing'
-    job.started_at = datetime.now()
+    summary = {'requeued': 0, 'failed': 0}
+    orphaned = set()
+    for job in expired:
+        attempts = job.attempts or 0
+        owner = job.lease_owner or 'unknown'
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if attempts >= JOB_MAX_ATTEMPTS:
+            job.status = 'failed'
+            job.error = f"Worker lost mid-job {attempts} times (last owner {owner}); giving up"
+            job.completed_at = now
+            summary['failed'] += 1
+        else:
+            job.status = 'pending'
+            job.run_after = now + timedelta(seconds=_retry_delay_seconds(attempts))
+            summary['requeued'] += 1
+        if job.type == 'transcribe':
+            _reset_transcript_for_retry(db, job, failed=job.status == 'failed')
+        if job.status == 'failed' and job.parent_id:
+            orphaned.add(job.parent_id)
+        logger.warning(
+            f"Reclaimed job {job.id} ({job.type}) from {owner}: attempts={attempts} -> {job.status}"
+            + (f" run_after={job.run_after:%H:%M:%S}" if job.status == 'pending' else "")
+        )
     db.commit()
-    return {"id": job.id, "type": job.type}
+    # A child given up on still counts as finished, and may have been the last one.
+    child = aliased(Job)
+    orphaned.update(db.scalars(
+        select(Job.id).where(
+            Job.status == 'waiting',
+            ~select(child.id)
+            .where(child.parent_id == Job.id, child.status.in_(('pending', 'processing')))
+            .exists(),
+        )
+    ))
+    for parent_id in orphaned:
+        _settle_parent(db, parent_id)
+    return summary
+
+
+def _reset_transcript_for_retry(db, job, *, failed: bool):
+    """Keep a reclaimed transcription's row consistent with its job, so the app does not
+    show a progress bar frozen at whatever the dead worker last wrote."""
+    vod_moodle_id = (job.payload or {}).get('vod_moodle_id')
+    row = db.query(VodTranscript).filter(VodTranscript.moodle_id == vod_moodle_id).first() if vod_moodle_id else None
+    if not row:
+        return
+    if failed:
+        row.is_processing = False
+        row.status = 'failed'
+        row.stage = 'failed'
+        row.progress_pct = 0
+        row.error_message = job.error
+        row.completed_at = datetime.now()
+    else:
+        row.status = 'queued'
+        row.stage = 'queued'
+        row.progress_pct = 0
+        row.started_at = None
+        row.error_message = ''
+    _publish_transcript(db, row, _transcript_owners(db, vod_moodle_id))
+
+
+def _lane_report(db, running: dict[str, int], waits: dict[str, list[float]]) -> str:
+    """
+    One line per lane: slots in use, queue depth, oldest queued job, and the queue wait of
+    jobs started since the last report. One grouped query, however long the queue is.
+    """
+    rows = (
+        db.query(Job.type, func.count(Job.id), func.min(Job.created_at))
+        .filter(Job.status == 'pending')
+        .group_by(Job.type)
+        .all()
+    )
+    now = datetime.now()
+    depth: dict[str, int] = {}
+    oldest: dict[str, datetime] = {}
+    for job_type, count, created in rows:
+        name = _lane_for_type(job_type).name
+        depth[name] = depth.get(name, 0) + count
+        if created and (name not in oldest or created < oldest[name]):
+            oldest[name] = created
+
+    parts = []
+    for lane in LANES:
+        started = waits.get(lane.name) or []
+        oldest_s = f"{(now - oldest[lane.name]).total_seconds():.0f}s" if lane.name in oldest else "-"
+        wait_s = (f"avg={sum(started) / len(started):.1f}s max={max(started):.1f}s"
+                  if started else "avg=- max=-")
+        parts.append(
+            f"{lane.name}: running={running.get(lane.name, 0)}/{lane.concurrency} "
+            f"reserved={lane.reserved} queued={depth.get(lane.name, 0)} "
+            f"oldest={oldest_s} started={len(started)} wait {wait_s}"
+        )
+    return " | ".join(parts)
 
 # ─── Job Runners ──────────────────────────────────────────────────────────────
 
@@ -88,9 +423,13 @@ def _set_transcript_status(
     error_message: str | None = None,
     transcript: str | None = None,
     progress_pct: int | None = None,
+    media_duration_s: float | None = None,
     started_at: datetime | None = None,
     completed_at: datetime | None = None,
+    owners: list[int] | None = None,
 ):
+    """Update a lecture's `vod_transcripts` row and notify `owners` (looked up when not
+    given; a running job passes the ids it resolved once, not one query per write)."""
     row = db.query(VodTranscript).filter(VodTranscript.moodle_id == vod_moodle_id).first()
     if not row:
         row = VodTranscript(moodle_id=vod_moodle_id)
@@ -108,20 +447,137 @@ def _set_transcript_status(
         row.transcript = transcript
     if progress_pct is not None:
         row.progress_pct = max(0, min(100, int(progress_pct)))
+    if media_duration_s is not None:
+        row.media_duration_s = media_duration_s
     if started_at is not None:
         row.started_at = started_at
     if completed_at is not None:
         row.completed_at = completed_at
+    _publish_transcript(db, row, _transcript_owners(db, vod_moodle_id) if owners is None else owners)
     db.commit()
     return row
 
 
+def _transcript_owners(db, vod_moodle_id: int) -> list[int]:
+    """Every student who has the lecture — the row is shared, so each of them is looking at
+    the same bar."""
+    return [
+        owner_id for (owner_id,) in
+        db.query(Course.owner_id).join(VOD, VOD.course_id == Course.id)
+        .filter(VOD.moodle_id == vod_moodle_id).distinct()
+    ]
+
+
+def _publish_transcript(db, row, owners: list[int]):
+    """Progress event for a `vod_transcripts` change, to `owners`."""
+    events.publish(db, owners, 'transcribe', events.transcribe_event(row))
+
+
+def _commit_brain(db, course):
+    """Commit a course's brain build state and push it to the owner's app."""
+    events.publish(db, course.owner_id, 'brain', events.brain_event(course))
+    db.commit()
+
+
+# Transcriptions sent to the local CPU engine instead of the API, by rule (comma-separated):
+#   backfill  lectures transcribed by a course brain build, which nobody is watching live
+#   bypass    users exempt from the daily cap, whose volume is what the cap would have bounded
+#   offpeak   jobs starting within TRANSCRIBE_OFFPEAK_HOURS (worker-local time, "1-7")
+#   all       everything
+# Empty keeps every job on TRANSCRIBE_BACKEND.
+TRANSCRIBE_LOCAL_ROUTES = {r.strip() for r in os.getenv("TRANSCRIBE_LOCAL_ROUTES", "").split(",") if r.strip()}
+TRANSCRIBE_OFFPEAK_HOURS = os.getenv("TRANSCRIBE_OFFPEAK_HOURS", "1-7")
+
+
+def _hours(spec: str) -> set[int]:
+    """"1-7" -> {1..6}: from 01:00 up to 07:00. Wraps past midnight ("23-5")."""
+    try:
+        start, end = (int(h) % 24 for h in spec.split("-", 1))
+    except ValueError:
+        logger.warning(f"TRANSCRIBE_OFFPEAK_HOURS={spec!r} is not 'start-end', off-peak routing disabled")
+        return set()
+    return {h % 24 for h in range(start, end if end > start else end + 24)}
+
+
+def _local_engine_installed() -> bool:
+    return importlib.util.find_spec('faster_whisper') is not None
+
+
+def _choose_transcribe_backend(kind: str, user, now: datetime) -> tuple[str, str]:
+    """
+    Backend for one transcription, and the rule that picked it. `kind` is 'transcribe'
+    (a student waiting on one lecture) or 'backfill' (a brain build working through a
+    course). Falls back to the default when faster-whisper is not installed, so a
+    configured route cannot fail jobs.
+    """
+    rule = None
+    if 'all' in TRANSCRIBE_LOCAL_ROUTES:
+        rule = 'all'
+    elif 'backfill' in TRANSCRIBE_LOCAL_ROUTES and kind == 'backfill':
+        rule = 'backfill'
+    elif 'bypass' in TRANSCRIBE_LOCAL_ROUTES and user is not None and spend_limits.is_transcribe_limit_bypassed(user):
+        rule = 'bypass'
+    elif 'offpeak' in TRANSCRIBE_LOCAL_ROUTES and now.hour in _hours(TRANSCRIBE_OFFPEAK_HOURS):
+        rule = 'offpeak'
+    if rule is None:
+        return TRANSCRIBE_BACKEND, 'default'
+    if not _local_engine_installed():
+        logger.warning(f"Transcribe route {rule} wants the local engine but faster-whisper is not installed")
+        return TRANSCRIBE_BACKEND, f"{rule}-unavailable"
+    return 'local', rule
+
+
+class _ProgressWriter:
+    """
+    Coalesces a transcription's progress updates into few writes on `vod_transcripts`.
+
+    ffmpeg reports every percent of extraction and each chunk reports twice, which wrote
+    (SELECT + COMMIT) about 165 times for a one-hour lecture just to move a progress bar.
+    `progress()` now only writes when the stage changes or `interval` has passed since the
+    last write, and never for a percentage already stored. `write()` is for everything
+    else — start, completion, failure — and always goes straight through. `writes` counts
+    both, for the timing log. The students to notify are looked up once, on the first
+    write, so a write is still one SELECT and one COMMIT.
+    """
+
+    def __init__(self, db, vod_moodle_id: int, *, interval: float = TRANSCRIBE_PROGRESS_FLUSH_SECONDS,
+                 clock=time.monotonic):
+        self.db = db
+        self.vod_moodle_id = vod_moodle_id
+        self.interval = interval
+        self.clock = clock
+        self.writes = 0
+        self._stage: str | None = None
+        self._pct: int | None = None
+        self._written_at = float("-inf")
+        self._owners: list[int] | None = None
+
+    def write(self, **fields):
+        if self._owners is None:
+            self._owners = _transcript_owners(self.db, self.vod_moodle_id)
+        _set_transcript_status(self.db, self.vod_moodle_id, owners=self._owners, **fields)
+        self.writes += 1
+        self._written_at = self.clock()
+        if 'stage' in fields:
+            self._stage = fields['stage']
+        if 'progress_pct' in fields:
+            self._pct = fields['progress_pct']
+
+    def progress(self, stage: str, overall_pct: int):
+        if stage == self._stage:
+            if overall_pct == self._pct or self.clock() - self._written_at < self.interval:
+                return
+        self.write(status='running', stage=stage, is_processing=True, progress_pct=overall_pct)
+
+
 def _to_overall_progress(stage: str, stage_pct: int | None) -> int:
     p = 0 if stage_pct is None else max(0, min(100, int(stage_pct)))
+    # Extraction and transcription overlap, so "extracting_audio" only lasts until the
+    # first chunk is cut; from then on transcription is the pace-setter.
     if stage == "extracting_audio":
-        return 5 + int(p * 0.40)    # 5..45
+        return 5 + int(p * 0.05)    # 5..10
     if stage == "transcribing":
-        return 45 + int(p * 0.50)   # 45..95
+        return 10 + int(p * 0.85)   # 10..95
     if stage == "finalizing":
         return 95 + int(p * 0.04)   # 95..99
     if stage == "completed":
@@ -148,11 +604,11 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
         f"queue_wait={queue_wait_text}"
     )
 
+    progress = _ProgressWriter(db, vod_moodle_id)
+    cache_dir = os.path.join(hls.CACHE_DIR, str(vod_moodle_id))
     try:
         now = datetime.now()
-        _set_transcript_status(
-            db,
-            vod_moodle_id,
+        progress.write(
             status='running',
             stage='extracting_audio',
             is_processing=True,
@@ -188,25 +644,11 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
             last_stage = stage_name
             stage_started_perf = now_perf
             logger.info(f"Transcribe stage start job_id={job_id} vod={vod_moodle_id} stage={stage_name}")
-            _set_transcript_status(
-                db,
-                vod_moodle_id,
-                status='running',
-                stage=stage_name,
-                is_processing=True,
-                progress_pct=_to_overall_progress(stage_name, 0),
-            )
+            progress.progress(stage_name, _to_overall_progress(stage_name, 0))
 
         def _on_progress(stage_name: str, stage_pct: int | None, msg: str | None):
             overall_pct = _to_overall_progress(stage_name, stage_pct)
-            _set_transcript_status(
-                db,
-                vod_moodle_id,
-                status='running',
-                stage=stage_name,
-                is_processing=True,
-                progress_pct=overall_pct,
-            )
+            progress.progress(stage_name, overall_pct)
             if stage_pct is None:
                 return
             bucket = max(0, min(100, int(stage_pct) // 10 * 10))
@@ -219,17 +661,85 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
                     f"stage_pct={bucket}% overall_pct={overall_pct}%{detail}"
                 )
 
+        # The playlist gives the exact length up front: recorded for the status ETA, and
+        # handed on so transcribe_vod does not probe the stream again.
+        playlist = hls.try_load_playlist(m3u8_url)
+        media_duration_s = playlist.duration if playlist and playlist.ended else None
+        if media_duration_s:
+            progress.write(media_duration_s=round(media_duration_s, 1))
+            logger.info(
+                f"Transcribe playlist job_id={job_id} vod={vod_moodle_id} "
+                f"segments={len(playlist.segments)} duration_s={media_duration_s:.0f}"
+            )
+
+        # Segments are fetched in parallel, a bounded window ahead of ffmpeg, into a
+        # per-lecture cache. It outlives an interrupted attempt, so the retry reads what is
+        # left from disk, and is removed once the job is done or has failed for good.
+        # Encrypted streams are left to ffmpeg to fetch and decrypt.
+        segments = hls.SegmentCache(playlist, cache_dir) if media_duration_s and not playlist.encrypted else None
+
+        backend, backend_route = _choose_transcribe_backend(
+            'transcribe', db.get(User, user_id) if user_id else None, datetime.now(),
+        )
+        logger.info(f"Transcribe backend job_id={job_id} vod={vod_moodle_id} backend={backend} route={backend_route}")
+
+        # Chunks a previous attempt finished (the worker died or was stopped mid-lecture)
+        # are reused, not re-extracted or re-billed. They are only valid for the chunk length
+        # they were cut at, so it is planned here, the same way on every attempt.
+        chunk_seconds = plan_chunk_seconds(media_duration_s, 1 if backend == 'local' else TRANSCRIBE_CONCURRENCY)
+        done_chunks = {
+            c.chunk_index: (c.start_s, c.end_s, c.text)
+            for c in db.query(TranscriptChunk).filter(
+                TranscriptChunk.vod_moodle_id == vod_moodle_id,
+                TranscriptChunk.chunk_seconds == chunk_seconds,
+            )
+        }
+        if done_chunks:
+            logger.info(f"Transcribe resuming job_id={job_id} vod={vod_moodle_id} chunks_done={len(done_chunks)}")
+        checkpointed = {index: end_s for index, (_, end_s, _) in done_chunks.items()}
+
+        def _on_chunk(index: int, start_s: float, end_s: float, text: str):
+            key = dict(vod_moodle_id=vod_moodle_id, chunk_seconds=chunk_seconds, chunk_index=index)
+            row = db.query(TranscriptChunk).filter_by(**key).first()
+            if row:
+                # Cut at a different silence than last attempt: this chunk replaces the old one,
+                # as a new row, since the transcript stream only reads ids past the last it sent.
+                db.delete(row)
+                db.flush()
+            db.add(TranscriptChunk(**key, start_s=start_s, end_s=end_s, text=text))
+            try:
+                db.commit()
+            except IntegrityError:
+                # A worker whose lease was taken over wrote the same chunk; either copy will do.
+                db.rollback()
+            if segments is not None:
+                # A retry starts where the checkpointed run of chunks ends, so the segments
+                # before that point are no longer needed.
+                checkpointed[index] = end_s
+                run = 0
+                while run in checkpointed:
+                    run += 1
+                if run:
+                    segments.release_before(checkpointed[run - 1])
+
         transcript, usage = AIService().transcribe_vod(
             m3u8_url,
+            backend=backend,
+            duration_s=media_duration_s,
+            segments=segments,
             on_stage=_on_stage,
             on_progress=_on_progress,
+            done_chunks=done_chunks,
+            on_chunk=_on_chunk,
+            chunk_seconds=chunk_seconds,
+            should_stop=lambda: _shutdown,
         )
         if stage_started_perf is not None:
             stage_durations_s[last_stage] = round(time.perf_counter() - stage_started_perf, 3)
 
-        _set_transcript_status(
-            db,
-            vod_moodle_id,
+        db.query(TranscriptChunk).filter(TranscriptChunk.vod_moodle_id == vod_moodle_id).delete()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        progress.write(
             status='done',
             stage='completed',
             is_processing=False,
@@ -241,7 +751,7 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
         total_s = time.perf_counter() - started_perf
         logger.info(
             f"Transcribe complete job_id={job_id} vod={vod_moodle_id} "
-            f"chars={len(transcript or '')} total_s={total_s:.1f}"
+            f"chars={len(transcript or '')} total_s={total_s:.1f} progress_writes={progress.writes}"
         )
         _append_transcribe_timing_log({
             "type": "transcribe_timing",
@@ -251,8 +761,22 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
             "user_id": user_id,
             "queue_wait_s": round(queue_wait_s, 3) if queue_wait_s is not None else None,
             "total_s": round(total_s, 3),
+            "media_duration_s": round(media_duration_s, 1) if media_duration_s else None,
             "stage_durations_s": stage_durations_s,
             "transcript_chars": len(transcript or ""),
+            "chunk_seconds": chunk_seconds,
+            "chunks_resumed": len(done_chunks),
+            "silence_skipped_s": usage.get("silence_skipped_s", 0),
+            "audio_profile": usage.get("audio_profile"),
+            "uploaded_bytes": usage.get("uploaded_bytes"),
+            "backend": usage.get("backend"),
+            "backend_route": backend_route,
+            "model": usage.get("model"),
+            "tempo": usage.get("tempo"),
+            "billed_audio_s": usage.get("billed_audio_s"),
+            "segments_downloaded": segments.downloaded if segments else None,
+            "segments_reused": segments.reused if segments else None,
+            "progress_writes": progress.writes,
         })
 
         # Log AI usage
@@ -295,6 +819,12 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
                 except Exception as exc:
                     logger.error(f"Transcribe push failed job_id={job_id} vod={vod_moodle_id}: {exc}")
 
+    except TranscriptionInterrupted as e:
+        # Finished chunks are checkpointed; show the lecture as waiting again, and let the
+        # next worker pick the job straight back up.
+        logger.info(f"Transcribe interrupted job_id={job_id} vod={vod_moodle_id} stage={last_stage}: {e}")
+        progress.write(status='queued', stage='queued', is_processing=True, progress_pct=0)
+        raise JobInterrupted(str(e)) from e
     except Exception as e:
         if stage_started_perf is not None:
             stage_durations_s[last_stage] = round(time.perf_counter() - stage_started_perf, 3)
@@ -303,9 +833,8 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
             f"Transcribe failed job_id={job_id} vod={vod_moodle_id} "
             f"stage={last_stage} elapsed_s={total_s:.1f}: {e}"
         )
-        _set_transcript_status(
-            db,
-            vod_moodle_id,
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        progress.write(
             status='failed',
             stage='failed',
             is_processing=False,
@@ -322,6 +851,7 @@ def _run_transcribe(payload: dict, db, *, job_id: int | None = None, queue_wait_
             "queue_wait_s": round(queue_wait_s, 3) if queue_wait_s is not None else None,
             "total_s": round(total_s, 3),
             "stage_durations_s": stage_durations_s,
+            "progress_writes": progress.writes,
             "error": str(e)[:500],
         })
         raise
@@ -354,9 +884,54 @@ def _run_watch_one(payload: dict):
         db.close()
 
 
+# Weighted so the bar tracks wall-clock rather than item count: transcription dominates a
+# full build, and a bar that sits at 90% for half an hour is a lie.
+BRAIN_STAGE_WEIGHTS = {'assignments': 5, 'vods': 65, 'files': 30}
+BRAIN_STAGE_LABELS = {'assignments': '과제 안내 정리 중', 'vods': '강의 변환 중', 'files': '자료 정리 중'}
+
+
+def _show_brain_progress(course, counts: dict[str, tuple[int, int]], latest: str | None = None):
+    """
+    Set a building course's bar and label from each stage's (done, total).
+
+    Stages run side by side, so the bar is the weighted sum of each stage's own fraction,
+    which only moves forward however their reports interleave, and the label names every
+    stage still under way. Stages the course's scope excludes get no share, so a
+    files-only build still spans the whole bar instead of stopping at 30%. Does not commit.
+    """
+    import course_brain
+
+    scope = course_brain.scope_of(course)
+    active = {k: v for k, v in BRAIN_STAGE_WEIGHTS.items() if scope.get(k, True)}
+    total_weight = sum(active.values()) or 1
+    pct = sum(active.get(k, 0) * 100 / total_weight * (d / t if t else 1) for k, (d, t) in counts.items())
+    busy = [k for k, (d, t) in counts.items() if d < t] or ([latest] if latest else [])
+    course.brain_status = 'building'
+    course.brain_progress = min(99, int(pct))
+    course.brain_stage = ' · '.join(
+        f"{BRAIN_STAGE_LABELS[k]} {counts[k][0]}/{counts[k][1]}" if counts[k][1] > 1 else BRAIN_STAGE_LABELS[k]
+        for k in busy
+    ) or None
+
+
+def _finish_brain(course, *, deferred: int, errors: list[str]):
+    """Mark a course's build complete. Does not commit."""
+    # Per-item failures do not fail the build: a course with one dead lecture is still
+    # worth asking questions about. They are recorded, not hidden.
+    course.brain_status = 'ready'
+    course.brain_progress = 100
+    # Say so when the daily cap cut a build short, rather than reporting it complete.
+    course.brain_stage = f"강의 {deferred}개는 내일 이어서 학습해요" if deferred else None
+    course.brain_error = '; '.join(errors)[:2000] if errors else None
+    course.brain_built_at = datetime.now()
+
+
 def _run_brain_build(payload: dict):
     """
-    Build (or top up) a course's brain corpus.
+    Build (or top up) a course's brain corpus in one job.
+
+    Builds are now queued as per-item children (see _run_brain_build_item); this runs a
+    brain_build still pending from before that, so a deploy does not strand it.
 
     Progress is written to the course row rather than the job row, because that is what
     the app polls and what survives the job being cleaned up. A build that dies with the
@@ -384,61 +959,35 @@ def _run_brain_build(payload: dict):
         if not client:
             raise ValueError(f"No valid Moodle session for user {course.owner_id}")
 
-        # Weighted so the bar tracks wall-clock rather than item count: transcription
-        # dominates a full build, and a bar that sits at 90% for half an hour is a lie.
-        # Stages the course's scope excludes get no share, so a files-only build still
-        # spans the whole bar instead of stopping at 30%.
-        scope = course_brain.scope_of(course)
-        base = {'assignments': 5, 'vods': 65, 'files': 30}
-        active = {k: v for k, v in base.items() if scope.get(k, True)}
-        total_weight = sum(active.values()) or 1
-        weights = {k: v * 100 / total_weight for k, v in active.items()}
-
-        offsets, running = {}, 0
-        for name in ('assignments', 'vods', 'files'):
-            offsets[name] = running
-            running += weights.get(name, 0)
-
-        labels = {'assignments': '과제 안내 정리 중', 'vods': '강의 변환 중', 'files': '자료 정리 중'}
+        counts = {}
 
         def on_stage(name, done, total):
-            share = weights.get(name, 0)
-            pct = offsets[name] + (share * done / total if total else share)
-            course.brain_status = 'building'
-            course.brain_progress = min(99, int(pct))
-            course.brain_stage = (f"{labels[name]} {done}/{total}" if total > 1 else labels[name])
-            db.commit()
+            counts[name] = (done, total)
+            _show_brain_progress(course, counts, name)
+            _commit_brain(db, course)
 
         course.brain_status = 'building'
         course.brain_progress = 0
         course.brain_stage = '시작하는 중'
         course.brain_error = None
-        db.commit()
+        _commit_brain(db, course)
 
         # Every lecture claims a unit of the user's daily transcription budget, the same
         # ceiling the manual transcribe endpoint enforces. Without this a build was an
         # uncapped way to spend: one tap could transcribe an entire semester.
-        import spend_limits
-
         def can_transcribe():
             return spend_limits.claim_transcription(db, user)
 
+        backend, backend_route = _choose_transcribe_backend('backfill', user, datetime.now())
+        logger.info(f"brain build course={course.moodle_id} transcribe backend={backend} route={backend_route}")
         ai = AIService()
         summary = course_brain.build_course_brain(
             client, db, course, ai, transcribe=True, force=False, on_stage=on_stage,
-            can_transcribe=can_transcribe,
+            can_transcribe=can_transcribe, transcribe_backend=backend,
         )
 
-        # Per-item failures do not fail the build: a course with one dead lecture is
-        # still worth asking questions about. They are recorded, not hidden.
-        deferred = summary['vods'].get('deferred', 0)
-        course.brain_status = 'ready'
-        course.brain_progress = 100
-        # Say so when the daily cap cut a build short, rather than reporting it complete.
-        course.brain_stage = f"강의 {deferred}개는 내일 이어서 학습해요" if deferred else None
-        course.brain_error = '; '.join(summary['errors'])[:2000] if summary['errors'] else None
-        course.brain_built_at = datetime.now()
-        db.commit()
+        _finish_brain(course, deferred=summary['vods'].get('deferred', 0), errors=summary['errors'])
+        _commit_brain(db, course)
         logger.info(
             f"brain build done course={course.moodle_id} full={full} "
             f"vods={summary['vods']} files={summary.get('files')} errors={len(summary['errors'])}"
@@ -450,12 +999,113 @@ def _run_brain_build(payload: dict):
             course.brain_status = 'error'
             course.brain_stage = None
             course.brain_error = str(e)[:2000]
-            db.commit()
+            _commit_brain(db, course)
         raise
     finally:
         db.close()
 
 
+class JobDeferred(Exception):
+    """A handler found it may not run the job now (a spent budget) and did nothing. The
+    job is recorded as 'deferred': finished, but neither done nor failed."""
+
+
+def _run_brain_build_item(payload: dict):
+    """
+    One item of a fanned-out brain build: a lecture, a file, or a batch of assignments.
+
+    Lectures claim a unit of the user's transcription budget just as a whole build did,
+    and only when they still need transcribing; a spent budget defers the lecture to the
+    next build rather than failing it. The parent's progress is settled by _process_job
+    around this, not here.
+    """
+    import course_brain
+    from scheduler import get_client
+
+    db = SessionLocal()
+    try:
+        course = db.query(Course).filter(Course.id == payload['course_id']).first()
+        # Opting out mid-build should stop the spending, not just the next build.
+        if not course or not course.brain_enabled:
+            logger.info(f"brain build item skipped, course {payload['course_id']} gone or disabled")
+            return
+
+        user = db.query(User).filter(User.id == course.owner_id).first()
+        client = get_client(user) if user else None
+        if not client:
+            raise ValueError(f"No valid Moodle session for user {course.owner_id}")
+
+        backend = None
+        if payload['item_type'] == 'vod':
+            backend, _route = _choose_transcribe_backend('backfill', user, datetime.now())
+
+        report = course_brain.build_planned_item(
+            client, db, course, AIService(), payload,
+            can_transcribe=lambda: spend_limits.claim_transcription(db, user),
+            transcribe_backend=backend,
+        )
+        if report['status'] == 'deferred':
+            raise JobDeferred("daily transcription budget spent")
+        logger.info(
+            f"brain build item done course={course.moodle_id} {payload['item_type']}:"
+            f"{payload.get('item_id', payload.get('item_ids'))} {report.get('status')}"
+        )
+    finally:
+        db.close()
+
+
+def _settle_brain_build(db, parent_id: int):
+    """
+    Bring a fanned-out build's course up to date with its children.
+
+    Called as each child starts and finishes, on whichever worker ran it. The parent row
+    is locked first, so two children finishing at once settle one after the other; the
+    one that finds no child left to run marks the parent done and the course ready.
+    """
+    import course_brain
+
+    parent = db.query(Job).filter(Job.id == parent_id).with_for_update().first()
+    if not parent or parent.status != 'waiting':
+        db.commit()
+        return
+    children = db.query(Job).filter(Job.parent_id == parent_id).all()
+
+    counts, deferred, errors = {}, 0, []
+    for child in children:
+        payload = child.payload or {}
+        stage = course_brain.ITEM_STAGES.get(payload.get('item_type'), 'files')
+        done, total = counts.get(stage, (0, 0))
+        finished = child.status in ('done', 'failed', 'deferred')
+        counts[stage] = (done + finished, total + 1)
+        if child.status == 'deferred' and stage == 'vods':
+            deferred += 1
+        elif child.status == 'failed':
+            errors.append(f"{payload.get('item_type')} {payload.get('item_id', payload.get('item_ids'))}: {child.error}")
+
+    course = db.query(Course).filter(Course.id == parent.course_id).first()
+    if all(done == total for done, total in counts.values()):
+        parent.status = 'done'
+        parent.completed_at = datetime.now()
+        events.publish(db, parent.user_id, 'job', events.job_event(parent))
+        if course and errors and len(errors) == len(children):
+            # Nothing worked — an expired Moodle session fails every item the same way.
+            course.brain_status = 'error'
+            course.brain_stage = None
+            course.brain_error = errors[0][:2000]
+        elif course:
+            _finish_brain(course, deferred=deferred, errors=errors)
+        logger.info(
+            f"brain build done course={parent.course_id} children={len(children)} "
+            f"deferred={deferred} errors={len(errors)}"
+        )
+    elif course:
+        _show_brain_progress(course, counts)
+    if course:
+        _commit_brain(db, course)
+    else:
+        db.commit()
+
+
 def _run_brain_learn_item(payload: dict):
     """
     Learn one item the student picked out of the library.
@@ -478,17 +1128,19 @@ def _run_brain_learn_item(payload: dict):
             raise ValueError(f"No valid Moodle session for user {course.owner_id}")
 
         # A single-item learn of a lecture is a transcription like any other.
+        backend = None
         if payload['item_type'] == 'vod':
-            import spend_limits
             if not spend_limits.claim_transcription(db, user):
                 logger.info(
                     f"brain learn deferred: daily transcription budget spent "
                     f"user={user.id} vod={payload['item_id']}"
                 )
                 return
+            backend, _route = _choose_transcribe_backend('transcribe', user, datetime.now())
 
         report = course_brain.build_single_item(
             client, db, course, AIService(), payload['item_type'], payload['item_id'],
+            transcribe_backend=backend,
         )
         logger.info(
             f"brain learn done course={course.moodle_id} "
@@ -509,12 +1161,63 @@ def _dispatch(job, db, *, queue_wait_s: float | None = None):
         _run_watch_one(job.payload)
     elif t == 'brain_build':
         _run_brain_build(job.payload)
+    elif t == 'brain_build_item':
+        _run_brain_build_item(job.payload)
     elif t == 'brain_learn_item':
         _run_brain_learn_item(job.payload)
     else:
         raise ValueError(f"Unknown job type: {t}")
 
 
+class JobInterrupted(Exception):
+    """A handler stopped early for shutdown, leaving state it can resume from. The job
+    goes back to pending at once, without counting as an attempt."""
+
+
+def _release_job(db, job):
+    db.rollback()
+    db.refresh(job)
+    job.status = 'pending'
+    job.started_at = None
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.attempts = max(0, (job.attempts or 1) - 1)
+    db.commit()
+
+
+def _finish_job(db, job, status: str, *, error: str | None = None):
+    # The heartbeat has been rewriting this row from the main thread, so re-read it before
+    # the final write. A successful handler's own writes are kept; a failed one's are not.
+    if status == 'done':
+        db.commit()
+    else:
+        db.rollback()
+    db.refresh(job)
+    if job.lease_owner != WORKER_ID:
+        logger.warning(
+            f"Job {job.id} finished after its lease passed to {job.lease_owner or 'nobody'}; "
+            f"recording {status} anyway"
+        )
+    job.status = status
+    if error is not None:
+        job.error = error
+    job.completed_at = datetime.now()
+    job.lease_owner = None
+    job.lease_expires_at = None
+    events.publish(db, job.user_id, 'job', events.job_event(job))
+    db.commit()
+
+
+def _settle_parent(db, parent_id: int):
+    # Bookkeeping for the parent must never fail the child whose work is already stored;
+    # the next child to finish settles it again, or the reclaim sweep after the last one.
+    try:
+        _settle_brain_build(db, parent_id)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Settling parent job {parent_id} failed: {e}")
+
+
 def _process_job(job_id: int):
     """Process a claimed job in its own DB session (safe for threaded concurrency)."""
     db = SessionLocal()
@@ -526,105 +1229,168 @@ def _process_job(job_id: int):
         queue_wait_s = None
         if job.created_at and job.started_at:
             queue_wait_s = (job.started_at - job.created_at).total_seconds()
+        lane = _lane_for_type(job.type).name
         logger.info(
-            f"Starting job {job.id} ({job.type}) queue_wait_s="
-            f"{queue_wait_s:.1f}" if queue_wait_s is not None else f"Starting job {job.id} ({job.type})"
+            f"Starting job {job.id} ({job.type}) lane={lane} queue_wait_s="
+            f"{queue_wait_s:.1f}" if queue_wait_s is not None
+            else f"Starting job {job.id} ({job.type}) lane={lane}"
         )
         run_started = time.perf_counter()
+        if job.parent_id:
+            _settle_parent(db, job.parent_id)
         try:
             _dispatch(job, db, queue_wait_s=queue_wait_s)
-            job.status = 'done'
-            job.completed_at = datetime.now()
-            db.commit()
+            _finish_job(db, job, 'done')
             logger.info(f"Job {job.id} done runtime_s={time.perf_counter() - run_started:.1f}")
+        except JobInterrupted as e:
+            _release_job(db, job)
+            logger.info(f"Job {job.id} released for resume runtime_s={time.perf_counter() - run_started:.1f}: {e}")
+        except JobDeferred as e:
+            _finish_job(db, job, 'deferred', error=str(e))
+            logger.info(f"Job {job.id} deferred runtime_s={time.perf_counter() - run_started:.1f}: {e}")
         except Exception as e:
-            job.status = 'failed'
-            job.error = str(e)[:2000]
-            job.completed_at = datetime.now()
-            db.commit()
+            _finish_job(db, job, 'failed', error=str(e)[:2000])
             logger.exception(f"Job {job.id} failed runtime_s={time.perf_counter() - run_started:.1f}: {e}")
+        if job.parent_id:
+            _settle_parent(db, job.parent_id)
     finally:
         db.close()
 
 # ─── Main Loop ────────────────────────────────────────────────────────────────
 
 def main():
+    global _job_signal
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
     logger.info("Worker starting...")
     if TRANSCRIBE_TIMING_LOG_ENABLED:
         logger.info(f"Transcribe timing log enabled path={TRANSCRIBE_TIMING_LOG_PATH}")
     else:
         logger.info("Transcribe timing log disabled")
 
-    # Reset any jobs that were left in 'processing' state (worker died mid-job)
+    # Jobs a dead worker left mid-flight come back once their lease lapses. Only expired
+    # leases: another replica may be running the rest, and this one just started.
     db = SessionLocal()
     try:
-        stuck_jobs = db.query(Job).filter(Job.status == 'processing').count()
-        if stuck_jobs:
-            db.query(Job).filter(Job.status == 'processing').update({'status': 'pending'})
-            db.commit()
-            logger.info(f"Reset {stuck_jobs} stuck job(s) to pending for retry")
-
-        # Keep transcript rows and re-queue them instead of deleting.
-        stuck_vt = db.query(VodTranscript).filter(VodTranscript.is_processing == True).count()
-        if stuck_vt:
-            db.query(VodTranscript).filter(VodTranscript.is_processing == True).update({
-                'status': 'queued',
-                'stage': 'queued',
-                'progress_pct': 0,
-                'started_at': None,
-                'error_message': '',
-            })
-            db.commit()
-            logger.info(f"Re-queued {stuck_vt} stuck VodTranscript row(s)")
+        reclaimed = _reclaim_expired_jobs(db)
+        logger.info(
+            f"Worker id={WORKER_ID} lease={JOB_LEASE_SECONDS}s max_attempts={JOB_MAX_ATTEMPTS}; "
+            f"reclaimed at startup: {reclaimed}"
+        )
     finally:
         db.close()
+    pruned = hls.prune_cache(hls.CACHE_DIR, HLS_CACHE_MAX_AGE_SECONDS)
+    if pruned:
+        logger.info(f"Pruned {pruned} stale HLS segment cache(s) from {hls.CACHE_DIR}")
 
     # Start scheduler
     sched = BackgroundScheduler()
     sched.add_job(check_notices_job, 'interval', minutes=5, args=[SessionLocal])
     sched.add_job(sync_dashboard_job, 'interval', minutes=60, args=[SessionLocal])
     sched.add_job(check_session_health_job, 'interval', minutes=30, args=[SessionLocal])
+    if TRANSCRIBE_TIMING_LOG_ENABLED and TRANSCRIBE_ETA_REFIT_MINUTES > 0:
+        # Once now, so a restarted worker does not leave the API on an hour-old fit.
+        sched.add_job(
+            _refit_eta_model, 'interval', minutes=TRANSCRIBE_ETA_REFIT_MINUTES, next_run_time=datetime.now(),
+        )
     sched.start()
     logger.info("Scheduler started (notices every 5min, sync every 60min, session health every 30min)")
 
-    logger.info(f"Polling for jobs (max concurrency={MAX_JOB_CONCURRENCY})...")
+    _job_signal = job_queue.JobSignal(SessionLocal.kw['bind']).start()
+    logger.info(
+        f"Waiting for jobs (max concurrency={MAX_JOB_CONCURRENCY}, "
+        f"{'LISTEN/NOTIFY' if _job_signal.postgres else 'polling'}, "
+        f"idle poll every {_job_signal.idle_timeout:.0f}s)..."
+    )
+    logger.info("Lanes: " + ", ".join(
+        f"{lane.name}(types={','.join(lane.types) if lane.types else 'other'} "
+        f"concurrency={lane.concurrency} reserved={lane.reserved})"
+        for lane in LANES
+    ))
     inflight = {}
+    running: dict[str, int] = {lane.name: 0 for lane in LANES}
+    waits: dict[str, list[float]] = {lane.name: [] for lane in LANES}
+    next_report = time.monotonic() + LANE_REPORT_SECONDS
+    next_heartbeat = time.monotonic() + JOB_HEARTBEAT_SECONDS
     with ThreadPoolExecutor(max_workers=MAX_JOB_CONCURRENCY) as pool:
         while not _shutdown or inflight:
             # Reap completed jobs first.
             done_futures = [f for f in inflight if f.done()]
             for fut in done_futures:
                 job_meta = inflight.pop(fut)
+                running[job_meta["lane"]] -= 1
                 try:
                     fut.result()
                 except Exception as e:
                     logger.error(f"Unhandled worker thread exception for job {job_meta['id']}: {e}")
 
-            if _shutdown:
-                time.sleep(0.2)
-                continue
-
-            claimed_any = False
-            # Fill available worker slots.
-            while len(inflight) < MAX_JOB_CONCURRENCY and not _shutdown:
+            # Heartbeat, shutdown included: a job draining after SIGTERM is still ours.
+            if time.monotonic() >= next_heartbeat:
                 db = SessionLocal()
                 try:
-                    job = _claim_job(db)
+                    ids = [meta["id"] for meta in inflight.values()]
+                    renewed = _renew_leases(db, ids)
+                    if renewed < len(ids):
+                        logger.warning(f"Renewed {renewed}/{len(ids)} leases; the rest were reclaimed elsewhere")
+                    if not _shutdown:
+                        _reclaim_expired_jobs(db)
                 except Exception as e:
-                    logger.error(f"Worker loop error while claiming job: {e}")
-                    job = None
+                    logger.error(f"Lease heartbeat failed: {e}")
                 finally:
                     db.close()
+                next_heartbeat = time.monotonic() + JOB_HEARTBEAT_SECONDS
 
-                if not job:
-                    break
-                claimed_any = True
-                fut = pool.submit(_process_job, job["id"])
-                inflight[fut] = job
-
-            if not claimed_any and not done_futures:
-                time.sleep(1)
+            if _shutdown:
+                _job_signal.wait(0.2)
+                continue
 
+            # Fill available slots, highest-priority lane first, each lane's free slots in
+            # one claim. A short batch means the lane's queue is drained.
+            for lane in LANES:
+                while not _shutdown and (free := _free_slots(lane, running)) > 0:
+                    db = SessionLocal()
+                    try:
+                        jobs = _claim_jobs(db, lane, free)
+                    except Exception as e:
+                        logger.error(f"Worker loop error while claiming jobs lane={lane.name}: {e}")
+                        jobs = []
+                    finally:
+                        db.close()
+
+                    for job in jobs:
+                        job["lane"] = lane.name
+                        running[lane.name] += 1
+                        if job["created_at"] and job["started_at"]:
+                            waits[lane.name].append((job["started_at"] - job["created_at"]).total_seconds())
+                        fut = pool.submit(_process_job, job["id"])
+                        # A finished job frees a slot, which is as much a reason to claim
+                        # again as a new job arriving.
+                        fut.add_done_callback(lambda _f: _job_signal.set())
+                        inflight[fut] = job
+                    if len(jobs) < free:
+                        break
+
+            if LANE_REPORT_SECONDS > 0 and time.monotonic() >= next_report:
+                # Nothing running and nothing started means nothing was claimable, i.e.
+                # the queue is empty; skip the query so an idle worker stays quiet.
+                if any(running.values()) or any(waits.values()):
+                    db = SessionLocal()
+                    try:
+                        logger.info(f"Lanes {_lane_report(db, running, waits)}")
+                    except Exception as e:
+                        logger.error(f"Lane report failed: {e}")
+                    finally:
+                        db.close()
+                waits = {lane.name: [] for lane in LANES}
+                next_report = time.monotonic() + LANE_REPORT_SECONDS
+
+            # Sleep until a job is enqueued, one finishes, or the idle poll comes round.
+            # Anything that happened while claiming has already set the signal, so this
+            # returns immediately rather than missing it.
+            wake_at = min(next_heartbeat, next_report) if LANE_REPORT_SECONDS > 0 else next_heartbeat
+            _job_signal.wait(min(_job_signal.idle_timeout, max(0.0, wake_at - time.monotonic())))
+
+    _job_signal.stop()
     logger.info("Shutting down scheduler...")
     sched.shutdown(wait=False)
     logger.info("Worker exited cleanly")